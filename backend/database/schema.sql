@@ -12,6 +12,6 @@ CREATE TABLE products (
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
-
+CREATE INDEX idx_products_created_at_article_id ON products (created_at, article_id);
 
 COMMENT ON TABLE products IS 'Stores product metadata and prepared descriptions for the multimodal search engine.';
\ No newline at end of file
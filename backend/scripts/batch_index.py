@@ -1,23 +1,69 @@
 import os
+import argparse
 import logging
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import islice
 import numpy as np
 import psycopg2
 from dotenv import load_dotenv
-from pinecone import Pinecone
 from elasticsearch import Elasticsearch
 from elasticsearch.helpers import bulk
 from tqdm.auto import tqdm
-from src.core.embedding import EmbeddingModel
+from src.core.embedding_store import EmbeddingStore
+from src.core.image_cache import ImageCache, fingerprint
+from src.core.cache import IndexVersion
+from src.core.metrics import COUNT_BUCKETS, MetricsRegistry
+from src.core.vector_store import LocalVectorDelta, LocalVectorStore, create_vector_store
+from scripts.indexing_pipeline import IndexingPipeline
+from scripts.index_state import IndexState, content_hash, embedding_hash
+from scripts.es_index import EsBulkLoader
+from scripts.shard_coordinator import ShardCoordinator
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logging.getLogger("elastic_transport").setLevel(logging.WARNING) 
 logger = logging.getLogger(__name__)
 
+ProductRecord = namedtuple("ProductRecord", [
+    "article_id", "prod_name", "cleaned_description", "image_path",
+    "product_group_name", "colour_group_name", "section_name", "created_at",
+])
+
 class BatchIndexer:
-    def __init__(self, batch_size=64):
+    def __init__(self, batch_size=64, fetch_size=2000, state_path="data/index_state.sqlite",
+                 store_root="data/embeddings", store_dtype="float32", inference_backend="torch", num_threads=None,
+                 embedder=None, metrics_path=None, image_cache_path=None,
+                 es_bulk_load=False, es_chunk_size=500, es_workers=4, es_replicas=None, es_keep_previous=False,
+                 shard=None, es_index=None, on_batch=None):
         load_dotenv()
         self.batch_size = batch_size
-        self.embedder = EmbeddingModel()
+        self.fetch_size = fetch_size
+        # Anything with EmbeddingModel's batch interface works, e.g. the benchmark's TinyEmbedder
+        if embedder is None:
+            # Imported here so the benchmark's torch-free harness can drive the indexer
+            from src.core.embedding import EmbeddingModel
+            embedder = EmbeddingModel(backend=inference_backend, num_threads=num_threads)
+        self.embedder = embedder
+        self.state = IndexState(state_path)
+        self.store = None
+        if store_root:
+            self.store = EmbeddingStore(store_root, self.embedder.variant, self.embedder.dimension, dtype=store_dtype)
+        self.es_bulk_load = es_bulk_load
+        self.es_bulk_options = {"chunk_size": es_chunk_size, "workers": es_workers,
+                                "replicas": es_replicas, "keep_previous": es_keep_previous}
+        self.es_loader = None
+        # Set by ShardCoordinator: this process only indexes shard (index, count) of the catalog,
+        # may attach to a bulk-load index the coordinator created, and reports each batch
+        self.shard = shard
+        self.es_index = es_index
+        self.on_batch = on_batch
+        self.image_cache = self._open_image_cache(image_cache_path or os.getenv("IMAGE_CACHE_PATH"))
+        self._deferred_commits = []
+        self._deferred_removals = []
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self.metrics = MetricsRegistry(prefix="indexer_")
+        self.metrics_path = metrics_path or os.getenv("INDEXER_METRICS_PATH") or None
         self._init_db_clients()
 
     def _init_db_clients(self):
@@ -30,66 +76,413 @@ class BatchIndexer:
                 password=os.getenv("DB_PASSWORD")
             )
             self.es_client = Elasticsearch(os.getenv("ES_HOST", "http://localhost:9200"))
-            pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-            self.pinecone_index = pc.Index("multimodal-search")
+            self.vector_store = create_vector_store()
+            if self.shard is not None and isinstance(self.vector_store, LocalVectorStore):
+                # Shards can't all rewrite the same files; each saves a delta the coordinator merges
+                self.vector_store = LocalVectorDelta.for_shard(self.vector_store, *self.shard)
             logger.info("All database and index clients initialized successfully.")
         except Exception as e:
             logger.error(f"Failed to initialize clients: {e}")
             raise
 
-    def _fetch_products_from_db(self):
-        logger.info("Fetching product data from PostgreSQL...")
+    def _open_image_cache(self, path):
+        if not path:
+            return None
+        # The cache only helps if it holds exactly what the vision tower takes
+        size = getattr(self.embedder, "image_size", 224)
+        try:
+            return ImageCache(path, size=size, readonly=True)
+        except (FileNotFoundError, ValueError) as e:
+            logger.warning(f"Not using the image cache: {e} Images will be decoded from their JPEGs.")
+            return None
+
+    @contextmanager
+    def _stage(self, name):
+        """Times a stage into indexer_stage_seconds and counts its failures before re-raising."""
+        try:
+            with self.metrics.timer("stage_seconds", stage=name):
+                yield
+        except Exception:
+            self.metrics.inc("errors_total", stage=name)
+            raise
+
+    def _shard_filter(self, prefix):
+        if self.shard is None:
+            return "", ()
+        # md5 rather than hashtext(): shard membership has to stay put across PostgreSQL
+        # upgrades, since each shard keeps its own index state
+        return (f"{prefix} mod(('x' || substr(md5(article_id), 1, 8))::bit(32)::bigint, %s) = %s",
+                (self.shard[1], self.shard[0]))
+
+    def _count_products(self):
+        where, params = self._shard_filter("WHERE")
         with self.pg_conn.cursor() as cursor:
-            cursor.execute("SELECT article_id, prod_name, cleaned_description, image_path, product_group_name, colour_group_name, section_name FROM products")
-            products = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
-        logger.info(f"Fetched {len(products)} products.")
-        return [dict(zip(columns, row)) for row in products]
-
-    def run(self):
-        products = self._fetch_products_from_db()
-
-        for i in tqdm(range(0, len(products), self.batch_size), desc="Indexing Batches"):
-            batch = products[i:i + self.batch_size]
-            es_actions = []
-            pinecone_vectors = []
-
-            for product in batch:
-                text_emb = self.embedder.embed_text(product['cleaned_description'])
-                image_emb = self.embedder.embed_image(product['image_path'])
-
-                if text_emb is None or image_emb is None:
-                    logger.warning(f"Skipping article_id {product['article_id']} due to missing embedding.")
-                    continue
-
-                combined_emb = np.mean([text_emb, image_emb], axis=0).tolist()
-
-                es_actions.append({
-                    "_index": "products_metadata",
-                    "_id": product['article_id'],
-                    "_source": {
-                        "article_id": product['article_id'],
-                        "prod_name": product['prod_name'],
-                        "product_group_name": product['product_group_name'],
-                        "colour_group_name": product['colour_group_name'],
-                        "section_name": product['section_name'],
-                    }
-                })
-
-                pinecone_vectors.append({
-                    "id": product['article_id'],
-                    "values": combined_emb
-                })
-
-            if es_actions:
+            cursor.execute(f"SELECT COUNT(*) FROM products {where}", params or None)
+            return cursor.fetchone()[0]
+
+    def _iter_products_from_db(self, after=None):
+        # A named cursor keeps the result set on the server and pulls `fetch_size` rows per round trip
+        logger.info(f"Streaming product data from PostgreSQL (fetch size {self.fetch_size})...")
+        where, params = "", ()
+        if after is not None:
+            where, params = "WHERE (created_at, article_id) > (%s::timestamptz, %s)", tuple(after)
+        shard_where, shard_params = self._shard_filter("AND" if where else "WHERE")
+        where, params = f"{where} {shard_where}".strip(), params + shard_params
+        with self.pg_conn.cursor(name="batch_index_products") as cursor:
+            cursor.itersize = self.fetch_size
+            cursor.execute(
+                f"SELECT {', '.join(ProductRecord._fields)} FROM products {where} ORDER BY created_at, article_id",
+                params or None,
+            )
+            for row in cursor:
+                yield ProductRecord(*row)
+
+    def _iter_live_ids(self):
+        with self.pg_conn.cursor(name="batch_index_live_ids") as cursor:
+            cursor.itersize = self.fetch_size
+            where, params = self._shard_filter("WHERE")
+            cursor.execute(f"SELECT article_id FROM products {where}", params or None)
+            for (article_id,) in cursor:
+                yield article_id
+
+    def _iter_changed(self, products):
+        unchanged = 0
+        for product in products:
+            if self.state.get_hash(product.article_id) == content_hash(product, self.embedder.variant):
+                unchanged += 1
+                continue
+            yield product
+        logger.info(f"Skipped {unchanged} unchanged products.")
+
+    def _versions(self, batch):
+        # Embedding store versions; the index state keeps the broader content_hash. Each one
+        # stats the image file, so a batch computes them once and hands them to every step
+        if self.store is None:
+            return None
+        return [embedding_hash(p, self.embedder.variant) for p in batch]
+
+    def _cached(self, batch, versions):
+        if self.store is None:
+            return np.zeros(len(batch), dtype=bool)
+        return self.store.rows([p.article_id for p in batch], versions) >= 0
+
+    def _decode_images(self, batch, versions):
+        # Cached articles never reach the model, so don't pay for their JPEG decode either
+        with self._stage("decode"):
+            images = [None] * len(batch)
+            todo = [i for i, (p, hit) in enumerate(zip(batch, self._cached(batch, versions))) if not hit and p.image_path]
+            if self.image_cache is not None and todo:
+                # Preprocessed pixels of an unchanged JPEG go to the model as is
+                pixels, hits = self.image_cache.get([batch[i].article_id for i in todo],
+                                                    [fingerprint(batch[i].image_path) for i in todo])
+                for j in np.flatnonzero(hits):
+                    images[todo[j]] = pixels[j]
+                self.metrics.inc("image_cache_total", int(hits.sum()), result="hit")
+                self.metrics.inc("image_cache_total", int((~hits).sum()), result="miss")
+                todo = [i for i, hit in zip(todo, hits) if not hit]
+            for i in todo:
+                images[i] = self.embedder.load_image(batch[i].image_path)
+            return images
+
+    def _embed_batch(self, batch, images=None, versions=None):
+        if images is None:
+            versions = self._versions(batch)
+            images = self._decode_images(batch, versions)
+        with self._stage("embed"):
+            indexed, combined = self._embed_decoded(batch, images, versions)
+        self.metrics.inc("items_total", len(indexed), result="indexed")
+        self.metrics.inc("items_total", len(batch) - len(indexed), result="skipped")
+        self.metrics.observe("batch_items", len(indexed), buckets=COUNT_BUCKETS)
+        return indexed, combined
+
+    def _embed_decoded(self, batch, images, versions):
+        if self.store is not None:
+            text_embs, image_embs, hits = self.store.get([p.article_id for p in batch], versions)
+        else:
+            text_embs = np.zeros((len(batch), self.embedder.dimension), dtype=np.float32)
+            image_embs = np.zeros_like(text_embs)
+            hits = np.zeros(len(batch), dtype=bool)
+        text_mask, image_mask = hits.copy(), hits.copy()
+
+        misses = np.flatnonzero(~hits)
+        self._cache_hits += int(hits.sum())
+        self._cache_misses += len(misses)
+        self.metrics.inc("embedding_store_total", int(hits.sum()), result="hit")
+        self.metrics.inc("embedding_store_total", len(misses), result="miss")
+        if len(misses):
+            text_embs[misses], text_mask[misses] = self.embedder.embed_texts([batch[i].cleaned_description for i in misses])
+            image_embs[misses], image_mask[misses] = self.embedder.embed_loaded_images([images[i] for i in misses])
+            if self.store is not None:
+                fresh = misses[text_mask[misses] & image_mask[misses]]
+                self.store.put([batch[i].article_id for i in fresh], text_embs[fresh], image_embs[fresh], [versions[i] for i in fresh])
+
+        valid = text_mask & image_mask
+
+        for product in (p for p, ok in zip(batch, valid) if not ok):
+            logger.warning(f"Skipping article_id {product.article_id} due to missing embedding.")
+
+        combined = (text_embs[valid] + image_embs[valid]) / 2
+        return [p for p, ok in zip(batch, valid) if ok], combined
+
+    def _build_writes(self, products, combined_embs):
+        es_actions = []
+        vector_records = []
+        for product, combined_emb in zip(products, combined_embs):
+            es_actions.append({
+                "_index": "products_metadata",
+                "_id": product.article_id,
+                "_source": {
+                    "article_id": product.article_id,
+                    "prod_name": product.prod_name,
+                    "product_group_name": product.product_group_name,
+                    "colour_group_name": product.colour_group_name,
+                    "section_name": product.section_name,
+                }
+            })
+
+            # Facet fields ride along so the vector search can filter on them too
+            vector_records.append({
+                "id": product.article_id,
+                "values": combined_emb,
+                "metadata": {
+                    field: value for field, value in (
+                        ("product_group_name", product.product_group_name),
+                        ("colour_group_name", product.colour_group_name),
+                        ("section_name", product.section_name),
+                    ) if value
+                },
+            })
+        return es_actions, vector_records
+
+    def _write_es(self, es_actions):
+        with self._stage("es"):
+            if self.es_loader is not None:
+                self.es_loader.write(es_actions)
+            else:
                 bulk(self.es_client, es_actions)
-            if pinecone_vectors:
-                self.pinecone_index.upsert(vectors=pinecone_vectors)
 
+    def _write_vectors(self, vector_records):
+        with self._stage("vectors"):
+            self.vector_store.upsert(vector_records)
+
+    def _delete_es(self, article_ids):
+        # Missing documents come back as 404s, which are fine to ignore here
+        actions = ({"_op_type": "delete", "_index": "products_metadata", "_id": aid} for aid in article_ids)
+        with self._stage("es_delete"):
+            bulk(self.es_client, actions, raise_on_error=False)
+
+    def _delete_vectors(self, article_ids):
+        with self._stage("vectors_delete"):
+            self.vector_store.delete(list(article_ids))
+
+    def _commit_batch(self, batch, indexed):
+        last = batch[-1]
+        commit = (
+            [(p.article_id, content_hash(p, self.embedder.variant)) for p in indexed],
+            (last.created_at, last.article_id),
+        )
+        # A local store only persists on save(), and a bulk-loaded ES index only counts once the
+        # alias points at it, so neither can checkpoint batches before the end of the run
+        if self.vector_store.durable_writes and self.es_loader is None:
+            self.state.commit_batch(*commit)
+        else:
+            self._deferred_commits.append(commit)
+        if self.on_batch is not None:
+            self.on_batch(len(batch), len(indexed))
+
+    def _delete_removed(self):
+        removed = self.state.find_removed(self._iter_live_ids())
+        logger.info(f"Removing {len(removed)} articles that no longer exist in PostgreSQL.")
+        for i in range(0, len(removed), self.batch_size):
+            chunk = removed[i:i + self.batch_size]
+            self._delete_es(chunk)
+            self._delete_vectors(chunk)
+            if self.vector_store.durable_writes:
+                self.state.remove(chunk)
+            else:
+                self._deferred_removals.extend(chunk)
+
+    def _iter_batches(self, products):
+        while True:
+            batch = list(islice(products, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def run(self, pipeline=False, decode_workers=4, queue_size=4, incremental=False):
+        resume_from = None
+        if incremental:
+            if self.state.run_in_progress():
+                resume_from = self.state.checkpoint()
+                if resume_from is not None:
+                    logger.info(f"Resuming interrupted run after article_id {resume_from[1]}.")
+            self.state.begin_run()
+            products = self._iter_changed(self._iter_products_from_db(after=resume_from))
+            total_batches = None
+        else:
+            self.state.begin_run(reset=True)
+            products = self._iter_products_from_db()
+            total_batches = -(-self._count_products() // self.batch_size)
+
+        if self.es_index is not None:
+            self.es_loader = EsBulkLoader(self.es_client, index=self.es_index, **self.es_bulk_options)
+            self.es_loader.start()
+        elif self.es_bulk_load and incremental:
+            logger.warning("ES bulk-load mode only applies to full rebuilds; this incremental run writes through the alias.")
+        elif self.es_bulk_load:
+            self.es_loader = EsBulkLoader(self.es_client, **self.es_bulk_options)
+            self.es_loader.begin()
+
+        try:
+            if pipeline:
+                IndexingPipeline(self, decode_workers=decode_workers, queue_size=queue_size, on_commit=self._commit_batch).run(
+                    self._iter_batches(products), total=total_batches
+                )
+            else:
+                for batch in tqdm(self._iter_batches(products), total=total_batches, desc="Indexing Batches",
+                                  disable=self.shard is not None):
+                    indexed, combined = self._embed_batch(batch)
+                    es_actions, vector_records = self._build_writes(indexed, combined)
+
+                    if es_actions:
+                        self._write_es(es_actions)
+                    if vector_records:
+                        self._write_vectors(vector_records)
+                    self._commit_batch(batch, indexed)
+
+            if incremental:
+                self._delete_removed()
+            with self._stage("save"):
+                self.vector_store.save()
+            if self.es_loader is not None:
+                with self._stage("es_finalize"):
+                    # A shard only flushes its documents; the coordinator swaps the alias once all are in
+                    if self.es_index is not None:
+                        self.es_loader.close()
+                    else:
+                        self.es_loader.finish()
+        except BaseException:
+            # Searches stay on the previous index; only the half-built one is dropped
+            if self.es_loader is not None:
+                self.es_loader.abort()
+            raise
+        if self.shard is not None:
+            # Nothing this shard wrote is live until the coordinator has merged every shard and
+            # swapped the alias, so it only stages its results and applies them after that
+            self.state.stage_pending([entry for indexed, _ in self._deferred_commits for entry in indexed],
+                                     self._deferred_removals)
+        else:
+            for commit in self._deferred_commits:
+                self.state.commit_batch(*commit)
+            self.state.remove(self._deferred_removals)
+            self.state.finish_run()
+            version = IndexVersion(os.getenv("INDEX_VERSION_PATH", "data/index_version")).publish()
+            logger.info(f"Published index version {version}.")
+            if isinstance(self.vector_store, LocalVectorStore):
+                logger.info(f"Local vector store search report: {self.vector_store.evaluate()}")
+
+        if self.store is not None:
+            logger.info(f"Embedding store: {self._cache_hits} hits, {self._cache_misses} misses.")
+            self.store.close()
+        if self.image_cache is not None:
+            hits = int(self.metrics.counter_value("image_cache_total", result="hit"))
+            misses = int(self.metrics.counter_value("image_cache_total", result="miss"))
+            logger.info(f"Image cache: {hits} hits, {misses} misses.")
+            self.image_cache.close()
+        self._report_metrics()
         logger.info("Batch indexing pipeline completed successfully.")
+        self.state.close()
         self.pg_conn.close()
 
 
+    def _report_metrics(self):
+        logger.info("Indexer stage timings:")
+        for labels, histogram in sorted(self.metrics.series("stage_seconds"), key=lambda entry: -entry[1].sum):
+            errors = int(self.metrics.counter_value("errors_total", **labels))
+            logger.info(f"{labels['stage']:<15} calls={histogram.count:<8} total={histogram.sum:8.2f}s "
+                        f"mean={histogram.sum / histogram.count * 1000:8.1f}ms errors={errors}")
+        if self.metrics_path:
+            # Prometheus text format, e.g. for node_exporter's textfile collector
+            os.makedirs(os.path.dirname(self.metrics_path) or ".", exist_ok=True)
+            with open(f"{self.metrics_path}.tmp", "w") as f:
+                f.write(self.metrics.render())
+            os.replace(f"{self.metrics_path}.tmp", self.metrics_path)
+            logger.info(f"Wrote indexer metrics to {self.metrics_path}")
+
+
+def parse_args():
+    from src.core.inference import BACKENDS
+    parser = argparse.ArgumentParser(description="Embed the products table and index it into the vector store and Elasticsearch.")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="Products per CLIP forward pass and per bulk write (default: 64).")
+    parser.add_argument("--fetch-size", type=int, default=2000,
+                        help="Rows pulled per round trip from the server-side catalog cursor (default: 2000).")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-index new or changed articles, delete removed ones and resume interrupted runs.")
+    parser.add_argument("--state-path", default="data/index_state.sqlite",
+                        help="SQLite file tracking indexed content hashes and the resume checkpoint.")
+    parser.add_argument("--embedding-store", default="data/embeddings",
+                        help="Directory of the local memory-mapped embedding cache (default: data/embeddings).")
+    parser.add_argument("--no-embedding-store", action="store_true",
+                        help="Always run CLIP and don't read or write the local embedding cache.")
+    parser.add_argument("--store-dtype", choices=["float32", "float16"], default="float32",
+                        help="Precision of vectors kept in the embedding cache (default: float32).")
+    parser.add_argument("--inference-backend", choices=BACKENDS, default="torch",
+                        help="CLIP runtime: fp32 torch (default), dynamic int8, torchscript or onnx.")
+    parser.add_argument("--num-threads", type=int, default=None,
+                        help="PyTorch/ONNX Runtime intra-op threads (default: library default).")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Overlap image decoding, embedding and sink writes using bounded queues.")
+    parser.add_argument("--decode-workers", type=int, default=4,
+                        help="Threads decoding JPEGs in pipeline mode (default: 4).")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="Max batches buffered between pipeline stages (default: 4).")
+    parser.add_argument("--es-bulk-load", action="store_true",
+                        help="Full rebuilds only: load a new, explicitly mapped ES index with refresh and replicas off, "
+                             "force-merge it and swap the products_metadata alias to it at the end.")
+    parser.add_argument("--es-chunk-size", type=int, default=500,
+                        help="Documents per bulk request in bulk-load mode (default: 500).")
+    parser.add_argument("--es-workers", type=int, default=4,
+                        help="Concurrent bulk requests in bulk-load mode (default: 4).")
+    parser.add_argument("--es-replicas", type=int, default=None,
+                        help="Replicas once the load is done (default: same as the index being replaced, else 1, or 0 on a single-node cluster).")
+    parser.add_argument("--es-keep-previous", action="store_true",
+                        help="Keep the index the alias pointed to before, e.g. for a quick rollback.")
+    parser.add_argument("--image-cache", default=None,
+                        help="Packed cache of preprocessed images written by prepare_hm_data --image-cache (default: IMAGE_CACHE_PATH).")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Index with this many processes, each owning a hash partition of article_ids (default: 1). "
+                             "Incremental runs must use the same count as the run before.")
+    parser.add_argument("--threads-per-shard", type=int, default=None,
+                        help="Intra-op threads (and pinned cores) per shard process (default: CPU count / shards).")
+    parser.add_argument("--shard-retries", type=int, default=2,
+                        help="Times a failed shard is restarted before the run is abandoned (default: 2).")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Write per-stage timings and counters here in Prometheus text format (default: INDEXER_METRICS_PATH).")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    indexer = BatchIndexer()
-    indexer.run()
\ No newline at end of file
+    args = parse_args()
+    indexer_kwargs = dict(
+        batch_size=args.batch_size,
+        fetch_size=args.fetch_size,
+        state_path=args.state_path,
+        store_root=None if args.no_embedding_store else args.embedding_store,
+        store_dtype=args.store_dtype,
+        inference_backend=args.inference_backend,
+        num_threads=args.num_threads,
+        metrics_path=args.metrics_file,
+        image_cache_path=args.image_cache,
+        es_bulk_load=args.es_bulk_load,
+        es_chunk_size=args.es_chunk_size,
+        es_workers=args.es_workers,
+        es_replicas=args.es_replicas,
+        es_keep_previous=args.es_keep_previous,
+    )
+    run_kwargs = dict(pipeline=args.pipeline, decode_workers=args.decode_workers, queue_size=args.queue_size, incremental=args.incremental)
+    if args.shards > 1:
+        ShardCoordinator(args.shards, indexer_kwargs, threads_per_shard=args.threads_per_shard,
+                         max_retries=args.shard_retries, metrics_path=args.metrics_file).run(**run_kwargs)
+    else:
+        BatchIndexer(**indexer_kwargs).run(**run_kwargs)
@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import platform
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from scripts.synthetic_catalog import generate_catalog, load_catalog, COLOURS, GARMENTS, FITS
+from scripts.benchmark_fakes import FakeElasticsearch, FakePostgres, LatencyVectorStore, Latency, TinyEmbedder
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+MODES = ("text", "image", "hybrid")
+
+
+def percentiles(latencies_ms: List[float]) -> Dict[str, float]:
+    if not latencies_ms:
+        return {"p50_ms": float("nan"), "p95_ms": float("nan"), "p99_ms": float("nan"), "mean_ms": float("nan")}
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "mean_ms": float(np.mean(latencies_ms))}
+
+
+def catalog_rows(df: pd.DataFrame) -> List[Dict]:
+    """Catalog rows as the products table would return them, with increasing created_at values."""
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = df.to_dict("records")
+    for i, row in enumerate(rows):
+        row["created_at"] = (start + timedelta(seconds=i)).isoformat()
+    return rows
+
+
+class Backends:
+    """One set of fakes shared by the indexer run and the API run, so searches hit what was indexed."""
+
+    def __init__(self, rows: List[Dict], workdir: str, args):
+        from src.core.vector_store import LocalVectorStore
+        self.pg = FakePostgres(rows, Latency(args.pg_latency_ms, args.jitter_ms, seed=1))
+        self.es = FakeElasticsearch(Latency(args.es_latency_ms, args.jitter_ms, seed=2))
+        self.vectors = LatencyVectorStore(
+            LocalVectorStore(os.path.join(workdir, "vector_store"), compression=args.compression),
+            Latency(args.vector_latency_ms, args.jitter_ms, seed=3),
+        )
+
+
+def make_embedder(args):
+    if args.embedder == "tiny":
+        return TinyEmbedder(ms_per_item=args.embed_ms_per_item)
+    from src.core.embedding import EmbeddingModel
+    return EmbeddingModel(backend=args.inference_backend)
+
+
+def benchmark_indexer(backends: Backends, embedder, workdir: str, args) -> Dict:
+    from scripts.batch_index import BatchIndexer
+
+    class FakeBackendIndexer(BatchIndexer):
+        def _init_db_clients(self):
+            self.pg_conn = backends.pg.connect()
+            self.es_client = backends.es
+            self.vector_store = backends.vectors
+
+        def _write_es(self, es_actions):
+            with self._stage("es"):
+                self.es_client.index_actions(es_actions)
+
+        def _delete_es(self, article_ids):
+            with self._stage("es_delete"):
+                self.es_client.index_actions({"_op_type": "delete", "_id": aid} for aid in article_ids)
+
+    indexer = FakeBackendIndexer(
+        batch_size=args.batch_size,
+        state_path=os.path.join(workdir, "index_state.sqlite"),
+        store_root=None,
+        embedder=embedder,
+        image_cache_path=args.image_cache,
+    )
+    start = time.perf_counter()
+    indexer.run(pipeline=args.pipeline, decode_workers=args.decode_workers)
+    elapsed = time.perf_counter() - start
+    items = len(backends.pg.rows)
+    logger.info(f"Indexed {items} products in {elapsed:.2f}s ({items / elapsed:.1f} items/s).")
+    stages = {labels["stage"]: {"calls": h.count, "seconds": h.sum} for labels, h in indexer.metrics.series("stage_seconds")}
+    return {"items": items, "seconds": elapsed, "items_per_sec": items / elapsed,
+            "pipeline": args.pipeline, "batch_size": args.batch_size, "image_cache": args.image_cache, "stages": stages}
+
+
+def make_queries(df: pd.DataFrame, n: int, seed: int = 0) -> List[Dict]:
+    rng = random.Random(seed)
+    image_paths = df["image_path"].tolist()
+    queries = []
+    for _ in range(n):
+        text = f"{rng.choice(list(COLOURS))} {rng.choice(FITS)} {rng.choice(rng.choice(list(GARMENTS.values())))}"
+        queries.append({"text": text, "image_path": rng.choice(image_paths)})
+    return queries
+
+
+async def run_level(client, mode: str, concurrency: int, queries: List[Dict], images: Dict[str, bytes]) -> Dict:
+    latencies, errors = [], 0
+    pending = iter(queries)
+
+    async def worker():
+        nonlocal errors
+        for query in pending:
+            data = {"top_k": "10"}
+            files = None
+            if mode in ("text", "hybrid"):
+                data["text_query"] = query["text"]
+            if mode in ("image", "hybrid"):
+                files = {"image_query": ("query.jpg", images[query["image_path"]], "image/jpeg")}
+            start = time.perf_counter()
+            response = await client.post("/search/", data=data, files=files)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {"mode": mode, "concurrency": concurrency, "requests": len(latencies), "errors": errors,
+            "qps": len(latencies) / elapsed, **percentiles(latencies)}
+
+
+async def benchmark_search(backends: Backends, embedder, df: pd.DataFrame, args) -> Tuple[List[Dict], Dict]:
+    import httpx
+    from src.api import main
+
+    def connect_fakes():
+        main.vector_store, main.es_client, main.pg_pool = backends.vectors, backends.es, backends.pg
+
+    # The lifespan builds everything through these two hooks, so the real startup path runs against the fakes
+    main.load_embedder = lambda: embedder
+    main.connect_backends = connect_fakes
+    if not args.with_caches:
+        for cache in (main.embedding_cache, main.result_cache, main.product_cache):
+            cache.maxsize = 0
+
+    queries = make_queries(df, args.requests, seed=args.seed)
+    images = {}
+    for query in queries:
+        if query["image_path"] not in images:
+            with open(query["image_path"], "rb") as f:
+                images[query["image_path"]] = f.read()
+
+    results = []
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            await main.wait_until_started()
+            for mode in args.modes:
+                # Warm-up requests are not measured
+                await run_level(client, mode, 1, queries[:min(5, len(queries))], images)
+                for concurrency in args.concurrency:
+                    level = await run_level(client, mode, concurrency, queries, images)
+                    logger.info(f"{mode} @ {concurrency}: {level['qps']:.1f} QPS, p50 {level['p50_ms']:.1f}ms, "
+                                f"p95 {level['p95_ms']:.1f}ms, p99 {level['p99_ms']:.1f}ms, {level['errors']} errors")
+                    results.append(level)
+            # Cold start covers the model load, backend connections and warmup; the first query is the first warm-up request
+            api_stats = {"embedding_batcher": main.embedding_batcher.stats(), "startup": dict(main.startup_timings)}
+            logger.info(f"API startup timings: {main.startup_timings}")
+    return results, api_stats
+
+
+def compare(report: Dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {(r["mode"], r["concurrency"]): r for r in baseline.get("search", [])}
+    rows = []
+    for r in report.get("search", []):
+        b = before.get((r["mode"], r["concurrency"]))
+        if b:
+            rows.append({"mode": r["mode"], "concurrency": r["concurrency"],
+                         "qps_change_%": (r["qps"] / b["qps"] - 1) * 100,
+                         "p95_change_%": (r["p95_ms"] / b["p95_ms"] - 1) * 100,
+                         "p99_change_%": (r["p99_ms"] / b["p99_ms"] - 1) * 100})
+    if "indexer" in report and "indexer" in baseline:
+        rows.append({"mode": "indexer", "concurrency": None,
+                     "qps_change_%": (report["indexer"]["items_per_sec"] / baseline["indexer"]["items_per_sec"] - 1) * 100})
+    print(f"\nChange against {baseline_path} (positive QPS and negative latency changes are improvements):")
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda v: f"{v:+.1f}"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark /search/ and BatchIndexer against in-process stand-ins for every backend.")
+    parser.add_argument("--catalog-size", type=int, default=2000, help="Synthetic products to generate (default: 2000).")
+    parser.add_argument("--catalog-dir", default=None,
+                        help="Reuse or create a synthetic catalog here instead of a temporary directory.")
+    parser.add_argument("--image-size", type=int, default=256)
+    parser.add_argument("--embedder", choices=["tiny", "clip"], default="tiny",
+                        help="Deterministic hashing embedder (default) or the real CLIP model.")
+    parser.add_argument("--embed-ms-per-item", type=float, default=0.0,
+                        help="Simulated inference time per item for the tiny embedder.")
+    parser.add_argument("--inference-backend", default="torch", help="CLIP runtime when --embedder clip.")
+    parser.add_argument("--vector-latency-ms", type=float, default=2.0)
+    parser.add_argument("--es-latency-ms", type=float, default=3.0)
+    parser.add_argument("--pg-latency-ms", type=float, default=1.0)
+    parser.add_argument("--jitter-ms", type=float, default=1.0, help="Uniform extra latency added to every backend call.")
+    parser.add_argument("--compression", default=None, help="Local vector store compression (int8, pq).")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per mode and concurrency level.")
+    parser.add_argument("--with-caches", action="store_true",
+                        help="Keep the API's embedding, result and product caches on (off by default so every request does the full work).")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--pipeline", action="store_true", help="Index with the pipelined BatchIndexer.")
+    parser.add_argument("--decode-workers", type=int, default=4)
+    parser.add_argument("--image-cache", default=None,
+                        help="Feed the indexer preprocessed images from this cache (build it with prepare_hm_data --image-cache).")
+    parser.add_argument("--skip-indexer", action="store_true",
+                        help="Leave indexer throughput out of the report (the catalog is still indexed so searches have data).")
+    parser.add_argument("--skip-search", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the JSON report here.")
+    parser.add_argument("--baseline", default=None, help="A previous JSON report to compare against.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as workdir:
+        catalog_dir = args.catalog_dir or os.path.join(workdir, "catalog")
+        csv_path = os.path.join(catalog_dir, "prepared_hm_products.csv")
+        if not os.path.exists(csv_path):
+            generate_catalog(catalog_dir, args.catalog_size, image_size=args.image_size, seed=args.seed)
+        df = load_catalog(csv_path)
+
+        # Keep the API's index-version marker inside the scratch directory
+        os.environ["INDEX_VERSION_PATH"] = os.path.join(workdir, "index_version")
+        backends = Backends(catalog_rows(df), workdir, args)
+        embedder = make_embedder(args)
+
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "environment": {"python": sys.version.split()[0], "platform": platform.platform(), "cpus": os.cpu_count()},
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+            "catalog_size": len(df),
+        }
+        # Searches need an index, so the indexer always runs; --skip-indexer only drops it from the report
+        indexer_report = benchmark_indexer(backends, embedder, workdir, args)
+        if not args.skip_indexer:
+            report["indexer"] = indexer_report
+        if not args.skip_search:
+            report["search"], report["api"] = asyncio.run(benchmark_search(backends, embedder, df, args))
+
+    if "search" in report:
+        print("\nSearch latency (ms) and throughput:")
+        print(pd.DataFrame(report["search"]).to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    if "indexer" in report:
+        print(f"\nIndexer: {report['indexer']['items']} items in {report['indexer']['seconds']:.2f}s "
+              f"({report['indexer']['items_per_sec']:.1f} items/s)")
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Wrote benchmark report to {args.output}")
+    if args.baseline:
+        compare(report, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
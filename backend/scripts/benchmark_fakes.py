@@ -0,0 +1,342 @@
+import re
+import time
+import random
+import hashlib
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+import numpy as np
+from PIL import Image
+from src.core.vector_store import VectorStore
+
+
+class Latency:
+    """Sleeps for `ms` milliseconds, plus up to `jitter_ms` of uniform noise, to stand in for a network hop."""
+
+    def __init__(self, ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 0):
+        self.ms = ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        if self.ms <= 0 and self.jitter_ms <= 0:
+            return
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms)
+        time.sleep((self.ms + jitter) / 1000)
+
+
+class TinyEmbedder:
+    """Deterministic stand-in for EmbeddingModel with the same batch interface and no model weights.
+
+    Text is feature-hashed token by token, and images are downsampled to 8x8 and projected
+    with a fixed random matrix. Similar inputs therefore get similar vectors. `ms_per_item`
+    adds simulated inference time per encoded item.
+    """
+
+    def __init__(self, dimension: int = 512, ms_per_item: float = 0.0, seed: int = 0):
+        self.model_name = "tiny-hashing"
+        self.variant = self.model_name
+        self.backend = "numpy"
+        self._dimension = dimension
+        self.ms_per_item = ms_per_item
+        self.warm = False
+        self.load_seconds = 0.0
+        self._projection = np.random.default_rng(seed).normal(size=(8 * 8 * 3, dimension)).astype(np.float32)
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    def warmup(self, batch_sizes=(1, 8)):
+        self.warm = True
+
+    def _simulate(self, n: int):
+        if self.ms_per_item > 0:
+            time.sleep(n * self.ms_per_item / 1000)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _text_vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self._dimension, dtype=np.float32)
+        for token in text.lower().split():
+            digest = hashlib.md5(token.encode()).digest()
+            index = int.from_bytes(digest[:4], "little") % self._dimension
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+    def embed_texts(self, texts: List[str], batch_size: int = 32):
+        mask = np.array([bool(t and t.strip()) for t in texts], dtype=bool)
+        vectors = np.zeros((len(texts), self._dimension), dtype=np.float32)
+        for i in np.flatnonzero(mask):
+            vectors[i] = self._text_vector(texts[i])
+        self._simulate(int(mask.sum()))
+        return self._normalize(vectors), mask
+
+    @staticmethod
+    def load_image(image_source) -> Optional[Image.Image]:
+        try:
+            if isinstance(image_source, Image.Image):
+                return image_source.convert("RGB")
+            with Image.open(image_source) as image:
+                return image.convert("RGB")
+        except Exception:
+            return None
+
+    def embed_loaded_images(self, images: List, batch_size: int = 32):
+        mask = np.array([image is not None for image in images], dtype=bool)
+        vectors = np.zeros((len(images), self._dimension), dtype=np.float32)
+        for i in np.flatnonzero(mask):
+            # Cached images arrive as preprocessed uint8 arrays rather than PIL images
+            image = Image.fromarray(images[i]) if isinstance(images[i], np.ndarray) else images[i]
+            pixels = np.asarray(image.resize((8, 8)), dtype=np.float32).reshape(-1) / 255.0 - 0.5
+            vectors[i] = pixels @ self._projection
+        self._simulate(int(mask.sum()))
+        return self._normalize(vectors), mask
+
+    def embed_images(self, image_sources: List, batch_size: int = 32):
+        return self.embed_loaded_images([self.load_image(source) for source in image_sources], batch_size)
+
+
+class LatencyVectorStore(VectorStore):
+    """Wraps a real VectorStore (usually a LocalVectorStore) and adds latency to every call."""
+
+    def __init__(self, inner: VectorStore, latency: Latency):
+        self.inner = inner
+        self.latency = latency
+        self.durable_writes = inner.durable_writes
+
+    def upsert(self, records: List[Dict]):
+        self.latency()
+        self.inner.upsert(records)
+
+    def delete(self, ids: List[str]):
+        self.latency()
+        self.inner.delete(ids)
+
+    def query(self, vector, top_k: int = 20, filters: Optional[Dict[str, List[str]]] = None) -> List[str]:
+        self.latency()
+        return self.inner.query(vector, top_k=top_k, filters=filters)
+
+    def query_batch(self, vectors, top_k: int = 20, filters: Optional[Dict[str, List[str]]] = None) -> List[List[str]]:
+        self.latency()
+        return self.inner.query_batch(vectors, top_k=top_k, filters=filters)
+
+    def save(self):
+        self.inner.save()
+
+    def ping(self):
+        self.latency()
+        return self.inner.ping()
+
+
+class FakeElasticsearch:
+    """In-memory stand-in for the parts of the Elasticsearch client the API and indexer use.
+
+    `search` scores documents by how many query tokens appear in the multi_match fields,
+    using an inverted index. Fuzziness is ignored. A `bool` query's `terms` filters and
+    `terms` aggregations work on the raw `_source` values, as the `.keyword` subfields would.
+    """
+
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self._docs: Dict[str, Dict] = {}
+        self._field_tokens: Dict[str, Dict[str, set]] = {}
+        self._postings: Dict[str, set] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def options(self, **kwargs) -> "FakeElasticsearch":
+        return self
+
+    def ping(self) -> bool:
+        self.latency()
+        return True
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _tokens(value) -> List[str]:
+        return re.findall(r"[a-z0-9]+", str(value).lower())
+
+    def index_actions(self, actions):
+        self.latency()
+        with self._lock:
+            for action in actions:
+                doc_id = str(action["_id"])
+                if action.get("_op_type") == "delete":
+                    self._docs.pop(doc_id, None)
+                    self._field_tokens.pop(doc_id, None)
+                    continue
+                self._docs[doc_id] = action["_source"]
+                self._field_tokens[doc_id] = {field: set(self._tokens(value)) for field, value in action["_source"].items()}
+                for tokens in self._field_tokens[doc_id].values():
+                    for token in tokens:
+                        self._postings[token].add(doc_id)
+
+    def search(self, index: str, size: int = 10, query: Optional[Dict] = None, aggs: Optional[Dict] = None, **kwargs) -> Dict:
+        self.latency()
+        return self._search(size, query, aggs)
+
+    def msearch(self, searches: List[Dict], **kwargs) -> Dict:
+        # Header/body pairs, answered for one round trip's latency
+        self.latency()
+        return {"responses": [self._search(body.get("size", 10), body.get("query"), body.get("aggs"))
+                              for body in searches[1::2]]}
+
+    @staticmethod
+    def _source_field(field: str) -> str:
+        return field[:-len(".keyword")] if field.endswith(".keyword") else field
+
+    def _search(self, size: int, query: Optional[Dict], aggs: Optional[Dict] = None) -> Dict:
+        query = query or {}
+        filters = []
+        if "bool" in query:
+            filters = [clause["terms"] for clause in query["bool"].get("filter", [])]
+            query = query["bool"].get("must", {})
+        match = query.get("multi_match", {})
+        fields = match.get("fields", [])
+        scores: Dict[str, int] = defaultdict(int)
+        with self._lock:
+            if "match_all" in query:
+                scores.update({doc_id: 1 for doc_id in self._docs})
+            for token in self._tokens(match.get("query", "")):
+                for doc_id in self._postings.get(token, ()):
+                    field_tokens = self._field_tokens.get(doc_id)
+                    if field_tokens is not None and any(token in field_tokens.get(field, ()) for field in fields):
+                        scores[doc_id] += 1
+            for terms in filters:
+                for field, values in terms.items():
+                    field = self._source_field(field)
+                    scores = {doc_id: score for doc_id, score in scores.items() if self._docs[doc_id].get(field) in values}
+            aggregations = {}
+            for name, agg in (aggs or {}).items():
+                field = self._source_field(agg["terms"]["field"])
+                counts = Counter(self._docs[doc_id].get(field) for doc_id in scores)
+                counts.pop(None, None)
+                aggregations[name] = {"buckets": [{"key": value, "doc_count": count} for value, count in
+                                                  sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:agg["terms"].get("size", 10)]]}
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:size]
+        response = {"hits": {"total": {"value": len(scores)},
+                             "hits": [{"_id": doc_id, "_score": float(score), "_source": self._docs[doc_id]}
+                                      for doc_id, score in ranked]}}
+        if aggs:
+            response["aggregations"] = aggregations
+        return response
+
+
+class _FakeCursor:
+    """Understands the handful of SELECTs the API and BatchIndexer issue against `products`."""
+
+    _SELECT = re.compile(r"SELECT\s+(?P<columns>.+?)\s+FROM\s+products(?P<rest>.*)", re.IGNORECASE | re.DOTALL)
+
+    def __init__(self, db: "FakePostgres", name: Optional[str] = None):
+        self.db = db
+        self.name = name
+        self.itersize = 2000
+        self.description = None
+        self._rows: List[tuple] = []
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._rows = []
+
+    def execute(self, sql: str, params=None):
+        self.db.latency()
+        sql = " ".join(sql.split())
+        if sql.upper() == "SELECT 1":
+            self._set(["?column?"], [(1,)])
+            return
+        match = self._SELECT.match(sql)
+        if match is None:
+            raise NotImplementedError(f"FakePostgres can't run: {sql}")
+        rows = self.db.rows
+        rest = match.group("rest")
+        if "ANY(%s)" in rest:
+            wanted = set(params[0])
+            rows = [row for row in rows if row["article_id"] in wanted]
+        elif "> (%s::timestamptz, %s)" in rest:
+            after = (str(params[0]), str(params[1]))
+            rows = [row for row in rows if (str(row["created_at"]), row["article_id"]) > after]
+        if "md5(article_id)" in rest:
+            # BatchIndexer's shard filter; the shard count and index are the last two parameters
+            count, index = params[-2], params[-1]
+            rows = [row for row in rows if int(hashlib.md5(row["article_id"].encode()).hexdigest()[:8], 16) % count == index]
+        if "ORDER BY" in rest.upper():
+            rows = sorted(rows, key=lambda row: (str(row["created_at"]), row["article_id"]))
+
+        columns = [column.strip() for column in match.group("columns").split(",")]
+        if columns == ["COUNT(*)"]:
+            self._set(["count"], [(len(rows),)])
+        else:
+            self._set(columns, [tuple(row[column] for column in columns) for row in rows])
+
+    def _set(self, columns, rows):
+        self.description = [(column,) for column in columns]
+        self._rows = rows
+        self.rowcount = len(rows)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def __iter__(self):
+        # A named (server-side) cursor pays one round trip per `itersize` rows
+        for start in range(0, len(self._rows), self.itersize):
+            if self.name is not None and start:
+                self.db.latency()
+            yield from self._rows[start:start + self.itersize]
+
+
+class FakeConnection:
+    def __init__(self, db: "FakePostgres"):
+        self.db = db
+        self.closed = 0
+
+    def cursor(self, name: Optional[str] = None):
+        return _FakeCursor(self.db, name=name)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePostgres:
+    """The `products` table held in memory. Provides a psycopg2-like connection and a PostgresPool-like `run`."""
+
+    def __init__(self, rows: List[Dict], latency: Optional[Latency] = None, maxconn: int = 16):
+        self.rows = rows
+        self.latency = latency or Latency()
+        self.maxconn = maxconn
+        self.reconnects = 0
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def connect(self) -> FakeConnection:
+        return FakeConnection(self)
+
+    def run(self, fn, retries: int = 1):
+        with self._slots:
+            return fn(FakeConnection(self))
+
+    def ping(self):
+        self.run(lambda conn: conn.cursor().execute("SELECT 1"))
+
+    def close(self):
+        pass
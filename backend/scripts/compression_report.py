@@ -0,0 +1,71 @@
+import os
+import json
+import argparse
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+from src.core.vector_store import LocalVectorStore
+from src.core.quantization import COMPRESSIONS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_vectors(path: str, n: int, dimension: int, seed: int = 0):
+    """Vectors of an existing local store if there is one, otherwise clustered synthetic vectors."""
+    if os.path.exists(os.path.join(path, "ids.json")):
+        with open(os.path.join(path, "ids.json")) as f:
+            ids = json.load(f)
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        logger.info(f"Using {len(ids)} vectors from {path}.")
+        return ids, np.asarray(vectors, dtype=np.float32)
+
+    logger.warning(f"No local vector store at {path}; generating {n} synthetic {dimension}-d vectors.")
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 200), dimension))
+    vectors = centers[rng.integers(len(centers), size=n)] + rng.normal(scale=0.6, size=(n, dimension))
+    return [str(i) for i in range(n)], vectors.astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare compressed first-pass search with exact re-ranking against uncompressed search.")
+    parser.add_argument("--path", default=os.getenv("VECTOR_STORE_PATH", "data/vector_store"))
+    parser.add_argument("--compressions", nargs="+", choices=COMPRESSIONS, default=list(COMPRESSIONS))
+    parser.add_argument("--rerank-factor", type=int, default=int(os.getenv("VECTOR_STORE_RERANK_FACTOR", "0")) or None,
+                        help="Candidates re-scored per result (default: each codec's own factor)")
+    parser.add_argument("--ivf-threshold", type=int, default=int(os.getenv("VECTOR_STORE_IVF_THRESHOLD", "50000")))
+    parser.add_argument("--n-vectors", type=int, default=100_000, help="Size of the synthetic catalog")
+    parser.add_argument("--dimension", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    ids, vectors = load_vectors(args.path, args.n_vectors, args.dimension)
+    records = [{"id": article_id, "values": vector} for article_id, vector in zip(ids, vectors)]
+
+    rows = []
+    for compression in [None] + args.compressions:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = LocalVectorStore(tmp, ivf_threshold=args.ivf_threshold,
+                                     compression=compression, rerank_factor=args.rerank_factor)
+            store.upsert(records)
+            store.save()
+            report = store.evaluate(k=args.k, n_queries=args.queries)
+        approximate = "approx_ms" in report
+        rows.append({
+            "compression": compression or "none",
+            "bytes/vector": report["bytes_per_vector"],
+            "qps": report["approx_qps"] if approximate else report["exact_qps"],
+            f"recall@{args.k}": report[f"recall@{args.k}"] if approximate else 1.0,
+            "first_pass_recall": report.get(f"first_pass_recall@{args.k}", 1.0 if not approximate else np.nan),
+            "rerank_factor": report.get("rerank_factor", np.nan),
+            "exact_qps": report["exact_qps"],
+        })
+
+    print(f"\n{len(ids)} vectors, recall against exact float32 search:")
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+
+
+if __name__ == "__main__":
+    main()
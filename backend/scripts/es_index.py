@@ -0,0 +1,177 @@
+import time
+import queue
+import logging
+import threading
+from elasticsearch import NotFoundError
+from elasticsearch.helpers import parallel_bulk
+
+logger = logging.getLogger(__name__)
+
+INDEX_ALIAS = "products_metadata"
+
+# query_elasticsearch runs a fuzzy multi_match over prod_name, product_group_name and
+# section_name, so those are analyzed text; the keyword subfields serve exact filters
+# and aggregations. Nothing else is indexed, and unknown fields are rejected.
+_TEXT_WITH_KEYWORD = {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+PRODUCTS_MAPPING = {
+    "dynamic": "strict",
+    "properties": {
+        "article_id": {"type": "keyword"},
+        "prod_name": _TEXT_WITH_KEYWORD,
+        "product_group_name": _TEXT_WITH_KEYWORD,
+        "colour_group_name": _TEXT_WITH_KEYWORD,
+        "section_name": _TEXT_WITH_KEYWORD,
+    },
+}
+
+_DONE = object()
+
+
+class EsBulkLoader:
+    """Rebuilds the products index from scratch behind an alias (blue/green).
+
+    `begin()` creates a fresh, explicitly mapped index with refresh and replicas turned off.
+    `write()` feeds documents to a background `parallel_bulk` stream, so request size and
+    concurrency don't depend on the indexer's batch size. `finish()` restores the settings,
+    force-merges, and moves the alias to the new index in one atomic update. Until then
+    searches keep hitting the previous index. `abort()` drops the half-built index.
+
+    Sharded runs split this up: the coordinator calls `create()` and later `finalize()`, and
+    each worker process attaches to the new index with `index=`, streaming its documents
+    between `start()` and `close()`.
+    """
+
+    def __init__(self, client, alias: str = INDEX_ALIAS, chunk_size: int = 500, workers: int = 4,
+                 replicas=None, keep_previous: bool = False, index=None):
+        self.client = client
+        self.alias = alias
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.replicas = replicas
+        self.keep_previous = keep_previous
+        self.index = index
+        # Only whoever created the index may drop it
+        self._owner = index is None
+        self.indexed = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=chunk_size * workers * 2)
+        self._thread = None
+        self._error = None
+        self._drained = False
+        self.swapped = False
+
+    def _current_indices(self):
+        try:
+            return list(self.client.indices.get_alias(name=self.alias).keys())
+        except NotFoundError:
+            return []
+
+    def _final_replicas(self, previous) -> int:
+        if self.replicas is not None:
+            return self.replicas
+        # Keep whatever the index being replaced was serving with
+        for index in previous:
+            settings = self.client.indices.get_settings(index=index, name="index.number_of_replicas")
+            return int(settings[index]["settings"]["index"]["number_of_replicas"])
+        # A first load: one replica, unless there is no second node to put it on (the
+        # single-node docker-compose cluster would otherwise stay yellow)
+        data_nodes = int(self.client.cluster.health()["number_of_data_nodes"])
+        return 1 if data_nodes > 1 else 0
+
+    def create(self) -> str:
+        self.index = f"{self.alias}-{time.strftime('%Y%m%d%H%M%S')}"
+        self.client.indices.create(
+            index=self.index,
+            mappings=PRODUCTS_MAPPING,
+            settings={"number_of_shards": 1, "number_of_replicas": 0, "refresh_interval": "-1"},
+        )
+        logger.info(f"Bulk-loading Elasticsearch into new index {self.index} (refresh and replicas off).")
+        return self.index
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="es-bulk", daemon=True)
+        self._thread.start()
+
+    def begin(self) -> str:
+        self.create()
+        self.start()
+        return self.index
+
+    def _actions(self):
+        while True:
+            action = self._queue.get()
+            if action is _DONE:
+                self._drained = True
+                return
+            yield action
+
+    def _run(self):
+        try:
+            for ok, info in parallel_bulk(self.client, self._actions(), thread_count=self.workers,
+                                          chunk_size=self.chunk_size, queue_size=self.workers,
+                                          raise_on_error=False):
+                if ok:
+                    self.indexed += 1
+                else:
+                    self.failed += 1
+                    if self.failed <= 10:
+                        logger.error(f"Elasticsearch rejected a document: {info}")
+        except Exception as e:
+            self._error = e
+            # Keep draining so writers blocked on a full queue can see the error
+            while not self._drained:
+                self._drained = self._queue.get() is _DONE
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError(f"Elasticsearch bulk load failed: {self._error}") from self._error
+
+    def write(self, actions):
+        for action in actions:
+            self._check()
+            self._queue.put({**action, "_index": self.index})
+
+    def _close_stream(self):
+        if self._thread is not None:
+            self._queue.put(_DONE)
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """Waits for every queued document to be sent and raises if any of them failed."""
+        self._close_stream()
+        self._check()
+        if self.failed:
+            raise RuntimeError(f"{self.failed} documents failed to index into {self.index}; keeping the current alias.")
+
+    def finish(self):
+        self.close()
+        self.finalize()
+
+    def finalize(self):
+        previous = self._current_indices()
+        replicas = self._final_replicas(previous)
+        start = time.perf_counter()
+        self.client.indices.put_settings(index=self.index, settings={"refresh_interval": None, "number_of_replicas": replicas})
+        self.client.indices.refresh(index=self.index)
+        self.client.options(request_timeout=3600).indices.forcemerge(index=self.index, max_num_segments=1)
+        logger.info(f"Restored settings ({replicas} replicas) and force-merged {self.index} in {time.perf_counter() - start:.1f}s.")
+
+        actions = [{"remove": {"index": index, "alias": self.alias}} for index in previous]
+        if not previous and self.client.indices.exists(index=self.alias):
+            # A concrete index from before aliases were used; it has to go in the same step
+            actions.append({"remove_index": {"index": self.alias}})
+        actions.append({"add": {"index": self.index, "alias": self.alias, "is_write_index": True}})
+        self.client.indices.update_aliases(actions=actions)
+        self.swapped = True
+        logger.info(f"Alias {self.alias} now points to {self.index} ({self.indexed} documents).")
+
+        if previous and not self.keep_previous:
+            self.client.indices.delete(index=",".join(previous))
+            logger.info(f"Deleted previous index(es): {', '.join(previous)}")
+
+    def abort(self):
+        self._close_stream()
+        if self._owner and self.index is not None and not self.swapped:
+            logger.warning(f"Bulk load aborted; deleting half-built index {self.index}. {self.alias} is unchanged.")
+            self.client.indices.delete(index=self.index, ignore_unavailable=True)
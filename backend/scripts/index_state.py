@@ -0,0 +1,147 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from src.core.image_cache import fingerprint
+
+HASHED_FIELDS = [
+    "prod_name", "cleaned_description", "image_path",
+    "product_group_name", "colour_group_name", "section_name",
+]
+
+
+def content_hash(product, variant: str) -> str:
+    """Hashes the fields that end up in the vector or ES document, plus the model variant that embedded them.
+
+    The variant (e.g. 'clip-ViT-B-32-int8') changes with the inference backend when the vectors do,
+    so switching backends re-embeds everything.
+    """
+    parts = [variant] + ["" if getattr(product, field) is None else str(getattr(product, field)) for field in HASHED_FIELDS]
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def embedding_hash(product, variant: str) -> str:
+    """Hashes only what goes into the embeddings: the description, the image file and the model variant.
+
+    This is the embedding store's version, so metadata-only edits (names, facets) reuse cached vectors.
+    """
+    parts = [variant, product.cleaned_description or "", product.image_path or "",
+             (fingerprint(product.image_path) if product.image_path else None) or ""]
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class IndexState:
+    """Local SQLite record of what the indexer has already pushed to the search backends.
+
+    `articles` maps article_id to the content hash that was last indexed; `meta` holds the
+    (created_at, article_id) checkpoint of the last committed batch and whether a run is in
+    progress, which is what lets an interrupted incremental run pick up where it stopped.
+
+    A shard of a sharded run can't mark anything indexed by itself, since its writes only go
+    live once the coordinator merges every shard and swaps the Elasticsearch alias. It stages
+    its results with `stage_pending` instead, and the coordinator applies them with `apply_pending`.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        # Batches are committed from the pipeline's writer threads, so share one connection behind a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS articles (article_id TEXT PRIMARY KEY, content_hash TEXT NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS pending_articles (article_id TEXT PRIMARY KEY, content_hash TEXT NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS pending_removals (article_id TEXT PRIMARY KEY)")
+
+    def _get_meta(self, key: str):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def get_hash(self, article_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT content_hash FROM articles WHERE article_id = ?", (article_id,)).fetchone()
+        return row[0] if row else None
+
+    def run_in_progress(self) -> bool:
+        with self._lock:
+            return self._get_meta("run_status") == "running"
+
+    def checkpoint(self):
+        """Returns the (created_at, article_id) of the last committed batch, or None."""
+        with self._lock:
+            created_at, article_id = self._get_meta("checkpoint_created_at"), self._get_meta("checkpoint_article_id")
+        if article_id is None:
+            return None
+        return created_at, article_id
+
+    def begin_run(self, reset: bool = False):
+        with self._lock, self._conn:
+            if reset:
+                self._conn.execute("DELETE FROM articles")
+                self._conn.execute("DELETE FROM meta")
+            # Whatever an earlier, failed run staged never went live
+            self._conn.execute("DELETE FROM pending_articles")
+            self._conn.execute("DELETE FROM pending_removals")
+            self._set_meta("run_status", "running")
+
+    def commit_batch(self, indexed, checkpoint):
+        """Records `indexed` as [(article_id, content_hash)] and advances the checkpoint atomically."""
+        created_at, article_id = checkpoint
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO articles (article_id, content_hash) VALUES (?, ?)", indexed
+            )
+            self._set_meta("checkpoint_created_at", str(created_at))
+            self._set_meta("checkpoint_article_id", str(article_id))
+
+    def find_removed(self, live_ids):
+        """Returns indexed article_ids that are absent from the `live_ids` iterable."""
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS live_ids (article_id TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM live_ids")
+            self._conn.executemany("INSERT OR IGNORE INTO live_ids (article_id) VALUES (?)", ((str(aid),) for aid in live_ids))
+            removed = [row[0] for row in self._conn.execute(
+                "SELECT article_id FROM articles WHERE article_id NOT IN (SELECT article_id FROM live_ids)"
+            )]
+            self._conn.execute("DROP TABLE live_ids")
+        return removed
+
+    def remove(self, article_ids):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM articles WHERE article_id = ?", ((aid,) for aid in article_ids))
+
+    def stage_pending(self, indexed, removed):
+        """Keeps `indexed` [(article_id, content_hash)] and `removed` aside; the run stays in progress."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pending_articles")
+            self._conn.execute("DELETE FROM pending_removals")
+            self._conn.executemany("INSERT OR REPLACE INTO pending_articles (article_id, content_hash) VALUES (?, ?)", indexed)
+            self._conn.executemany("INSERT OR IGNORE INTO pending_removals (article_id) VALUES (?)", ((aid,) for aid in removed))
+
+    def apply_pending(self):
+        """Applies what `stage_pending` kept aside and completes the run, in one transaction."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM articles WHERE article_id IN (SELECT article_id FROM pending_removals)")
+            self._conn.execute("INSERT OR REPLACE INTO articles (article_id, content_hash) "
+                               "SELECT article_id, content_hash FROM pending_articles")
+            self._conn.execute("DELETE FROM pending_articles")
+            self._conn.execute("DELETE FROM pending_removals")
+            self._set_meta("run_status", "complete")
+            self._conn.execute("DELETE FROM meta WHERE key IN ('checkpoint_created_at', 'checkpoint_article_id')")
+
+    def finish_run(self):
+        with self._lock, self._conn:
+            self._set_meta("run_status", "complete")
+            self._conn.execute("DELETE FROM meta WHERE key IN ('checkpoint_created_at', 'checkpoint_article_id')")
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,197 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tqdm.auto import tqdm
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class _PendingBatch:
+    """Tracks how many sinks still have to write a batch before it can be committed."""
+
+    def __init__(self, batch, indexed, sinks: int):
+        self.batch = batch
+        self.indexed = indexed
+        self.remaining = sinks
+
+
+class StageStats:
+    """Counts items and busy/blocked time for one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items: int, busy: float, blocked: float = 0.0):
+        with self._lock:
+            self.items += items
+            self.batches += 1
+            self.busy_seconds += busy
+            self.blocked_seconds += blocked
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.name:<8} items={self.items:<8} batches={self.batches:<6} "
+                f"busy={self.busy_seconds:8.1f}s blocked={self.blocked_seconds:8.1f}s "
+                f"throughput={self.throughput:8.1f} items/s")
+
+
+class IndexingPipeline:
+    """Overlaps image decoding, CLIP inference and sink writes for a BatchIndexer.
+
+    Decoding runs in a thread pool, embedding runs on the calling thread and the
+    Elasticsearch and vector-store writes are drained by one background thread each.
+    Every hand-off is a bounded queue, so at most `queue_size` batches are in flight
+    per stage regardless of catalog size.
+    """
+
+    def __init__(self, indexer, decode_workers: int = 4, queue_size: int = 4, on_commit=None):
+        self.indexer = indexer
+        self.on_commit = on_commit
+        self.decode_workers = decode_workers
+        self.queue_size = queue_size
+        self.stats = {name: StageStats(name) for name in ("decode", "embed", "es", "vectors")}
+        self._errors = []
+        self._stop = threading.Event()
+        self._commit_lock = threading.Lock()
+
+    def _decode(self, batch):
+        start = time.perf_counter()
+        versions = self.indexer._versions(batch)
+        images = self.indexer._decode_images(batch, versions)
+        self.stats["decode"].record(len(batch), time.perf_counter() - start)
+        return batch, images, versions
+
+    def _feed(self, batches, decoder: ThreadPoolExecutor, decoded: queue.Queue):
+        try:
+            for batch in batches:
+                if self._stop.is_set():
+                    break
+                decoded.put(decoder.submit(self._decode, batch))
+        except Exception as e:
+            self._fail("feed", e)
+        finally:
+            decoded.put(_DONE)
+
+    def _drain(self, name: str, sink, pending: queue.Queue):
+        stats = self.stats[name]
+        while True:
+            item = pending.get()
+            if item is _DONE:
+                return
+            if self._stop.is_set():
+                continue
+            token, writes = item
+            start = time.perf_counter()
+            try:
+                if writes:
+                    sink(writes)
+            except Exception as e:
+                self._fail(name, e)
+                continue
+            stats.record(len(writes), time.perf_counter() - start)
+            self._complete(token)
+
+    def _complete(self, token: _PendingBatch):
+        # Each writer drains its queue in order, so once both sinks are done with a batch
+        # every earlier batch is done too and commits stay in catalog order.
+        with self._commit_lock:
+            token.remaining -= 1
+            if token.remaining or self.on_commit is None or self._stop.is_set():
+                return
+            try:
+                self.on_commit(token.batch, token.indexed)
+            except Exception as e:
+                self._fail("commit", e)
+
+    def _fail(self, stage: str, error: Exception):
+        logger.error(f"Pipeline stage '{stage}' failed: {error}")
+        self._errors.append(error)
+        self._stop.set()
+
+    def _put(self, pending: queue.Queue, item) -> float:
+        start = time.perf_counter()
+        pending.put(item)
+        return time.perf_counter() - start
+
+    def run(self, batches, total=None):
+        decoded = queue.Queue(maxsize=self.queue_size)
+        es_pending = queue.Queue(maxsize=self.queue_size)
+        vector_pending = queue.Queue(maxsize=self.queue_size)
+
+        writers = [
+            threading.Thread(target=self._drain, args=("es", self.indexer._write_es, es_pending), name="es-writer", daemon=True),
+            threading.Thread(target=self._drain, args=("vectors", self.indexer._write_vectors, vector_pending), name="vector-writer", daemon=True),
+        ]
+        for writer in writers:
+            writer.start()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.decode_workers, thread_name_prefix="decode") as decoder:
+            feeder = threading.Thread(target=self._feed, args=(batches, decoder, decoded), name="feeder", daemon=True)
+            feeder.start()
+
+            # Shard processes report to their coordinator's bar instead of drawing their own
+            with tqdm(total=total, desc="Indexing Batches", disable=self.indexer.shard is not None) as progress:
+                while True:
+                    wait_start = time.perf_counter()
+                    future = decoded.get()
+                    if future is _DONE:
+                        break
+                    if self._stop.is_set():
+                        continue
+                    try:
+                        batch, images, versions = future.result()
+                    except Exception as e:
+                        self._fail("decode", e)
+                        continue
+                    waited = time.perf_counter() - wait_start
+
+                    start = time.perf_counter()
+                    try:
+                        indexed, combined = self.indexer._embed_batch(batch, images, versions)
+                        es_actions, vectors = self.indexer._build_writes(indexed, combined)
+                    except Exception as e:
+                        self._fail("embed", e)
+                        continue
+                    busy = time.perf_counter() - start
+
+                    # Empty writes still travel through both queues so commits stay ordered
+                    token = _PendingBatch(batch, indexed, sinks=2)
+                    blocked = self._put(es_pending, (token, es_actions)) + self._put(vector_pending, (token, vectors))
+                    self.stats["embed"].record(len(batch), busy, waited + blocked)
+                    progress.update(1)
+
+            feeder.join()
+
+        for pending in (es_pending, vector_pending):
+            pending.put(_DONE)
+        for writer in writers:
+            writer.join()
+
+        self._log_summary(time.perf_counter() - started)
+        if self._errors:
+            raise RuntimeError(f"Indexing pipeline aborted after {len(self._errors)} stage failure(s).") from self._errors[0]
+
+    def _log_summary(self, elapsed: float):
+        logger.info(f"Pipeline finished in {elapsed:.1f}s. Per-stage counters:")
+        for stats in self.stats.values():
+            logger.info(stats.summary())
+        # Decode runs across several workers, so compare wall-clock share per worker
+        load = {
+            name: stats.busy_seconds / (self.decode_workers if name == "decode" else 1)
+            for name, stats in self.stats.items()
+        }
+        bottleneck = max(load, key=load.get)
+        logger.info(f"Bottleneck stage: {bottleneck} ({load[bottleneck]:.1f}s busy of {elapsed:.1f}s wall time)")
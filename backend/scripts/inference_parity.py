@@ -0,0 +1,74 @@
+import os
+import time
+import argparse
+import logging
+import pandas as pd
+from PIL import Image
+from src.core.embedding import EmbeddingModel
+from src.core.inference import BACKENDS, cosine_parity
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_samples(csv_path: str, n: int):
+    if os.path.exists(csv_path):
+        df = pd.read_csv(csv_path, usecols=['cleaned_description', 'image_path'], nrows=n)
+        texts = df['cleaned_description'].fillna("").tolist()
+        images = [EmbeddingModel.load_image(path) for path in df['image_path']]
+        images = [img for img in images if img is not None]
+        logger.info(f"Loaded {len(texts)} texts and {len(images)} images from {csv_path}.")
+        return texts, images
+
+    logger.warning(f"{csv_path} not found; falling back to synthetic samples.")
+    texts = [f"{colour} {garment} with a relaxed fit" for colour in ("black", "white", "red", "navy")
+             for garment in ("dress", "denim jacket", "t-shirt", "trousers")]
+    images = [Image.new('RGB', (224, 224), color=(i * 15 % 256, i * 40 % 256, i * 70 % 256)) for i in range(len(texts))]
+    return texts, images
+
+
+def timed_encode(model: EmbeddingModel, texts, images, batch_size: int):
+    start = time.perf_counter()
+    text_embs, _ = model.embed_texts(texts, batch_size=batch_size)
+    text_ms = (time.perf_counter() - start) / len(texts) * 1000
+    start = time.perf_counter()
+    image_embs, _ = model.embed_loaded_images(images, batch_size=batch_size)
+    image_ms = (time.perf_counter() - start) / len(images) * 1000
+    return text_embs, image_embs, text_ms, image_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare EmbeddingModel inference backends against the fp32 PyTorch reference.")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["int8", "torchscript", "onnx"])
+    parser.add_argument("--samples", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-threads", type=int, default=None)
+    parser.add_argument("--csv", default="data/prepared/prepared_hm_products.csv")
+    args = parser.parse_args()
+
+    texts, images = load_samples(args.csv, args.samples)
+    reference = EmbeddingModel(backend="torch", num_threads=args.num_threads)
+    reference.warmup()
+    ref_text, ref_image, ref_text_ms, ref_image_ms = timed_encode(reference, texts, images, args.batch_size)
+
+    rows = [{"backend": "torch (fp32)", "text_ms": ref_text_ms, "image_ms": ref_image_ms,
+             "text_cos_mean": 1.0, "text_cos_min": 1.0, "image_cos_mean": 1.0, "image_cos_min": 1.0}]
+    for backend in args.backends:
+        try:
+            model = EmbeddingModel(backend=backend, num_threads=args.num_threads)
+        except ImportError as e:
+            logger.warning(f"Skipping {backend}: {e}")
+            continue
+        model.warmup()
+        text_embs, image_embs, text_ms, image_ms = timed_encode(model, texts, images, args.batch_size)
+        text_parity, image_parity = cosine_parity(ref_text, text_embs), cosine_parity(ref_image, image_embs)
+        rows.append({"backend": backend, "text_ms": text_ms, "image_ms": image_ms,
+                     "text_cos_mean": text_parity["mean"], "text_cos_min": text_parity["min"],
+                     "image_cos_mean": image_parity["mean"], "image_cos_min": image_parity["min"]})
+
+    print("\nPer-item latency (ms) and cosine similarity to the fp32 reference:")
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 import os
-import io
+import csv
+import time
+import argparse
 import logging
-import pandas as pd
 import psycopg2
+from psycopg2 import sql
 from dotenv import load_dotenv
+from tqdm.auto import tqdm
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,11 +15,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+MODES = ("replace", "append", "upsert")
+
+
+class _ProgressReader:
+    """File wrapper that advances a byte progress bar as COPY pulls chunks from it."""
+
+    def __init__(self, f, progress):
+        self.f = f
+        self.progress = progress
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.progress.update(len(data))
+        return data
+
+    def readline(self, size=-1):
+        data = self.f.readline(size)
+        self.progress.update(len(data))
+        return data
+
+
 class PostgresIngestor:
-    def __init__(self, csv_path: str, table_name: str):
+    def __init__(self, csv_path: str, table_name: str, chunk_size: int = 1 << 20):
         load_dotenv()
         self.csv_path = csv_path
         self.table_name = table_name
+        # Bytes handed to COPY per round trip; the file itself is never loaded whole
+        self.chunk_size = chunk_size
         self.db_params = {
             "host": os.getenv("DB_HOST"),
             "port": os.getenv("DB_PORT"),
@@ -36,39 +62,101 @@ class PostgresIngestor:
             logger.error("Please ensure the Docker container is running and the .env file credentials are correct.")
             raise
 
-    def ingest(self, clear_table: bool = True):
-        logger.info(f"Starting ingestion of '{self.csv_path}' into table '{self.table_name}'.")
+    def _copy(self, cursor, f, table: str, columns) -> int:
+        """Streams the rest of `f` (CSV rows without the header) into `table` with COPY."""
+        copy_sql = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT CSV)").format(
+            sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))
+        )
+        with tqdm(total=os.path.getsize(self.csv_path), initial=f.tell(), unit="B", unit_scale=True,
+                  desc=f"COPY {table}") as progress:
+            cursor.copy_expert(copy_sql.as_string(cursor), _ProgressReader(f, progress), size=self.chunk_size)
+        return cursor.rowcount
+
+    def _upsert(self, cursor, f, columns, prune: bool) -> int:
+        """Loads into an unlogged staging table, then merges it into the live table in the same transaction.
+
+        Readers keep seeing the previous rows until the commit; unlike TRUNCATE, nothing
+        takes an exclusive lock on the live table, so search never sees it empty or blocks.
+        """
+        table = sql.Identifier(self.table_name)
+        staging_name = f"{self.table_name}_staging"
+        staging = sql.Identifier(staging_name)
+        cols = sql.SQL(", ").join(map(sql.Identifier, columns))
+        updates = [c for c in columns if c != "article_id"]
+
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(staging))
+        # No primary key or indexes on the staging copy, so COPY only appends heap pages
+        cursor.execute(sql.SQL("CREATE UNLOGGED TABLE {} (LIKE {} INCLUDING DEFAULTS)").format(staging, table))
+        staged = self._copy(cursor, f, staging_name, columns)
+        logger.info(f"Staged {staged} rows in '{staging_name}'. Merging into '{self.table_name}'...")
+
+        # created_at is left alone on conflict so incremental indexing keeps its ordering;
+        # rows whose values didn't change aren't rewritten at all
+        if not updates:
+            cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} ON CONFLICT (article_id) DO NOTHING").format(
+                table, cols, cols, staging))
+        else:
+            cursor.execute(sql.SQL(
+                "INSERT INTO {table} AS t ({cols}) SELECT {cols} FROM {staging} "
+                "ON CONFLICT (article_id) DO UPDATE SET {assignments} "
+                "WHERE ({current}) IS DISTINCT FROM ({incoming})"
+            ).format(
+                table=table, cols=cols, staging=staging,
+                assignments=sql.SQL(", ").join(sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(c)) for c in updates),
+                current=sql.SQL(", ").join(sql.SQL("t.{}").format(sql.Identifier(c)) for c in updates),
+                incoming=sql.SQL(", ").join(sql.SQL("EXCLUDED.{}").format(sql.Identifier(c)) for c in updates),
+            ))
+        logger.info(f"Inserted or updated {cursor.rowcount} rows; {staged - cursor.rowcount} were unchanged.")
+
+        if prune:
+            cursor.execute(sql.SQL(
+                "DELETE FROM {table} t WHERE NOT EXISTS (SELECT 1 FROM {staging} s WHERE s.article_id = t.article_id)"
+            ).format(table=table, staging=staging))
+            logger.info(f"Deleted {cursor.rowcount} rows that are no longer in the CSV.")
+
+        cursor.execute(sql.SQL("DROP TABLE {}").format(staging))
+        return staged
+
+    def ingest(self, mode: str = "replace", prune: bool = True):
+        """Loads the prepared CSV.
+
+        `replace` truncates the table first, `append` only copies, and `upsert` merges by
+        article_id (and with `prune`, deletes rows missing from the CSV) without emptying the table.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown ingest mode '{mode}'. Expected one of {', '.join(MODES)}.")
+        logger.info(f"Starting {mode} ingestion of '{self.csv_path}' into table '{self.table_name}'.")
 
         try:
-            df = pd.read_csv(self.csv_path)
-            if df.empty:
-                logger.warning("Input CSV file is empty. No data to ingest.")
-                return
+            f = open(self.csv_path, newline="")
         except FileNotFoundError:
             logger.error(f"The input file was not found at {self.csv_path}")
             raise
 
+        start = time.perf_counter()
         conn = self._create_connection()
         cursor = conn.cursor()
 
         try:
-            if clear_table:
-                logger.info(f"Clearing all existing data from table '{self.table_name}' to ensure a clean import.")
-                cursor.execute(f"TRUNCATE TABLE {self.table_name} RESTART IDENTITY CASCADE;")
-
-            logger.info(f"Preparing to copy {len(df)} rows into the database via in-memory buffer...")
-            
-            # Create an in-memory text buffer to stream data efficiently without writing to disk
-            buffer = io.StringIO()
-            df.to_csv(buffer, index=False, header=False)
-            buffer.seek(0) # Rewind the buffer to the beginning for reading
-            columns = ','.join(df.columns)
-            copy_sql = f"COPY {self.table_name} ({columns}) FROM STDIN WITH (FORMAT CSV)"
-
-            cursor.copy_expert(sql=copy_sql, file=buffer)
+            with f:
+                columns = next(csv.reader([f.readline()]), None)
+                if not columns:
+                    logger.warning("Input CSV file is empty. No data to ingest.")
+                    return
+
+                if mode == "upsert":
+                    rows = self._upsert(cursor, f, columns, prune)
+                else:
+                    if mode == "replace":
+                        logger.info(f"Clearing all existing data from table '{self.table_name}' to ensure a clean import.")
+                        cursor.execute(sql.SQL("TRUNCATE TABLE {} RESTART IDENTITY CASCADE").format(sql.Identifier(self.table_name)))
+                    rows = self._copy(cursor, f, self.table_name, columns)
             conn.commit()
-            
-            logger.info(f"Success. Ingested {cursor.rowcount} rows.")
+
+            elapsed = time.perf_counter() - start
+            if rows == 0:
+                logger.warning("Input CSV file has no data rows.")
+            logger.info(f"Success. Ingested {rows} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):.0f} rows/s).")
 
         except (Exception, psycopg2.Error) as e:
             logger.error(f"An error occurred during ingestion: {e}")
@@ -81,10 +169,19 @@ class PostgresIngestor:
 
 
 if __name__ == '__main__':
-    PREPARED_CSV_PATH = 'data/prepared/prepared_hm_products.csv'
-    TABLE_NAME = 'products'
+    parser = argparse.ArgumentParser(description="Load the prepared product CSV into PostgreSQL with COPY.")
+    parser.add_argument("--csv-path", default="data/prepared/prepared_hm_products.csv")
+    parser.add_argument("--table", default="products")
+    parser.add_argument("--mode", choices=MODES, default="replace",
+                        help="replace: truncate and reload (default); append: copy only; "
+                             "upsert: merge by article_id through a staging table, keeping the table readable.")
+    parser.add_argument("--no-prune", action="store_true",
+                        help="In upsert mode, keep rows whose article_id is not in the CSV.")
+    parser.add_argument("--chunk-size", type=int, default=1 << 20,
+                        help="Bytes sent to COPY per round trip (default: 1 MiB).")
+    args = parser.parse_args()
     try:
-        ingestor = PostgresIngestor(csv_path=PREPARED_CSV_PATH, table_name=TABLE_NAME)
-        ingestor.ingest()
+        ingestor = PostgresIngestor(csv_path=args.csv_path, table_name=args.table, chunk_size=args.chunk_size)
+        ingestor.ingest(mode=args.mode, prune=not args.no_prune)
     except Exception as e:
-        logger.error(f"Pipeline failed: {e}")
\ No newline at end of file
+        logger.error(f"Pipeline failed: {e}")
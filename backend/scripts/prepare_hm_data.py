@@ -1,12 +1,15 @@
 import pandas as pd
 import numpy as np
 import os
-import re
+import time
+import argparse
+from collections import deque
 from PIL import Image
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
 from tqdm.auto import tqdm
 import logging
 from bs4 import BeautifulSoup
+from src.core.image_cache import ImageCache, fingerprint, write_rows
 
 # Configure logging for better visibility
 logging.basicConfig(
@@ -16,136 +19,214 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DTYPE_MAP = {
+    'article_id': str, 'product_code': str, 'prod_name': 'string',
+    'product_type_name': 'category', 'product_group_name': 'category',
+    'graphical_appearance_name': 'category', 'colour_group_name': 'category',
+    'perceived_colour_value_name': 'category', 'perceived_colour_master_name': 'category',
+    'department_name': 'category', 'index_name': 'category', 'index_group_name': 'category',
+    'section_name': 'category', 'garment_group_name': 'category', 'detail_desc': 'string'
+}
+
+FINAL_COLUMNS = [
+    'article_id', 'prod_name', 'cleaned_description', 'product_group_name',
+    'graphical_appearance_name', 'colour_group_name', 'section_name',
+    'garment_group_name', 'image_path'
+]
+
+
+def clean_texts(texts: pd.Series) -> pd.Series:
+    """Strips HTML, lowercases, keeps only [a-z0-9 .,-] and collapses whitespace, for a whole column at once."""
+    texts = texts.astype('string').fillna("")
+    # Only rows that can contain markup or entities need the HTML parser
+    markup = texts.str.contains(r'[<&]', regex=True)
+    if markup.any():
+        texts = texts.copy()
+        texts[markup] = [BeautifulSoup(text, "html.parser").get_text() for text in texts[markup]]
+    return (
+        texts.str.lower()
+        .str.replace(r'[^a-z0-9\s.,-]', '', regex=True)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+    )
+
+
+def verify_image(image_path: str) -> bool:
+    """Opens the file once and decodes it (JPEGs at 1/8 scale), which also catches truncated files."""
+    try:
+        with Image.open(image_path) as img:
+            if img.format == 'JPEG':
+                img.draft('RGB', (max(1, img.width // 8), max(1, img.height // 8)))
+            img.load()
+            if img.mode != 'RGB':
+                img.convert('RGB')
+        return True
+    except Exception:
+        return False
+
+
+def image_path_for(images_base_path: str, article_id: str) -> str:
+    return os.path.join(images_base_path, article_id[:3], f"{article_id}.jpg")
+
+
+def prepare_chunk(chunk: pd.DataFrame, images_base_path: str, cache: dict | None = None):
+    """Cleans, verifies and filters one chunk of articles.csv. Runs in a worker process.
+
+    With `cache` set, images that are new or changed are decoded once, resized and
+    center-cropped straight into the row reserved for them in the image cache, and that
+    decode doubles as verification. Images already cached from an unchanged file aren't
+    opened at all. Returns the prepared rows and the (article_id, version, row) entries
+    to log.
+    """
+    chunk = chunk.dropna(subset=['detail_desc'])
+    chunk = chunk.assign(cleaned_description=clean_texts(chunk['detail_desc']))
+    # Short descriptions are dropped anyway, so don't pay for opening their images
+    chunk = chunk[chunk['cleaned_description'].str.len() > 20]
+
+    article_ids = chunk['article_id'].tolist()
+    paths = [image_path_for(images_base_path, aid) for aid in article_ids]
+    entries = []
+    if cache is None:
+        valid = np.fromiter((verify_image(path) for path in paths), dtype=bool, count=len(paths))
+    else:
+        valid = np.array([aid in cache['unchanged'] for aid in article_ids], dtype=bool)
+        todo = [i for i, aid in enumerate(article_ids) if aid in cache['rows']]
+        rows = [cache['rows'][article_ids[i]][0] for i in todo]
+        written = write_rows(cache['path'], cache['size'], rows, [paths[i] for i in todo])
+        for i, row, ok in zip(todo, rows, written):
+            if ok:
+                valid[i] = True
+                entries.append((article_ids[i], cache['rows'][article_ids[i]][1], row))
+    chunk = chunk.assign(image_path=paths)[valid]
+
+    return chunk[[col for col in FINAL_COLUMNS if col in chunk.columns]], entries
+
+
 class HMDataPreparer:
-    def __init__(self, base_data_path: str, output_path: str):
+    def __init__(self, base_data_path: str, output_path: str, chunk_size: int = 10000, workers: int | None = None,
+                 image_cache_path: str | None = None, image_size: int = 224):
         self.base_path = base_data_path
         self.images_base_path = os.path.join(self.base_path, 'images')
         self.articles_path = os.path.join(self.base_path, 'articles.csv')
         self.output_path = output_path
         self.final_csv_path = os.path.join(self.output_path, 'prepared_hm_products.csv')
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count()
+        self.image_cache = ImageCache(image_cache_path, size=image_size) if image_cache_path else None
 
         os.makedirs(self.output_path, exist_ok=True)
         logger.info(f"Data preparer initialized. Output will be saved to {self.output_path}")
 
-    def _load_and_inspect(self) -> pd.DataFrame:
-        logger.info(f"Loading metadata from {self.articles_path}")
+    def _iter_chunks(self):
+        logger.info(f"Streaming metadata from {self.articles_path} in chunks of {self.chunk_size} rows")
         try:
-            dtype_map = {
-                'article_id': str, 'product_code': str, 'prod_name': 'string',
-                'product_type_name': 'category', 'product_group_name': 'category',
-                'graphical_appearance_name': 'category', 'colour_group_name': 'category',
-                'perceived_colour_value_name': 'category', 'perceived_colour_master_name': 'category',
-                'department_name': 'category', 'index_name': 'category', 'index_group_name': 'category',
-                'section_name': 'category', 'garment_group_name': 'category', 'detail_desc': 'string'
-            }
-            df = pd.read_csv(self.articles_path, dtype=dtype_map)
-            logger.info("Initial memory usage of loaded data:")
-            df.info(memory_usage='deep')
-            return df
+            yield from pd.read_csv(self.articles_path, dtype=DTYPE_MAP, chunksize=self.chunk_size)
         except FileNotFoundError:
             logger.error(f"FATAL: The file {self.articles_path} was not found.")
             raise
 
-    @staticmethod
-    def _clean_text(text: str) -> str:
-        if not isinstance(text, str) or pd.isna(text):
-            return ""
-        
-        text = BeautifulSoup(text, "html.parser").get_text()
-        text = text.lower()
-        text = re.sub(r'[^a-z0-9\s.,-]', '', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
-
-    def _construct_and_verify_image_path(self, article_id: str) -> str | None:
-        sub_dir = article_id[:3]
-        image_path = os.path.join(self.images_base_path, sub_dir, f"{article_id}.jpg")
-        
-        if not os.path.exists(image_path):
-            return None
-        
-        try:
-            with Image.open(image_path) as img:
-                img.verify()
-                if img.mode != 'RGB':
-                    with Image.open(image_path) as img_to_convert:
-                         img_to_convert.convert('RGB')
-            return image_path
-        except Exception:
+    def _cache_args(self, chunk: pd.DataFrame) -> dict | None:
+        if self.image_cache is None:
             return None
+        # A stat per image tells which ones are new or changed since they were cached; only
+        # those get a row. Rows of articles the worker then filters out are released.
+        article_ids = chunk['article_id'].tolist()
+        known = self.image_cache.versions(article_ids)
+        unchanged, changed = set(), []
+        for aid in article_ids:
+            version = fingerprint(image_path_for(self.images_base_path, aid))
+            if version is None:
+                continue
+            if known.get(aid) == version:
+                unchanged.add(aid)
+            else:
+                changed.append((aid, version))
+        rows = self.image_cache.reserve(len(changed))
+        return {
+            "path": self.image_cache.path,
+            "size": self.image_cache.size,
+            "unchanged": unchanged,
+            "rows": {aid: (row, version) for row, (aid, version) in zip(rows, changed)},
+        }
 
-    def _process_in_parallel(self, df: pd.DataFrame) -> pd.DataFrame:
-        image_paths = [None] * len(df)
-        cleaned_descriptions = [None] * len(df)
-        
-        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-            logger.info(f"Starting parallel processing with {executor._max_workers} workers.")
-            
-            future_to_idx_img = {
-                executor.submit(self._construct_and_verify_image_path, row.article_id): idx 
-                for idx, row in df.iterrows()
-            }
-            for future in tqdm(as_completed(future_to_idx_img), total=len(df), desc="Verifying Images"):
-                idx = future_to_idx_img[future]
-                image_paths[idx] = future.result()
-
-            descriptions = df['detail_desc'].tolist()
-            future_to_idx_text = {
-                executor.submit(self._clean_text, desc): i 
-                for i, desc in enumerate(descriptions)
-            }
-            for future in tqdm(as_completed(future_to_idx_text), total=len(descriptions), desc="Cleaning Descriptions"):
-                idx = future_to_idx_text[future]
-                cleaned_descriptions[idx] = future.result()
-
-        df['image_path'] = image_paths
-        df['cleaned_description'] = cleaned_descriptions
-        return df
+    def _write(self, df: pd.DataFrame, path: str, first: bool):
+        # Categoricals from different chunks can have different categories, so write plain values
+        df.to_csv(path, mode='w' if first else 'a', header=first, index=False)
 
     def run(self):
         """Executes the complete data preparation pipeline."""
-        df = self._load_and_inspect()
-        
-        logger.info(f"Initial dataframe shape: {df.shape}")
-        
-        df.dropna(subset=['detail_desc'], inplace=True)
-        df.reset_index(drop=True, inplace=True)
-        logger.info(f"Shape after dropping rows with missing descriptions: {df.shape}")
-
-        df = self._process_in_parallel(df)
-        
-        initial_rows = len(df)
-        df.dropna(subset=['image_path'], inplace=True)
-        df = df[df['cleaned_description'].str.len() > 20]
-        final_rows = len(df)
-        logger.info(f"Dropped {initial_rows - final_rows} rows due to invalid images or short/empty descriptions.")
-        
-        final_columns = [
-            'article_id', 'prod_name', 'cleaned_description', 'product_group_name',
-            'graphical_appearance_name', 'colour_group_name', 'section_name',
-            'garment_group_name', 'image_path'
-        ]
-        final_columns = [col for col in final_columns if col in df.columns]
-        df_final = df[final_columns].copy()
-        
-        df_final.reset_index(drop=True, inplace=True)
-        
-        logger.info(f"Saving {len(df_final)} rows to {self.final_csv_path}")
-        df_final.to_csv(self.final_csv_path, index=False)
-        
-        if len(df_final) > 0:
-            print(f"\nSuccessfully prepared data for {len(df_final)} products.")
+        started = time.perf_counter()
+        tmp_path = f"{self.final_csv_path}.tmp"
+        rows_in, rows_out = 0, 0
+        # At most this many chunks are read ahead of the writer, which bounds memory
+        max_in_flight = self.workers * 2
+
+        logger.info(f"Starting chunked preparation with {self.workers} worker processes.")
+        with ProcessPoolExecutor(max_workers=self.workers) as executor, tqdm(desc="Preparing Articles", unit="rows") as progress:
+            pending = deque()
+
+            def write_oldest():
+                nonlocal rows_out
+                n_rows, future, reserved = pending.popleft()
+                prepared, entries = future.result()
+                self._write(prepared, tmp_path, first=not os.path.exists(tmp_path))
+                if entries:
+                    article_ids, versions, rows = zip(*entries)
+                    self.image_cache.commit(article_ids, rows, versions)
+                if reserved:
+                    committed = {row for _, _, row in entries}
+                    self.image_cache.release([row for row in reserved if row not in committed])
+                rows_out += len(prepared)
+                progress.update(n_rows)
+
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            for chunk in self._iter_chunks():
+                rows_in += len(chunk)
+                cache = self._cache_args(chunk)
+                reserved = [row for row, _ in cache['rows'].values()] if cache else []
+                pending.append((len(chunk), executor.submit(prepare_chunk, chunk, self.images_base_path, cache), reserved))
+                if len(pending) >= max_in_flight:
+                    write_oldest()
+            while pending:
+                write_oldest()
+        if self.image_cache is not None:
+            logger.info(f"Image cache at {self.image_cache.path} now holds {len(self.image_cache)} preprocessed images "
+                        f"({self.image_cache.free_rows} free rows to reuse).")
+            self.image_cache.close()
+
+        if not os.path.exists(tmp_path):
+            pd.DataFrame(columns=FINAL_COLUMNS).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.final_csv_path)
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Dropped {rows_in - rows_out} rows due to missing descriptions, invalid images or short/empty descriptions.")
+        logger.info(f"Saved {rows_out} rows to {self.final_csv_path} in {elapsed:.1f}s ({rows_in / max(elapsed, 1e-9):.0f} rows/s)")
+
+        if rows_out > 0:
+            print(f"\nSuccessfully prepared data for {rows_out} products.")
             print(f" Cleaned data saved to: {self.final_csv_path}")
         else:
             print(f"\nPipeline finished, but no data was saved. Please check the logs for errors.")
 
 
 if __name__ == '__main__':
-    DATA_DIRECTORY = 'data'
+    parser = argparse.ArgumentParser(description="Clean H&M article metadata and keep articles with a valid image.")
+    parser.add_argument("--data-dir", default="data", help="Directory with articles.csv and images/ (default: data).")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows of articles.csv per work unit (default: 10000).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--image-cache", default=None,
+                        help="Also write resized, center-cropped images to this packed cache (e.g. data/image_cache).")
+    parser.add_argument("--image-size", type=int, default=224, help="Side of the cached images (default: 224, CLIP's input).")
+    args = parser.parse_args()
+
+    DATA_DIRECTORY = args.data_dir
     OUTPUT_DIRECTORY = os.path.join(DATA_DIRECTORY, 'prepared')
-    
+
     if not os.path.exists(os.path.join(DATA_DIRECTORY, 'articles.csv')):
         logger.error(f"Dataset not found. Ensure 'articles.csv' is in '{DATA_DIRECTORY}/'")
     else:
-        preparer = HMDataPreparer(base_data_path=DATA_DIRECTORY, output_path=OUTPUT_DIRECTORY)
-        preparer.run()
\ No newline at end of file
+        preparer = HMDataPreparer(base_data_path=DATA_DIRECTORY, output_path=OUTPUT_DIRECTORY,
+                                  chunk_size=args.chunk_size, workers=args.workers,
+                                  image_cache_path=args.image_cache, image_size=args.image_size)
+        preparer.run()
@@ -2,18 +2,23 @@ import os
 import logging
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
+from src.core.vector_store import PINECONE_INDEX_NAME
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def setup_pinecone():
     load_dotenv()
+    backend = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+    if backend != "pinecone":
+        logging.info(f"VECTOR_STORE_BACKEND is '{backend}'; the local store is created by batch_index. Nothing to set up.")
+        return
     api_key = os.getenv("PINECONE_API_KEY")
     if not api_key:
         raise ValueError("PINECONE_API_KEY not found in .env file.")
 
     pc = Pinecone(api_key=api_key)
 
-    index_name = "multimodal-search"
+    index_name = PINECONE_INDEX_NAME
 
     if index_name in pc.list_indexes().names():
         logging.warning(f"Index '{index_name}' already exists. Skipping creation.")
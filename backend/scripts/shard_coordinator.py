@@ -0,0 +1,229 @@
+import os
+import time
+import queue
+import shutil
+import logging
+import multiprocessing as mp
+from dotenv import load_dotenv
+from tqdm.auto import tqdm
+from src.core.cache import IndexVersion
+from src.core.metrics import MetricsRegistry
+from src.core.vector_store import LocalVectorDelta, create_vector_store
+from scripts.es_index import EsBulkLoader
+from scripts.index_state import IndexState
+
+logger = logging.getLogger(__name__)
+
+
+def shard_path(path: str, index: int, count: int) -> str:
+    """data/index_state.sqlite -> data/index_state.shard-3-of-8.sqlite"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{index}-of-{count}{ext}"
+
+
+def _run_shard(indexer_cls, index, count, cpus, indexer_kwargs, run_kwargs, events):
+    """Entry point of one shard process: pins it to its cores, indexes the shard and reports back."""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    try:
+        indexer = indexer_cls(shard=(index, count), on_batch=lambda items, indexed: events.put(("batch", index, items, indexed)),
+                              **indexer_kwargs)
+        indexer.run(**run_kwargs)
+        stages = {labels["stage"]: (h.count, h.sum) for labels, h in indexer.metrics.series("stage_seconds")}
+        events.put(("done", index, stages))
+    except BaseException as e:
+        events.put(("failed", index, f"{type(e).__name__}: {e}"))
+        raise SystemExit(1)
+
+
+class ShardCoordinator:
+    """Indexes the catalog with one BatchIndexer process per shard of article_id hashes.
+
+    Every shard process loads its own model with `threads_per_shard` intra-op threads, and on
+    Linux it is pinned to its own cores, so shards don't fight over them. The coordinator
+    draws one progress bar from the batches the shards report. A shard that dies is
+    restarted up to `max_retries` times. Shards keep separate index state and embedding
+    stores. Because of that, incremental runs need the same shard count as the run before.
+    A shard only stages what it indexed; its state records it once the run has gone live.
+
+    The steps that must happen once also stay here: creating and swapping the
+    Elasticsearch bulk-load index, merging local vector store deltas, and publishing the
+    index version.
+    """
+
+    def __init__(self, shards: int, indexer_kwargs: dict, threads_per_shard=None, max_retries: int = 2,
+                 indexer_cls=None, metrics_path=None):
+        if indexer_cls is None:
+            from scripts.batch_index import BatchIndexer
+            indexer_cls = BatchIndexer
+        load_dotenv()
+        self.shards = shards
+        self.indexer_kwargs = dict(indexer_kwargs)
+        self.threads_per_shard = threads_per_shard or max(1, (os.cpu_count() or 1) // shards)
+        self.max_retries = max_retries
+        self.indexer_cls = indexer_cls
+        self.metrics = MetricsRegistry(prefix="indexer_")
+        self.metrics_path = metrics_path
+        self._context = mp.get_context("spawn")  # torch state doesn't survive fork()
+
+    def _cpus(self, index):
+        if not hasattr(os, "sched_getaffinity"):
+            return None
+        available = sorted(os.sched_getaffinity(0))
+        if len(available) < self.shards * self.threads_per_shard:
+            return None  # oversubscribed; let the scheduler place them
+        return set(available[index * self.threads_per_shard:(index + 1) * self.threads_per_shard])
+
+    def _shard_kwargs(self, index):
+        kwargs = dict(self.indexer_kwargs, num_threads=self.threads_per_shard, metrics_path=None)
+        kwargs["state_path"] = shard_path(kwargs.get("state_path", "data/index_state.sqlite"), index, self.shards)
+        if kwargs.get("store_root"):
+            kwargs["store_root"] = os.path.join(kwargs["store_root"], f"shard-{index}-of-{self.shards}")
+        kwargs["es_bulk_load"] = False
+        return kwargs
+
+    def _start(self, index, events, run_kwargs, es_index):
+        kwargs = dict(self._shard_kwargs(index), es_index=es_index)
+        process = self._context.Process(
+            target=_run_shard, name=f"index-shard-{index}",
+            args=(self.indexer_cls, index, self.shards, self._cpus(index), kwargs, run_kwargs, events),
+        )
+        process.start()
+        return process
+
+    def _count_products(self):
+        import psycopg2
+        conn = psycopg2.connect(host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT"), dbname=os.getenv("DB_NAME"),
+                                user=os.getenv("DB_USER"), password=os.getenv("DB_PASSWORD"))
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM products")
+                return cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+    def run(self, incremental=False, **run_kwargs):
+        run_kwargs = dict(run_kwargs, incremental=incremental)
+        start = time.perf_counter()
+        total = None if incremental else self._count_products()
+        es_loader = None
+        if self.indexer_kwargs.get("es_bulk_load") and not incremental:
+            from elasticsearch import Elasticsearch
+            es_loader = EsBulkLoader(Elasticsearch(os.getenv("ES_HOST", "http://localhost:9200")),
+                                     chunk_size=self.indexer_kwargs.get("es_chunk_size", 500),
+                                     workers=self.indexer_kwargs.get("es_workers", 4),
+                                     replicas=self.indexer_kwargs.get("es_replicas"),
+                                     keep_previous=self.indexer_kwargs.get("es_keep_previous", False))
+
+        logger.info(f"Indexing with {self.shards} shard processes, {self.threads_per_shard} threads each.")
+        events = self._context.Queue()
+        processes = {}
+        attempts = {index: 0 for index in range(self.shards)}
+        progress_by_shard = {index: 0 for index in range(self.shards)}
+        indexed_by_shard = {index: 0 for index in range(self.shards)}
+        done, errors = {}, {}
+
+        def handle(event):
+            kind, index = event[0], event[1]
+            if kind == "batch":
+                progress_by_shard[index] += event[2]
+                indexed_by_shard[index] += event[3]
+                progress.update(event[2])
+            elif kind == "done":
+                done[index] = event[2]
+            else:
+                errors[index] = event[2]
+
+        try:
+            if es_loader is not None:
+                es_loader.create()
+            for index in range(self.shards):
+                processes[index] = self._start(index, events, run_kwargs, es_loader and es_loader.index)
+            with tqdm(total=total, desc="Indexing (sharded)", unit="items") as progress:
+                while processes:
+                    try:
+                        handle(events.get(timeout=0.5))
+                    except queue.Empty:
+                        pass
+                    for index, process in list(processes.items()):
+                        if process.is_alive():
+                            continue
+                        process.join()
+                        # Everything the shard sent before exiting is in the queue by now
+                        while True:
+                            try:
+                                handle(events.get_nowait())
+                            except queue.Empty:
+                                break
+                        del processes[index]
+                        if index in done:
+                            continue
+                        reason = errors.pop(index, f"exit code {process.exitcode}")
+                        self.metrics.inc("shard_failures_total")
+                        if attempts[index] < self.max_retries:
+                            attempts[index] += 1
+                            self.metrics.inc("shard_retries_total")
+                            logger.warning(f"Shard {index} failed ({reason}); retry {attempts[index]}/{self.max_retries}.")
+                            # A retried shard starts over, so its earlier progress doesn't count
+                            progress.update(-progress_by_shard[index])
+                            progress_by_shard[index] = indexed_by_shard[index] = 0
+                            processes[index] = self._start(index, events, run_kwargs, es_loader and es_loader.index)
+                        else:
+                            # The run can't complete without this shard, so stop the others too
+                            raise RuntimeError(f"Shard {index} failed after {attempts[index] + 1} attempts: {reason}")
+            self._finish(es_loader)
+        except BaseException:
+            for process in processes.values():
+                process.terminate()
+            if es_loader is not None:
+                es_loader.abort()
+            raise
+
+        elapsed = time.perf_counter() - start
+        items = sum(progress_by_shard.values())
+        logger.info(f"Sharded indexing finished: {items} items ({sum(indexed_by_shard.values())} indexed) "
+                    f"in {elapsed:.1f}s ({items / max(elapsed, 1e-9):.1f} items/s), {sum(attempts.values())} retries.")
+        self._report(done, progress_by_shard, indexed_by_shard)
+
+    def _finish(self, es_loader):
+        deltas = []
+        if os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower() == "local":
+            base = create_vector_store()
+            deltas = [LocalVectorDelta.shard_path(base, index, self.shards) for index in range(self.shards)]
+            merged = sum(LocalVectorDelta.merge_into(path, base) for path in deltas)
+            base.save()
+            logger.info(f"Merged {merged} vectors from {self.shards} shard deltas into {base.path}.")
+            logger.info(f"Local vector store search report: {base.evaluate()}")
+        if es_loader is not None:
+            es_loader.finalize()
+        # Only now is every shard's work live, so only now may their states record it as indexed
+        for index in range(self.shards):
+            state = IndexState(self._shard_kwargs(index)["state_path"])
+            try:
+                state.apply_pending()
+            finally:
+                state.close()
+        # The deltas are only needed until every shard's state has committed what they hold
+        for path in deltas:
+            shutil.rmtree(path, ignore_errors=True)
+        version = IndexVersion(os.getenv("INDEX_VERSION_PATH", "data/index_version")).publish()
+        logger.info(f"Published index version {version}.")
+
+    def _report(self, done, progress_by_shard, indexed_by_shard):
+        for index in sorted(done):
+            self.metrics.inc("items_total", progress_by_shard[index], shard=index)
+            self.metrics.inc("indexed_total", indexed_by_shard[index], shard=index)
+            for stage, (calls, seconds) in done[index].items():
+                self.metrics.inc("stage_seconds_total", seconds, stage=stage)
+                self.metrics.inc("stage_calls_total", calls, stage=stage)
+        logger.info("Stage time summed over shards:")
+        for stage in sorted({stage for stages in done.values() for stage in stages}):
+            seconds = self.metrics.counter_value("stage_seconds_total", stage=stage)
+            calls = int(self.metrics.counter_value("stage_calls_total", stage=stage))
+            logger.info(f"{stage:<15} calls={calls:<8} total={seconds:8.2f}s")
+        if self.metrics_path:
+            os.makedirs(os.path.dirname(self.metrics_path) or ".", exist_ok=True)
+            with open(f"{self.metrics_path}.tmp", "w") as f:
+                f.write(self.metrics.render())
+            os.replace(f"{self.metrics_path}.tmp", self.metrics_path)
+            logger.info(f"Wrote indexer metrics to {self.metrics_path}")
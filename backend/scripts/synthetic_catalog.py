@@ -0,0 +1,105 @@
+import os
+import random
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from PIL import Image, ImageDraw
+from tqdm.auto import tqdm
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Same columns as prepare_hm_data.py writes, so the output can also go through ingest_data.py
+COLUMNS = [
+    'article_id', 'prod_name', 'cleaned_description', 'product_group_name',
+    'graphical_appearance_name', 'colour_group_name', 'section_name',
+    'garment_group_name', 'image_path'
+]
+
+COLOURS = {
+    "black": (20, 20, 20), "white": (240, 240, 240), "red": (200, 30, 40), "navy": (20, 30, 90),
+    "beige": (220, 200, 160), "green": (40, 130, 60), "pink": (240, 150, 180), "grey": (130, 130, 130),
+    "yellow": (240, 210, 50), "light blue": (150, 190, 230),
+}
+GARMENTS = {
+    "Garment Upper body": ["t-shirt", "blouse", "sweater", "hoodie", "shirt", "cardigan"],
+    "Garment Lower body": ["trousers", "jeans", "skirt", "shorts", "leggings"],
+    "Garment Full body": ["dress", "jumpsuit", "dungarees"],
+    "Accessories": ["scarf", "hat", "belt", "bag"],
+    "Shoes": ["sneakers", "boots", "sandals"],
+}
+SECTIONS = ["Womens Everyday Collection", "Divided Collection", "Mens Casual", "Kids Girl", "Ladies Denim", "H&M+"]
+APPEARANCES = ["Solid", "Stripe", "Melange", "All over pattern", "Denim"]
+FITS = ["relaxed fit", "slim fit", "regular fit", "oversized", "cropped"]
+MATERIALS = ["soft cotton jersey", "organic cotton", "ribbed knit", "washed denim", "woven fabric", "recycled polyester"]
+DETAILS = ["a round neckline", "long sleeves", "short sleeves", "a concealed zip", "side pockets",
+           "an elasticated waist", "a v-neck", "dropped shoulders", "buttons down the front"]
+
+
+def _product(index: int, rng: random.Random, images_dir: str) -> dict:
+    article_id = f"{100000000 + index * 7919 % 900000000:010d}"
+    group = rng.choice(list(GARMENTS))
+    garment = rng.choice(GARMENTS[group])
+    colour = rng.choice(list(COLOURS))
+    appearance = rng.choice(APPEARANCES)
+    description = (f"{rng.choice(FITS)} {garment} in {rng.choice(MATERIALS)} with {rng.choice(DETAILS)} "
+                   f"and {rng.choice(DETAILS)}. {appearance.lower()} {colour} design.")
+    return {
+        "article_id": article_id,
+        "prod_name": f"{colour.title()} {garment.title()} {index % 97}",
+        "cleaned_description": description,
+        "product_group_name": group,
+        "graphical_appearance_name": appearance,
+        "colour_group_name": colour.title(),
+        "section_name": rng.choice(SECTIONS),
+        "garment_group_name": garment.title(),
+        "image_path": os.path.join(images_dir, article_id[:3], f"{article_id}.jpg"),
+    }
+
+
+def _draw_image(product: dict, size: int, seed: int):
+    """A JPEG with the product colour as background and a few shapes, roughly H&M-sized when size=1000."""
+    rng = random.Random(seed)
+    base = COLOURS[product["colour_group_name"].lower()]
+    image = Image.new("RGB", (size, int(size * 1.5)), base)
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(3, 8)):
+        x0, y0 = rng.randrange(size), rng.randrange(int(size * 1.5))
+        x1, y1 = x0 + rng.randint(size // 10, size // 2), y0 + rng.randint(size // 10, size // 2)
+        fill = tuple(max(0, min(255, c + rng.randint(-60, 60))) for c in base)
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)([x0, y0, x1, y1], fill=fill)
+    os.makedirs(os.path.dirname(product["image_path"]), exist_ok=True)
+    image.save(product["image_path"], format="JPEG", quality=85)
+
+
+def generate_catalog(output_dir: str, n_products: int, image_size: int = 256, seed: int = 0, workers: int = 8) -> str:
+    """Writes `n_products` synthetic rows and their JPEGs under `output_dir`; returns the CSV path."""
+    images_dir = os.path.join(output_dir, "images")
+    csv_path = os.path.join(output_dir, "prepared_hm_products.csv")
+    rng = random.Random(seed)
+    products = [_product(i, rng, images_dir) for i in range(n_products)]
+
+    logger.info(f"Generating {n_products} synthetic products ({image_size}px JPEGs) in {output_dir}...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # PIL releases the GIL while encoding, so threads are enough here
+        list(tqdm(executor.map(lambda ip: _draw_image(ip[1], image_size, seed + ip[0]), enumerate(products)),
+                  total=n_products, desc="Generating Images"))
+
+    pd.DataFrame(products, columns=COLUMNS).to_csv(csv_path, index=False)
+    logger.info(f"Saved synthetic catalog to {csv_path}")
+    return csv_path
+
+
+def load_catalog(csv_path: str) -> pd.DataFrame:
+    return pd.read_csv(csv_path, dtype={"article_id": str}, keep_default_na=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic product catalog (CSV plus JPEGs) for benchmarks.")
+    parser.add_argument("--size", type=int, default=1000, help="Number of products (default: 1000).")
+    parser.add_argument("--output", default="data/synthetic", help="Output directory (default: data/synthetic).")
+    parser.add_argument("--image-size", type=int, default=256, help="Image width in pixels; height is 1.5x (default: 256).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_catalog(args.output, args.size, image_size=args.image_size, seed=args.seed)
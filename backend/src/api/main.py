@@ -1,23 +1,200 @@
 import os
 import io
+import json
+import time
+import asyncio
+import hashlib
 import logging
-from typing import Optional, List, Dict
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import TYPE_CHECKING, Optional, List, Dict, Tuple
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from PIL import Image
 import numpy as np
-import psycopg2
 from dotenv import load_dotenv
-from pinecone import Pinecone
 from elasticsearch import Elasticsearch
-from src.core.embedding import EmbeddingModel
+from src.core.vector_store import LocalVectorStore, create_vector_store
+from src.core.batcher import EmbeddingBatcher
+from src.core.cache import IndexVersion, LRUCache, TTLCache
+from src.core.db import PostgresPool
+from src.core.metrics import COUNT_BUCKETS, MetricsRegistry, Trace
+from src.core.profiler import SamplingProfiler
+
+if TYPE_CHECKING:
+    from src.core.embedding import EmbeddingModel
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+# CPU-bound CLIP work gets its own small pool so it can't starve the I/O-bound backend calls
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
+BACKEND_WORKERS = int(os.getenv("BACKEND_WORKERS", "16"))
+VECTOR_QUERY_TIMEOUT = float(os.getenv("VECTOR_QUERY_TIMEOUT", "1.0"))
+ES_QUERY_TIMEOUT = float(os.getenv("ES_QUERY_TIMEOUT", "1.0"))
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "2.0"))
+# A failed startup (model hub timeout, a backend not accepting connections yet) is retried
+# with exponential backoff instead of leaving the process up but unable to serve
+STARTUP_RETRY_SECONDS = float(os.getenv("STARTUP_RETRY_SECONDS", "1.0"))
+STARTUP_RETRY_MAX_SECONDS = float(os.getenv("STARTUP_RETRY_MAX_SECONDS", "30.0"))
+# /search/batch works through its queries in chunks: one embedding call, one _msearch and one
+# hydration query per chunk, with a few chunks in flight and each streamed back as it finishes
+BATCH_SEARCH_MAX_QUERIES = int(os.getenv("BATCH_SEARCH_MAX_QUERIES", "1000"))
+BATCH_SEARCH_CHUNK_SIZE = int(os.getenv("BATCH_SEARCH_CHUNK_SIZE", "64"))
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "2"))
+BATCH_QUERY_TIMEOUT = float(os.getenv("BATCH_QUERY_TIMEOUT", "5.0"))
+# Fields /search/ can filter on; both retrievers apply the filters, and facet counts come
+# from a terms aggregation on their .keyword subfields in the same Elasticsearch request
+FACET_FIELDS = ("product_group_name", "colour_group_name", "section_name")
+FACET_SIZE = int(os.getenv("FACET_SIZE", "20"))
+# The /debug/profiler endpoints expose stack traces, so they stay off unless explicitly enabled
+PROFILER_ENDPOINTS = os.getenv("PROFILER_ENDPOINTS", "false").lower() in ("1", "true", "yes")
+
+# Query embeddings only depend on the model, so they survive re-indexing; fused result
+# lists depend on the index and are dropped whenever the indexer publishes a new version.
+embedding_cache = LRUCache(int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000")))
+result_cache = TTLCache(int(os.getenv("RESULT_CACHE_SIZE", "10000")), ttl=float(os.getenv("RESULT_CACHE_TTL", "300")))
+# Product rows only change on re-ingest, so they live long and are also flushed with the index version
+product_cache = TTLCache(int(os.getenv("PRODUCT_CACHE_SIZE", "50000")), ttl=float(os.getenv("PRODUCT_CACHE_TTL", "3600")))
+index_version = IndexVersion(os.getenv("INDEX_VERSION_PATH", "data/index_version"))
+_cached_index_version = None
+_reload_task: Optional[asyncio.Task] = None
+
+metrics = MetricsRegistry()
+metrics.describe("http_requests_total", "HTTP requests by route, method and status code.")
+metrics.describe("http_request_duration_seconds", "End-to-end HTTP request latency by route.")
+metrics.describe("search_stage_seconds", "Time spent in each stage of /search/.")
+metrics.describe("batch_search_stage_seconds", "Time spent in each stage of a /search/batch chunk.")
+metrics.describe("batch_search_queries_total", "Queries answered by /search/batch, by outcome.")
+metrics.describe("search_candidates", "Result IDs returned per search by each retriever and after fusion.")
+metrics.describe("search_backend_errors_total", "Backend calls that raised and were answered with an empty list.")
+metrics.describe("search_backend_timeouts_total", "Backend calls abandoned after their timeout.")
+profiler = SamplingProfiler()
+
+embedding_executor = ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS, thread_name_prefix="embed")
+backend_executor = ThreadPoolExecutor(max_workers=BACKEND_WORKERS, thread_name_prefix="backend")
+
+# Clients are created by the lifespan handler, not at import time
+embedder: Optional["EmbeddingModel"] = None
+embedding_batcher: Optional[EmbeddingBatcher] = None
+vector_store = None
+es_client: Optional[Elasticsearch] = None
+pg_pool: Optional[PostgresPool] = None
+_startup_task: Optional[asyncio.Task] = None
+_startup_attempt: Optional[asyncio.Task] = None
+startup_timings: Dict[str, float] = {}
+
+
+def load_embedder() -> "EmbeddingModel":
+    # Imported here so torch is only loaded by a server that actually runs CLIP
+    from src.core.embedding import EmbeddingModel
+    return EmbeddingModel(
+        os.getenv("EMBEDDING_MODEL_NAME", "clip-ViT-B-32"),
+        snapshot_path=os.getenv("EMBEDDING_MODEL_SNAPSHOT") or None,
+        backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+        num_threads=int(os.getenv("EMBEDDING_THREADS", "0")) or None,
+    )
+
+
+def close_backends():
+    if pg_pool is not None:
+        pg_pool.close()
+    if es_client is not None:
+        es_client.close()
+
+
+def connect_backends():
+    global vector_store, es_client, pg_pool
+    # Drop whatever a failed earlier startup attempt left open
+    close_backends()
+    # Vector store (Pinecone or local, picked by VECTOR_STORE_BACKEND)
+    vector_store = create_vector_store()
+    # Elasticsearch
+    es_client = Elasticsearch(os.getenv("ES_HOST", "http://localhost:9200"))
+    # PostgreSQL
+    pg_pool = PostgresPool(
+        minconn=int(os.getenv("DB_POOL_MIN", "1")),
+        maxconn=int(os.getenv("DB_POOL_MAX", str(BACKEND_WORKERS))),
+    )
+
+
+async def timed(name: str, executor, fn):
+    start = time.perf_counter()
+    result = await run_in_executor(executor, fn)
+    startup_timings[f"{name}_seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def initialize():
+    global embedder, embedding_batcher
+    # The model load and the client connections don't depend on each other. Both are
+    # awaited even when one fails, so a retry never races a connect still in flight,
+    # and a model that already loaded is kept for the next attempt.
+    model, connected = await asyncio.gather(
+        timed("model_load", embedding_executor, load_embedder) if embedder is None else asyncio.sleep(0, result=embedder),
+        timed("backend_connect", backend_executor, connect_backends),
+        return_exceptions=True,
+    )
+    if not isinstance(model, BaseException):
+        embedder = model
+    for result in (model, connected):
+        if isinstance(result, BaseException):
+            raise result
+    embedding_batcher = EmbeddingBatcher(
+        embedder, embedding_executor, max_batch_size=EMBED_MAX_BATCH_SIZE, max_wait_ms=EMBED_BATCH_WINDOW_MS
+    )
+    await timed("warmup", embedding_executor, embedder.warmup)
+
+
+async def start_with_retries():
+    """Retries `initialize` with exponential backoff until it succeeds; `_startup_attempt` is the current try."""
+    global _startup_attempt
+    started = time.perf_counter()
+    attempt, delay = 1, STARTUP_RETRY_SECONDS
+    while True:
+        try:
+            await _startup_attempt
+            break
+        except Exception as e:
+            logger.error(f"Startup attempt {attempt} failed: {e}. Retrying in {delay:.1f}s.")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, STARTUP_RETRY_MAX_SECONDS)
+        attempt += 1
+        _startup_attempt = asyncio.create_task(initialize())
+    startup_timings["startup_attempts"] = attempt
+    startup_timings["cold_start_seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"All clients initialized and model warm. Startup timings: {startup_timings}")
+
+
+async def wait_until_started():
+    """Requests that arrive during startup wait for the current attempt instead of failing."""
+    try:
+        await asyncio.shield(_startup_attempt)
+    except Exception:
+        raise HTTPException(status_code=503, detail="Search service is starting; the last startup attempt failed and is being retried.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _startup_task, _startup_attempt
+    # Start loading in the background so the server accepts connections (and /ready) immediately
+    _startup_attempt = asyncio.create_task(initialize())
+    _startup_task = asyncio.create_task(start_with_retries())
+    yield
+    _startup_task.cancel()
+    _startup_attempt.cancel()
+    close_backends()
+    embedding_executor.shutdown(wait=False)
+    backend_executor.shutdown(wait=False)
+
+
 # Initialize the FastAPI app
-app = FastAPI(title="Multimodal Search API")
+app = FastAPI(title="Multimodal Search API", lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",
@@ -30,58 +207,114 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
-# Initialize clients for Pinecone, Elasticsearch, and PostgreSQL
-try:
-    embedder = EmbeddingModel()
-    
-    # Pinecone
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    pinecone_index = pc.Index("multimodal-search")
 
-    # Elasticsearch
-    es_client = Elasticsearch(os.getenv("ES_HOST", "http://localhost:9200"))
-
-    # PostgreSQL 
-    pg_conn = psycopg2.connect(
-        host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT"),
-        dbname=os.getenv("DB_NAME"), user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD")
-    )
-    logger.info("All clients initialized successfully.")
-except Exception as e:
-    logger.error(f"Failed to initialize clients during startup: {e}")
-    raise
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not the raw URL, so the number of series stays bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.inc("http_requests_total", route=route, method=request.method, status=status)
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - start, route=route)
 
 # Helper Functions
-def query_pinecone(query_vector, top_k=20) -> List[str]:
+def query_vector_store(query_vector, top_k=20, filters=None) -> List[str]:
     try:
-        results = pinecone_index.query(vector=query_vector, top_k=top_k, include_metadata=False)
-        return [match['id'] for match in results['matches']]
+        return vector_store.query(query_vector, top_k=top_k, filters=filters)
     except Exception as e:
-        logger.error(f"Pinecone query failed: {e}")
+        logger.error(f"Vector store query failed: {e}")
+        metrics.inc("search_backend_errors_total", backend="vector_store")
         return []
 
-def query_elasticsearch(text_query, top_k=20) -> List[str]:
-    if not text_query:
-        return []
+def query_vector_store_batch(query_vectors, top_k=20) -> List[List[str]]:
+    try:
+        return vector_store.query_batch(query_vectors, top_k=top_k)
+    except Exception as e:
+        logger.error(f"Vector store batch query failed: {e}")
+        metrics.inc("search_backend_errors_total", backend="vector_store")
+        return [[] for _ in query_vectors]
+
+def text_match_query(text_query: str) -> Dict:
+    return {
+        "multi_match": {
+            "query": text_query,
+            "fields": ["prod_name", "product_group_name", "section_name"],
+            "fuzziness": "AUTO"
+        }
+    }
+
+def filtered_query(text_query: Optional[str], filters: Optional[Dict[str, List[str]]]) -> Dict:
+    """The text match, or every document for an image-only search, restricted to `filters`.
+
+    Filters go in a bool filter context, so they aren't scored and their results can be cached.
+    """
+    query = text_match_query(text_query) if text_query else {"match_all": {}}
+    if not filters:
+        return query
+    return {"bool": {
+        "must": query,
+        "filter": [{"terms": {f"{field}.keyword": values}} for field, values in filters.items()],
+    }}
+
+def query_elasticsearch(text_query, top_k=20, filters=None, facets=False) -> Tuple[List[str], Optional[Dict]]:
+    """Returns the matching IDs and, with `facets`, value counts over all matches for each facet field.
+
+    Without a text query nothing is ranked, but facets are still counted over the filtered catalog.
+    """
+    if not text_query and not facets:
+        return [], None
     try:
-        response = es_client.search(
+        response = es_client.options(request_timeout=ES_QUERY_TIMEOUT).search(
             index="products_metadata",
-            size=top_k,
-            query={
-                "multi_match": {
-                    "query": text_query,
-                    "fields": ["prod_name", "product_group_name", "section_name"],
-                    "fuzziness": "AUTO"
-                }
-            }
+            size=top_k if text_query else 0,
+            query=filtered_query(text_query, filters),
+            aggs={field: {"terms": {"field": f"{field}.keyword", "size": FACET_SIZE}} for field in FACET_FIELDS}
+            if facets else None,
         )
-        return [hit['_id'] for hit in response['hits']['hits']]
     except Exception as e:
         logger.error(f"Elasticsearch query failed: {e}")
-        return []
+        metrics.inc("search_backend_errors_total", backend="elasticsearch")
+        return [], None
+    facet_counts = None
+    if facets:
+        facet_counts = {
+            field: [{"value": bucket['key'], "count": bucket['doc_count']}
+                    for bucket in response['aggregations'][field]['buckets']]
+            for field in FACET_FIELDS
+        }
+    return [hit['_id'] for hit in response['hits']['hits']], facet_counts
+
+def query_elasticsearch_batch(text_queries: List[Optional[str]], top_k=20) -> List[List[str]]:
+    """Runs every non-empty text query in one _msearch round trip; a failed sub-search yields an empty list."""
+    results = [[] for _ in text_queries]
+    todo = [i for i, text in enumerate(text_queries) if text]
+    if not todo:
+        return results
+    searches = []
+    for i in todo:
+        searches.append({"index": "products_metadata"})
+        searches.append({"size": top_k, "query": text_match_query(text_queries[i])})
+    try:
+        response = es_client.options(request_timeout=BATCH_QUERY_TIMEOUT).msearch(searches=searches)
+    except Exception as e:
+        logger.error(f"Elasticsearch msearch failed: {e}")
+        metrics.inc("search_backend_errors_total", backend="elasticsearch")
+        return results
+    for i, item in zip(todo, response['responses']):
+        if 'error' in item:
+            logger.error(f"Elasticsearch msearch item failed: {item['error']}")
+            metrics.inc("search_backend_errors_total", backend="elasticsearch")
+            continue
+        results[i] = [hit['_id'] for hit in item['hits']['hits']]
+    return results
 
 def reciprocal_rank_fusion(ranked_lists: List[List[str]], k=60) -> List[str]:
     scores = {}
@@ -96,62 +329,490 @@ def reciprocal_rank_fusion(ranked_lists: List[List[str]], k=60) -> List[str]:
     return [item_id for item_id, score in sorted_items]
 
 
+def batch_reciprocal_rank_fusion(batch: List[List[List[str]]], k=60, top_k: Optional[int] = None) -> List[List[str]]:
+    """reciprocal_rank_fusion for many queries at once, with identical scores and tie order.
+
+    Every (query, id) pair becomes one group; scores are a weighted bincount and one
+    lexsort orders all queries by score, then by first appearance.
+    """
+    query_idx, ids, ranks = [], [], []
+    for q, ranked_lists in enumerate(batch):
+        for ranked_list in ranked_lists:
+            query_idx.extend([q] * len(ranked_list))
+            ids.extend(ranked_list)
+            ranks.append(np.arange(1, len(ranked_list) + 1))
+    if not ids:
+        return [[] for _ in batch]
+
+    ids = np.asarray(ids, dtype=str)
+    id_values, id_codes = np.unique(ids, return_inverse=True)
+    pairs = np.asarray(query_idx, dtype=np.int64) * len(id_values) + id_codes
+    groups, first_seen, group_of = np.unique(pairs, return_index=True, return_inverse=True)
+    scores = np.bincount(group_of, weights=1.0 / (k + np.concatenate(ranks)))
+    group_query = groups // len(id_values)
+    order = np.lexsort((first_seen, -scores, group_query))
+
+    ordered_ids = ids[first_seen[order]]
+    bounds = np.searchsorted(group_query[order], np.arange(len(batch) + 1))
+    return [ordered_ids[bounds[q]:bounds[q + 1]][:top_k].tolist() for q in range(len(batch))]
+
+
 def fetch_product_details_from_postgres(article_ids: List[str]) -> List[Dict]:
     if not article_ids:
         return []
     
-    query = "SELECT article_id, prod_name, cleaned_description, image_path FROM products WHERE article_id = ANY(%s)"
+    product_map = {}
+    misses = []
+    for aid in article_ids:
+        product = product_cache.get(str(aid))
+        if product is None:
+            misses.append(str(aid))
+        else:
+            product_map[str(aid)] = product
+
+    if misses:
+        query = "SELECT article_id, prod_name, cleaned_description, image_path FROM products WHERE article_id = ANY(%s)"
+
+        def fetch(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(query, (misses,))
+                columns = [desc[0] for desc in cursor.description]
+                return [dict(zip(columns, p)) for p in cursor.fetchall()]
+
+        try:
+            for product in pg_pool.run(fetch):
+                product_map[str(product['article_id'])] = product
+                product_cache.put(str(product['article_id']), product)
+        except Exception as e:
+            logger.error(f"PostgreSQL fetch failed: {e}")
+            metrics.inc("search_backend_errors_total", backend="postgres")
+            if not product_map:
+                return []
+
+    return [product_map[str(aid)] for aid in article_ids if str(aid) in product_map]
+
+async def run_in_executor(executor, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+
+async def run_with_timeout(backend: str, timeout: float, fn, *args, **kwargs) -> Optional[List[str]]:
+    """Runs a backend query off the event loop; returns None instead of stalling the request if it is too slow."""
+    try:
+        return await asyncio.wait_for(run_in_executor(backend_executor, fn, *args, **kwargs), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"{backend} query timed out after {timeout}s; ranking with the remaining backends.")
+        metrics.inc("search_backend_timeouts_total", backend=backend)
+        return None
+
+
+def normalize_query(text_query: Optional[str]) -> str:
+    return " ".join(text_query.lower().split()) if text_query else ""
+
+
+async def reload_vector_store():
+    """Opens the new local store files off the event loop and swaps the store in once they're loaded.
+
+    Searches keep using the previous store until then, without waiting on its lock.
+    """
+    global vector_store
+    started = time.perf_counter()
     try:
-        with pg_conn.cursor() as cursor:
-            cursor.execute(query, (article_ids,))
-            products = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
-            
-            product_map = {str(p[0]): dict(zip(columns, p)) for p in products}
-            ordered_products = [product_map[str(aid)] for aid in article_ids if str(aid) in product_map]
-            return ordered_products
-            
+        store = await run_in_executor(backend_executor, create_vector_store, "local")
     except Exception as e:
-        logger.error(f"PostgreSQL fetch failed: {e}")
-        pg_conn.rollback()
-        return []
+        logger.error(f"Reloading the local vector store failed; still serving the previous one: {e}")
+        return
+    vector_store = store
+    # Drop rankings computed from the previous store while this one loaded
+    result_cache.clear()
+    logger.info(f"Swapped in the reloaded local vector store in {time.perf_counter() - started:.2f}s.")
+
+
+def check_index_version():
+    global _cached_index_version, _reload_task
+    version = index_version.current()
+    if version != _cached_index_version:
+        if _cached_index_version is not None:
+            logger.info(f"Index version changed to {version}; clearing the search result cache.")
+            if isinstance(vector_store, LocalVectorStore):
+                # A newer version supersedes a reload that is still loading
+                if _reload_task is not None:
+                    _reload_task.cancel()
+                _reload_task = asyncio.create_task(reload_vector_store())
+        result_cache.clear()
+        product_cache.clear()
+        _cached_index_version = version
+
+
+async def cached_embedding(key, compute):
+    embedding = embedding_cache.get(key)
+    if embedding is None:
+        embedding = await compute()
+        if embedding is not None:
+            embedding_cache.put(key, embedding)
+    return embedding
+
+
+def decode_image(image_bytes: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(image_bytes)).convert('RGB')
+
+
+async def embed_image_bytes(image_bytes: bytes):
+    try:
+        image = await run_in_executor(embedding_executor, decode_image, image_bytes)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid or corrupt image file: {e}")
+    return await embedding_batcher.embed_image(image)
+
+
+async def embed_query(text_query: Optional[str], image_bytes: Optional[bytes], image_hash: Optional[str]):
+    normalized = normalize_query(text_query)
+    # Both lanes of the batcher run concurrently, so a hybrid query waits for one window, not two
+    return await asyncio.gather(
+        cached_embedding(("text", normalized), lambda: embedding_batcher.embed_text(normalized))
+        if normalized else asyncio.sleep(0, result=None),
+        cached_embedding(("image", image_hash), lambda: embed_image_bytes(image_bytes))
+        if image_bytes is not None else asyncio.sleep(0, result=None),
+    )
 
 # API endpoint
 
 @app.post("/search/", summary="Perform a multimodal hybrid search")
 async def search(
+    response: Response,
     text_query: Optional[str] = Form(None),
     image_query: Optional[UploadFile] = File(None),
-    top_k: int = Form(10)
+    top_k: int = Form(10),
+    product_group_name: Optional[List[str]] = Form(None),
+    colour_group_name: Optional[List[str]] = Form(None),
+    section_name: Optional[List[str]] = Form(None),
+    facets: bool = Form(False, description="Also return value counts for each facet field.")
 ):
     if not text_query and not image_query:
         raise HTTPException(status_code=400, detail="Provide a text query, an image or both.")
+    # Repeat a field to allow several values; different fields must all match
+    filters = {}
+    for field, values in zip(FACET_FIELDS, (product_group_name, colour_group_name, section_name)):
+        values = sorted({value.strip() for value in values or [] if value and value.strip()})
+        if values:
+            filters[field] = values
+    filters_key = tuple((field, tuple(values)) for field, values in filters.items())
 
+    request_start = time.perf_counter()
+    trace = Trace(metrics, "search_stage_seconds")
+    await trace.timed("startup_wait", wait_until_started())
     query_vector = None
-    text_emb = embedder.embed_text(text_query) if text_query else None
-    
-    image_emb = None
-    if image_query:
-        try:
-            image_bytes = await image_query.read()
-            image = Image.open(io.BytesIO(image_bytes))
-            image_emb = embedder.model.encode(image, convert_to_numpy=True, show_progress_bar=False)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid or corrupt image file: {e}")
+    image_bytes = await image_query.read() if image_query else None
+    image_hash = hashlib.sha256(image_bytes).hexdigest() if image_bytes is not None else None
+
+    with trace.stage("result_cache"):
+        check_index_version()
+        result_key = (normalize_query(text_query), image_hash, top_k, filters_key)
+        final_ids = result_cache.get(result_key)
+        # Facet counts only depend on the text and the filters
+        facet_key = ("facets", normalize_query(text_query), filters_key)
+        facet_counts = result_cache.get(facet_key) if facets else None
+    if final_ids is not None and (facet_counts is not None or not facets):
+        final_products = await trace.timed(
+            "hydrate", run_in_executor(backend_executor, fetch_product_details_from_postgres, final_ids)
+        )
+        response.headers["Server-Timing"] = trace.server_timing()
+        return {"results": final_products, "facets": facet_counts} if facets else {"results": final_products}
+
+    text_emb, image_emb = await trace.timed("embed", embed_query(text_query, image_bytes, image_hash))
 
     if text_emb is not None and image_emb is not None:
         query_vector = ((0.5 * text_emb) + (0.5 * image_emb)).tolist()
     elif image_emb is not None:
         query_vector = image_emb.tolist()
-    else: 
+    elif text_emb is not None:
         query_vector = text_emb.tolist()
     
     if query_vector is None:
         raise HTTPException(status_code=500, detail="Could not generate a query vector.")
 
-    pinecone_results = query_pinecone(query_vector, top_k=50)
-    es_results = query_elasticsearch(text_query, top_k=50)
-    final_ranked_ids = reciprocal_rank_fusion([pinecone_results, es_results])
-    final_products = fetch_product_details_from_postgres(final_ranked_ids[:top_k])
-    
-    return {"results": final_products}
\ No newline at end of file
+    # Both retrievers apply the filters themselves, so all 50 candidates of each can qualify
+    vector_results, es_response = await asyncio.gather(
+        trace.timed("vector_store", run_with_timeout(
+            "vector_store", VECTOR_QUERY_TIMEOUT, query_vector_store, query_vector, top_k=50, filters=filters or None)),
+        trace.timed("elasticsearch", run_with_timeout(
+            "elasticsearch", ES_QUERY_TIMEOUT, query_elasticsearch, text_query, top_k=50,
+            filters=filters or None, facets=facets)),
+    )
+    es_results, facet_counts = es_response if es_response is not None else (None, None)
+    with trace.stage("fusion"):
+        final_ids = reciprocal_rank_fusion([vector_results or [], es_results or []])[:top_k]
+    metrics.observe("search_candidates", len(vector_results or []), buckets=COUNT_BUCKETS, source="vector_store")
+    metrics.observe("search_candidates", len(es_results or []), buckets=COUNT_BUCKETS, source="elasticsearch")
+    metrics.observe("search_candidates", len(final_ids), buckets=COUNT_BUCKETS, source="fused")
+    # Don't pin a degraded ranking in the cache when a backend timed out
+    if vector_results is not None and es_results is not None:
+        result_cache.put(result_key, final_ids)
+    if facet_counts is not None:
+        result_cache.put(facet_key, facet_counts)
+    final_products = await trace.timed(
+        "hydrate", run_in_executor(backend_executor, fetch_product_details_from_postgres, final_ids)
+    )
+    response.headers["Server-Timing"] = trace.server_timing()
+
+    if "first_query_ms" not in startup_timings:
+        startup_timings["first_query_ms"] = round((time.perf_counter() - request_start) * 1000, 1)
+        logger.info(f"First search served in {startup_timings['first_query_ms']}ms.")
+    return {"results": final_products, "facets": facet_counts} if facets else {"results": final_products}
+
+
+def embed_batch(texts: List[str], images: List[bytes]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """One embed_texts and one embed_loaded_images call for a whole chunk; corrupt images come back masked out."""
+    decoded = []
+    for image_bytes in images:
+        try:
+            decoded.append(decode_image(image_bytes))
+        except Exception as e:
+            logger.warning(f"Skipping an invalid image in a batch search: {e}")
+            decoded.append(None)
+    text_embs, text_mask = embedder.embed_texts(texts)
+    image_embs, image_mask = embedder.embed_loaded_images(decoded)
+    return text_embs, text_mask, image_embs, image_mask
+
+
+async def embed_queries(queries: List[Tuple[str, Optional[str], Optional[bytes]]]) -> List[Optional[np.ndarray]]:
+    """Query vectors for (normalized text, image hash, image bytes) triples, or None where the image was unusable.
+
+    Embeddings already in the cache are reused; the rest are deduplicated and embedded together.
+    """
+    text_vectors = {text: embedding_cache.get(("text", text)) for text, _, _ in queries if text}
+    image_vectors = {image_hash: embedding_cache.get(("image", image_hash)) for _, image_hash, _ in queries if image_hash}
+    texts = [text for text, vector in text_vectors.items() if vector is None]
+    image_bytes = {image_hash: data for _, image_hash, data in queries if image_hash and image_vectors[image_hash] is None}
+
+    if texts or image_bytes:
+        text_embs, text_mask, image_embs, image_mask = await run_in_executor(
+            embedding_executor, embed_batch, texts, list(image_bytes.values())
+        )
+        for kind, keys, embs, mask, vectors in (("text", texts, text_embs, text_mask, text_vectors),
+                                                ("image", list(image_bytes), image_embs, image_mask, image_vectors)):
+            for key, embedding, ok in zip(keys, embs, mask):
+                if ok:
+                    vectors[key] = embedding
+                    embedding_cache.put((kind, key), embedding)
+
+    query_vectors = []
+    for text, image_hash, _ in queries:
+        text_emb = text_vectors.get(text) if text else None
+        image_emb = image_vectors.get(image_hash) if image_hash else None
+        if image_hash and image_emb is None:
+            query_vectors.append(None)
+        elif text_emb is not None and image_emb is not None:
+            query_vectors.append((0.5 * text_emb) + (0.5 * image_emb))
+        else:
+            query_vectors.append(text_emb if text_emb is not None else image_emb)
+    return query_vectors
+
+
+async def search_chunk(chunk: List[Tuple[int, Optional[str], Optional[bytes], Optional[str]]], top_k: int) -> List[Dict]:
+    """Runs one chunk of /search/batch and returns a result line per query."""
+    trace = Trace(metrics, "batch_search_stage_seconds")
+    with trace.stage("result_cache"):
+        check_index_version()
+        keys = [(normalize_query(text), image_hash, top_k, ()) for _, text, _, image_hash in chunk]
+        ranked = [result_cache.get(key) for key in keys]
+    errors = {}
+
+    pending = [j for j, ids in enumerate(ranked) if ids is None]
+    if pending:
+        vectors = await trace.timed("embed", embed_queries([(keys[j][0], keys[j][1], chunk[j][2]) for j in pending]))
+        for j, vector in zip(pending, vectors):
+            if vector is None:
+                errors[j] = "Invalid or corrupt image file."
+        pending = [j for j, vector in zip(pending, vectors) if vector is not None]
+        vectors = [vector for vector in vectors if vector is not None]
+
+    if pending:
+        # One backend job per retriever and chunk, so a batch never queues more than a couple of
+        # jobs per chunk ahead of /search/ traffic on the shared backend pool
+        vector_results, es_results = await asyncio.gather(
+            trace.timed("vector_store", run_with_timeout(
+                "vector_store", BATCH_QUERY_TIMEOUT, query_vector_store_batch, np.stack(vectors), top_k=50)),
+            trace.timed("elasticsearch", run_with_timeout(
+                "elasticsearch", BATCH_QUERY_TIMEOUT, query_elasticsearch_batch, [chunk[j][1] for j in pending], top_k=50)),
+        )
+        es_timed_out = es_results is None
+        es_results = es_results or [[] for _ in pending]
+        vector_timed_out = vector_results is None
+        vector_results = vector_results or [[] for _ in pending]
+        with trace.stage("fusion"):
+            fused = batch_reciprocal_rank_fusion(
+                [[vector_ids, es_ids] for vector_ids, es_ids in zip(vector_results, es_results)], top_k=top_k
+            )
+        for j, ids in zip(pending, fused):
+            ranked[j] = ids
+            # Same rule as /search/: a ranking missing a backend isn't cached
+            if not vector_timed_out and not es_timed_out:
+                result_cache.put(keys[j], ids)
+
+    # One deduplicated hydration query for every result in the chunk
+    all_ids = list(dict.fromkeys(aid for j, ids in enumerate(ranked) if j not in errors for aid in ids))
+    products = await trace.timed("hydrate", run_in_executor(backend_executor, fetch_product_details_from_postgres, all_ids))
+    product_map = {str(product['article_id']): product for product in products}
+
+    lines = []
+    for j, (index, _, _, _) in enumerate(chunk):
+        if j in errors:
+            metrics.inc("batch_search_queries_total", outcome="error")
+            lines.append({"index": index, "error": errors[j]})
+        else:
+            metrics.inc("batch_search_queries_total", outcome="ok")
+            lines.append({"index": index, "results": [product_map[aid] for aid in ranked[j] if aid in product_map]})
+    return lines
+
+
+@app.post("/search/batch", summary="Run many text and/or image searches in one request, streamed back as NDJSON")
+async def search_batch(
+    queries: str = Form(..., description='JSON list like [{"text": "red dress"}, {"image": 0}, {"text": "linen", "image": 1}]; "image" indexes into `images`.'),
+    images: Optional[List[UploadFile]] = File(None),
+    top_k: int = Form(10)
+):
+    try:
+        parsed = json.loads(queries)
+        if not isinstance(parsed, list) or not all(isinstance(q, dict) for q in parsed):
+            raise ValueError("expected a JSON list of objects")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid queries: {e}")
+    if not parsed:
+        raise HTTPException(status_code=400, detail="Provide at least one query.")
+    if len(parsed) > BATCH_SEARCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_SEARCH_MAX_QUERIES} queries per batch.")
+
+    image_data = [await image.read() for image in images or []]
+    image_hashes = [hashlib.sha256(data).hexdigest() for data in image_data]
+    items = []
+    for index, query in enumerate(parsed):
+        text, image = query.get("text") or None, query.get("image")
+        if image is not None and (not isinstance(image, int) or not 0 <= image < len(image_data)):
+            raise HTTPException(status_code=400, detail=f"Query {index} refers to image {image}, but {len(image_data)} were uploaded.")
+        if text is not None and not isinstance(text, str):
+            raise HTTPException(status_code=400, detail=f"Query {index} has a non-string text.")
+        if not normalize_query(text) and image is None:
+            raise HTTPException(status_code=400, detail=f"Query {index} needs a text, an image or both.")
+        items.append((index, text, image_data[image] if image is not None else None,
+                      image_hashes[image] if image is not None else None))
+
+    await wait_until_started()
+    chunks = [items[i:i + BATCH_SEARCH_CHUNK_SIZE] for i in range(0, len(items), BATCH_SEARCH_CHUNK_SIZE)]
+    in_flight = asyncio.Semaphore(BATCH_SEARCH_CONCURRENCY)
+
+    async def run_chunk(chunk):
+        async with in_flight:
+            try:
+                return await search_chunk(chunk, top_k)
+            except Exception as e:
+                logger.error(f"Batch search chunk failed: {e}")
+                metrics.inc("batch_search_queries_total", len(chunk), outcome="error")
+                return [{"index": index, "error": "Search failed."} for index, _, _, _ in chunk]
+
+    async def stream():
+        tasks = [asyncio.create_task(run_chunk(chunk)) for chunk in chunks]
+        try:
+            # Chunks come back in completion order; each line carries its query's index
+            for next_done in asyncio.as_completed(tasks):
+                for line in await next_done:
+                    yield json.dumps(line, default=str) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+async def probe(fn) -> bool:
+    try:
+        result = await asyncio.wait_for(run_in_executor(backend_executor, fn), timeout=READINESS_TIMEOUT)
+        return result is not False
+    except Exception:
+        return False
+
+
+@app.get("/ready", summary="Readiness probe: model warm and every backend reachable")
+async def ready():
+    started = (
+        _startup_task is not None and _startup_task.done()
+        and not _startup_task.cancelled() and _startup_task.exception() is None
+    )
+    checks = {"startup": started, "model_warm": bool(embedder is not None and embedder.warm)}
+    if started:
+        vector_ok, es_ok, pg_ok = await asyncio.gather(probe(vector_store.ping), probe(es_client.ping), probe(pg_pool.ping))
+        checks.update({"vector_store": vector_ok, "elasticsearch": es_ok, "postgres": pg_ok})
+    is_ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "checks": checks, "timings": startup_timings},
+    )
+
+
+@app.get("/stats/embedding", summary="Query-embedding batcher queue depth and batch-size histograms")
+async def embedding_stats():
+    await wait_until_started()
+    return embedding_batcher.stats()
+
+
+@app.get("/stats/cache", summary="Query-embedding and result cache counters")
+async def cache_stats():
+    await wait_until_started()
+    return {
+        "index_version": _cached_index_version,
+        "embedding_cache": embedding_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "product_cache": product_cache.stats(),
+        "db_pool": {"maxconn": pg_pool.maxconn, "reconnects": pg_pool.reconnects},
+    }
+
+
+def collect_gauges():
+    for name, cache in (("embedding", embedding_cache), ("result", result_cache), ("product", product_cache)):
+        stats = cache.stats()
+        metrics.set("cache_entries", stats["size"], cache=name)
+        metrics.set("cache_hits", stats["hits"], cache=name)
+        metrics.set("cache_misses", stats["misses"], cache=name)
+    if embedding_batcher is not None:
+        for lane, lane_stats in embedding_batcher.stats()["lanes"].items():
+            metrics.set("embedding_queue_depth", lane_stats["queue_depth"], lane=lane)
+    if pg_pool is not None:
+        metrics.set("db_pool_reconnects", pg_pool.reconnects)
+    metrics.set("profiler_running", int(profiler.running))
+
+
+@app.get("/metrics", summary="Prometheus metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    collect_gauges()
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def require_profiler_endpoints():
+    if not PROFILER_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Profiler endpoints are disabled (set PROFILER_ENDPOINTS=true).")
+
+
+@app.post("/debug/profiler/start", summary="Start the sampling profiler")
+async def start_profiler(interval_ms: float = 10.0, reset: bool = True):
+    require_profiler_endpoints()
+    profiler.start(interval_ms=interval_ms, reset=reset)
+    return profiler.status()
+
+
+@app.post("/debug/profiler/stop", summary="Stop the sampling profiler")
+async def stop_profiler():
+    require_profiler_endpoints()
+    await run_in_executor(backend_executor, profiler.stop)
+    return profiler.status()
+
+
+@app.get("/debug/profiler", summary="Sampling profiler status")
+async def profiler_status():
+    require_profiler_endpoints()
+    return profiler.status()
+
+
+@app.get("/debug/profiler/stacks", summary="Sampled stacks in collapsed (flamegraph) format", response_class=PlainTextResponse)
+async def profiler_stacks(limit: Optional[int] = None):
+    require_profiler_endpoints()
+    return PlainTextResponse(profiler.collapsed(limit))
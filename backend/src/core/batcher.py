@@ -0,0 +1,115 @@
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+import numpy as np
+from src.core.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class _Lane:
+    """Pending requests for one modality plus the stats used to tune its window."""
+
+    def __init__(self, name: str, encode, max_batch_size: int):
+        self.name = name
+        self.encode = encode
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.max_depth = 0
+        self.batch_sizes = Histogram([b for b in (1, 2, 4, 8, 16, 32, 64, 128) if b < max_batch_size] + [max_batch_size])
+        self.queue_wait_ms = Histogram([1, 2, 5, 10, 25, 50, 100, 250])
+        self.encode_ms = Histogram([5, 10, 25, 50, 100, 250, 500, 1000])
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent query embeddings into batched EmbeddingModel calls.
+
+    Each caller awaits a future. A background task per modality waits for the first
+    request, keeps collecting until `max_batch_size` requests are queued or `max_wait_ms`
+    has passed, then encodes them in one `embed_texts`/`embed_loaded_images` call on
+    `executor` and resolves every future with its row.
+    """
+
+    def __init__(self, embedder, executor, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embedder = embedder
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._lanes: Dict[str, _Lane] = {}
+
+    def _lane(self, name: str) -> _Lane:
+        # Lanes are created lazily so their queues and tasks bind to the running event loop
+        lane = self._lanes.get(name)
+        if lane is None:
+            encode = self.embedder.embed_texts if name == "text" else self.embedder.embed_loaded_images
+            lane = self._lanes[name] = _Lane(name, encode, self.max_batch_size)
+        if lane.task is None or lane.task.done():
+            lane.task = asyncio.get_running_loop().create_task(self._run(lane))
+        return lane
+
+    async def _submit(self, name: str, item):
+        lane = self._lane(name)
+        future = asyncio.get_running_loop().create_future()
+        lane.queue.put_nowait((item, future, time.perf_counter()))
+        lane.max_depth = max(lane.max_depth, lane.queue.qsize())
+        return await future
+
+    async def embed_text(self, text: str) -> Optional[np.ndarray]:
+        if not text or not isinstance(text, str):
+            return None
+        return await self._submit("text", text)
+
+    async def embed_image(self, image) -> Optional[np.ndarray]:
+        """Embeds an already-decoded PIL image."""
+        return await self._submit("image", image)
+
+    async def _collect(self, lane: _Lane) -> List:
+        pending = [await lane.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(await asyncio.wait_for(lane.queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return pending
+
+    async def _run(self, lane: _Lane):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = await self._collect(lane)
+            started = time.perf_counter()
+            for _, _, enqueued in pending:
+                lane.queue_wait_ms.observe((started - enqueued) * 1000)
+            lane.batch_sizes.observe(len(pending))
+            try:
+                embeddings, mask = await loop.run_in_executor(self.executor, lane.encode, [item for item, _, _ in pending])
+            except Exception as e:
+                logger.error(f"Batched {lane.name} embedding of {len(pending)} queries failed: {e}")
+                for _, future, _ in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            lane.encode_ms.observe((time.perf_counter() - started) * 1000)
+            for (_, future, _), embedding, ok in zip(pending, embeddings, mask):
+                if not future.done():  # the caller may have been cancelled meanwhile
+                    future.set_result(embedding if ok else None)
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "lanes": {
+                name: {
+                    "queue_depth": lane.queue.qsize(),
+                    "max_queue_depth": lane.max_depth,
+                    "batch_size": lane.batch_sizes.snapshot(),
+                    "queue_wait_ms": lane.queue_wait_ms.snapshot(),
+                    "encode_ms": lane.encode_ms.snapshot(),
+                }
+                for name, lane in self._lanes.items()
+            },
+        }
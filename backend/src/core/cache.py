@@ -0,0 +1,126 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU map with hit/miss/eviction counters."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TTLCache(LRUCache):
+    """LRU cache whose entries also expire `ttl` seconds after they were written."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.expirations = 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                # Count it as a miss and drop it so it doesn't hold a slot. A put() between the
+                # lookup and the removal would otherwise be the entry that gets dropped
+                self.misses += 1
+                self.expirations += 1
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value):
+        super().put(key, (time.monotonic() + self.ttl, value))
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "ttl": self.ttl, "expirations": self.expirations}
+
+
+class IndexVersion:
+    """A small marker file the indexer rewrites after every successful run.
+
+    Readers re-read it at most every `check_interval` seconds, so checking it on every
+    request costs one `time.monotonic()` call most of the time.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._checked_at = 0.0
+        self._version: Optional[str] = None
+
+    def publish(self) -> str:
+        version = f"{time.time():.0f}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, self.path)
+        return version
+
+    def current(self) -> Optional[str]:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            try:
+                with open(self.path) as f:
+                    self._version = f.read().strip() or None
+            except FileNotFoundError:
+                self._version = None
+        return self._version
@@ -0,0 +1,107 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the connection itself is unusable, as opposed to a bad query
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def db_params_from_env() -> Dict[str, Optional[str]]:
+    return {
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT"),
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+    }
+
+
+class PostgresPool:
+    """Thread-safe psycopg2 pool that validates connections before handing them out.
+
+    Callers block (instead of getting a PoolError) when all `maxconn` connections are busy.
+    A connection that has been idle for longer than `health_check_interval` seconds is pinged
+    with `SELECT 1` first, and broken connections are closed and replaced transparently.
+    """
+
+    def __init__(self, minconn: int = 1, maxconn: int = 10, health_check_interval: float = 30.0, **db_params):
+        self.db_params = db_params or db_params_from_env()
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **self.db_params)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used: Dict[int, float] = {}
+        self.reconnects = 0
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0.0) < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except CONNECTION_ERRORS:
+            return False
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+        self.reconnects += 1
+
+    def _checkout(self):
+        for _ in range(self.maxconn + 1):
+            conn = self._pool.getconn()
+            if self._healthy(conn):
+                return conn
+            logger.warning("Discarding broken PostgreSQL connection from the pool.")
+            self._discard(conn)
+        raise psycopg2.OperationalError("Could not obtain a healthy PostgreSQL connection.")
+
+    @contextmanager
+    def connection(self):
+        """Yields a connection; rolls back on error and drops it if the connection broke."""
+        with self._slots:
+            conn = self._checkout()
+            try:
+                yield conn
+            except CONNECTION_ERRORS:
+                self._discard(conn)
+                raise
+            except Exception:
+                conn.rollback()
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+                raise
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+
+    def run(self, fn, retries: int = 1):
+        """Calls `fn(conn)`, retrying on a fresh connection if the first one turns out to be dead."""
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as conn:
+                    return fn(conn)
+            except CONNECTION_ERRORS as e:
+                if attempt == retries:
+                    raise
+                logger.warning(f"PostgreSQL connection lost ({e}); retrying on a new connection.")
+
+    def ping(self):
+        def select_one(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        self.run(select_one)
+
+    def close(self):
+        self._pool.closeall()
@@ -1,39 +1,179 @@
+import os
+import time
 import logging
+from typing import Optional, Sequence, Tuple, Union
 from sentence_transformers import SentenceTransformer
 from PIL import Image
+import numpy as np
 import torch
+from src.core.inference import BACKENDS, GraphEncoder, _ImageTower, configure_threads, crop_size, normalize_pixels, quantize_int8
 
 logger = logging.getLogger(__name__)
 
+ImageInput = Union[str, Image.Image]
+# A decoded image is a PIL image, or an (h, w, 3) uint8 array already resized and cropped (see ImageCache)
+LoadedImage = Union[Image.Image, np.ndarray]
+
 class EmbeddingModel:
-    def __init__(self, model_name: str = 'clip-ViT-B-32'):
-        if torch.backends.mps.is_available():
+    def __init__(self, model_name: str = 'clip-ViT-B-32', snapshot_path: Optional[str] = None,
+                 backend: str = "torch", num_threads: Optional[int] = None, export_dir: str = "data/models"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}'. Expected one of {', '.join(BACKENDS)}.")
+        # The optimized backends are CPU-only; the default keeps using MPS when it is there
+        if backend == "torch" and torch.backends.mps.is_available():
             self.device = "mps"
         else:
             self.device = "cpu"
-        
-        logger.info(f"Using device: {self.device.upper()}")
-            
+
+        logger.info(f"Using device: {self.device.upper()} (inference backend: {backend})")
+        if num_threads:
+            configure_threads(num_threads)
+
+        self.model_name = model_name
+        self.backend = backend
+        # int8 vectors differ measurably from fp32 ones, so anything keyed on the model keeps them apart
+        self.variant = model_name if backend != "int8" else f"{model_name}-int8"
+        self._graph: Optional[GraphEncoder] = None
+        self._image_tower: Optional[_ImageTower] = None
+        self._dimension: Optional[int] = None
+        self.warm = False
         try:
-            logger.info(f"Loading SentenceTransformer model: {model_name}")
-            self.model = SentenceTransformer(model_name, device=self.device)
-            logger.info("Model loaded successfully.")
+            start = time.perf_counter()
+            # A local snapshot skips the hub lookup and download that dominate cold starts
+            if snapshot_path and os.path.isdir(snapshot_path):
+                logger.info(f"Loading SentenceTransformer model {model_name} from snapshot {snapshot_path}")
+                self.model = SentenceTransformer(snapshot_path, device=self.device)
+            else:
+                logger.info(f"Loading SentenceTransformer model: {model_name}")
+                self.model = SentenceTransformer(model_name, device=self.device)
+                if snapshot_path:
+                    self.save_snapshot(snapshot_path)
+            if backend == "int8":
+                quantize_int8(self.model)
+            elif backend in ("torchscript", "onnx"):
+                self._graph = GraphEncoder(self.model, backend, os.path.join(export_dir, model_name.replace("/", "__")), num_threads)
+            self.load_seconds = time.perf_counter() - start
+            logger.info(f"Model loaded successfully in {self.load_seconds:.2f}s.")
         except Exception as e:
             logger.error(f"Failed to load embedding model: {e}")
             raise
 
+    def save_snapshot(self, path: str):
+        logger.info(f"Saving model snapshot to {path}")
+        self.model.save(path)
+
+    def warmup(self, batch_sizes: Sequence[int] = (1, 8)) -> float:
+        """Runs dummy text and image batches so the first real query doesn't pay for lazy init."""
+        start = time.perf_counter()
+        dummy_image = Image.new('RGB', (224, 224))
+        for size in batch_sizes:
+            self.embed_texts(["warmup query"] * size)
+            self.embed_loaded_images([dummy_image] * size)
+        self.warm = True
+        elapsed = time.perf_counter() - start
+        logger.info(f"Model warmup finished in {elapsed:.2f}s.")
+        return elapsed
+
+    @property
+    def dimension(self) -> int:
+        # CLIP checkpoints don't always report their output size, so fall back to probing once
+        if self._dimension is None:
+            self._dimension = self.model.get_sentence_embedding_dimension() or len(self._encode(["dimension probe"])[0])
+        return self._dimension
+
+    @property
+    def image_size(self) -> int:
+        """Side of the square images the vision tower takes, i.e. what ImageCache should store."""
+        return crop_size(self.model[0].processor)
+
+    def _encode(self, items: list, batch_size: Optional[int] = None) -> np.ndarray:
+        if self._graph is not None:
+            batch_size = batch_size or max(len(items), 1)
+            encode = self._graph.encode_texts if isinstance(items[0], str) else self._graph.encode_images
+            return np.concatenate([encode(items[i:i + batch_size]) for i in range(0, len(items), batch_size)])
+        return self.model.encode(
+            items,
+            batch_size=batch_size or max(len(items), 1),
+            convert_to_numpy=True,
+            device=self.device,
+            show_progress_bar=False,
+        )
+
+    def _encode_pixels(self, pixels: np.ndarray, batch_size: Optional[int] = None) -> np.ndarray:
+        # SentenceTransformer's CLIP module treats anything that isn't a PIL image as text, so
+        # preprocessed arrays go to the vision tower directly, skipping resize and crop
+        batch_size = batch_size or max(len(pixels), 1)
+        if self._graph is not None:
+            encode = self._graph.encode_pixels
+        else:
+            if self._image_tower is None:
+                self._image_tower = _ImageTower(self.model[0].model).eval()
+
+            def encode(batch):
+                with torch.no_grad():
+                    values = normalize_pixels(self.model[0].processor, batch).to(self.device)
+                    return self._image_tower(values).float().cpu().numpy()
+        return np.concatenate([encode(pixels[i:i + batch_size]) for i in range(0, len(pixels), batch_size)])
+
+    def _empty(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        return np.zeros((n, self.dimension), dtype=np.float32), np.zeros(n, dtype=bool)
+
     def embed_text(self, text: str):
         if not text or not isinstance(text, str):
             return None
-        return self.model.encode(text, convert_to_numpy=True, device=self.device, show_progress_bar=False)
+        return self._encode([text])[0]
 
     def embed_image(self, image_path: str):
+        image = self.load_image(image_path)
+        if image is None:
+            return None
+        return self._encode([image])[0]
+
+    def embed_texts(self, texts: Sequence[Optional[str]], batch_size: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Encodes a list of texts in one forward pass.
+
+        Returns an (n, dim) float32 array aligned with `texts` and a boolean mask marking
+        which rows hold a real embedding. Empty or non-string entries get a zero row.
+        """
+        embeddings, mask = self._empty(len(texts))
+        valid_idx = [i for i, text in enumerate(texts) if text and isinstance(text, str)]
+        if not valid_idx:
+            return embeddings, mask
+
+        embeddings[valid_idx] = self._encode([texts[i] for i in valid_idx], batch_size)
+        mask[valid_idx] = True
+        return embeddings, mask
+
+    @staticmethod
+    def load_image(image: ImageInput) -> Optional[Image.Image]:
+        if isinstance(image, Image.Image):
+            return image.convert('RGB')
         try:
-            image = Image.open(image_path)
-            return self.model.encode(image, convert_to_numpy=True, device=self.device, show_progress_bar=False)
+            with Image.open(image) as img:
+                return img.convert('RGB')
         except FileNotFoundError:
-            logger.warning(f"Image not found at path: {image_path}")
-            return None
+            logger.warning(f"Image not found at path: {image}")
         except Exception as e:
-            logger.error(f"Could not process image {image_path}: {e}")
-            return None
\ No newline at end of file
+            logger.error(f"Could not process image {image}: {e}")
+        return None
+
+    def embed_images(self, images: Sequence[Optional[ImageInput]], batch_size: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Encodes a list of image paths or PIL images in one forward pass.
+
+        Missing or corrupt images are logged and skipped; their rows stay zero and
+        are marked False in the returned mask so the rest of the batch still goes through.
+        """
+        loaded = [self.load_image(image) if image is not None else None for image in images]
+        return self.embed_loaded_images(loaded, batch_size)
+
+    def embed_loaded_images(self, images: Sequence[Optional[LoadedImage]], batch_size: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        embeddings, mask = self._empty(len(images))
+        pil_idx = [i for i, image in enumerate(images) if isinstance(image, Image.Image)]
+        array_idx = [i for i, image in enumerate(images) if isinstance(image, np.ndarray)]
+
+        if pil_idx:
+            embeddings[pil_idx] = self._encode([images[i] for i in pil_idx], batch_size)
+        if array_idx:
+            embeddings[array_idx] = self._encode_pixels(np.stack([images[i] for i in array_idx]), batch_size)
+        mask[pil_idx + array_idx] = True
+        return embeddings, mask
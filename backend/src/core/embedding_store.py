@@ -0,0 +1,162 @@
+import os
+import json
+import logging
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_INITIAL_CAPACITY = 1024
+
+
+class EmbeddingStore:
+    """Disk-backed text and image embeddings keyed by article_id, one directory per model.
+
+    Vectors live in two raw memory-mapped files (`text.bin`, `image.bin`) that grow by
+    doubling. `rows.log` is an append-only log of `article_id<TAB>version<TAB>row` lines;
+    replaying it on open rebuilds the article_id -> row index, and because a row is only
+    logged after its vectors are flushed, a crash never leaves an entry pointing at garbage.
+    `version` is an opaque string (the indexer uses its content hash) so stale rows miss.
+    """
+
+    def __init__(self, root: str, model_name: str, dimension: int, dtype: str = "float32", readonly: bool = False):
+        self.path = os.path.join(root, model_name.replace("/", "__"))
+        self.readonly = readonly
+        os.makedirs(self.path, exist_ok=True)
+
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["dimension"] != dimension or meta["dtype"] != dtype:
+                raise ValueError(
+                    f"Embedding store at {self.path} holds {meta['dtype']}[{meta['dimension']}] vectors, "
+                    f"not {dtype}[{dimension}]. Use a different store root or delete it."
+                )
+        elif readonly:
+            raise FileNotFoundError(f"No embedding store found at {self.path}")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"model_name": model_name, "dimension": dimension, "dtype": dtype}, f)
+
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self._index: Dict[str, Tuple[str, int]] = {}
+        self._next_row = 0
+        self._load_index()
+
+        self._text = self._open("text.bin")
+        self._image = self._open("image.bin")
+        logger.info(f"Embedding store at {self.path} opened with {len(self._index)} articles.")
+
+    def _load_index(self):
+        log_path = os.path.join(self.path, "rows.log")
+        if os.path.exists(log_path):
+            with open(log_path) as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 3:
+                        continue  # torn write at the tail of the log
+                    article_id, version, row = parts
+                    self._index[article_id] = (version, int(row))
+                    self._next_row = max(self._next_row, int(row) + 1)
+        self._log = None if self.readonly else open(log_path, "a")
+
+    def _open(self, name: str) -> Optional[np.memmap]:
+        path = os.path.join(self.path, name)
+        row_bytes = self.dimension * self.dtype.itemsize
+        if not os.path.exists(path):
+            if self.readonly:
+                return None
+            with open(path, "wb") as f:
+                f.truncate(_INITIAL_CAPACITY * row_bytes)
+        capacity = os.path.getsize(path) // row_bytes
+        if capacity == 0:
+            return None
+        return np.memmap(path, dtype=self.dtype, mode="r" if self.readonly else "r+", shape=(capacity, self.dimension))
+
+    def _grow(self, rows_needed: int):
+        capacity = len(self._text)
+        if rows_needed <= capacity:
+            return
+        while capacity < rows_needed:
+            capacity *= 2
+        row_bytes = self.dimension * self.dtype.itemsize
+        self.flush()
+        self._text = self._image = None
+        for name in ("text.bin", "image.bin"):
+            with open(os.path.join(self.path, name), "r+b") as f:
+                f.truncate(capacity * row_bytes)
+        self._text = self._open("text.bin")
+        self._image = self._open("image.bin")
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, article_id) -> bool:
+        return str(article_id) in self._index
+
+    def rows(self, article_ids: Sequence[str], versions: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Row index per article_id, or -1 when missing or stored under a different version."""
+        rows = np.full(len(article_ids), -1, dtype=np.int64)
+        for i, article_id in enumerate(article_ids):
+            entry = self._index.get(str(article_id))
+            if entry is not None and (versions is None or entry[0] == versions[i]):
+                rows[i] = entry[1]
+        return rows
+
+    def get(self, article_ids: Sequence[str], versions: Optional[Sequence[str]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns float32 (text, image) arrays aligned with `article_ids` plus a hit mask."""
+        rows = self.rows(article_ids, versions)
+        hits = rows >= 0
+        text = np.zeros((len(article_ids), self.dimension), dtype=np.float32)
+        image = np.zeros_like(text)
+        if hits.any():
+            text[hits] = self._text[rows[hits]]
+            image[hits] = self._image[rows[hits]]
+        return text, image, hits
+
+    def put(self, article_ids: Sequence[str], text_embs: np.ndarray, image_embs: np.ndarray, versions: Sequence[str]):
+        if self.readonly:
+            raise RuntimeError("Embedding store was opened read-only.")
+        if not len(article_ids):
+            return
+
+        # Always write to fresh rows: overwriting in place could leave a logged version
+        # pointing at half-replaced vectors if we crash before the log line lands.
+        rows = np.arange(self._next_row, self._next_row + len(article_ids))
+        self._next_row += len(article_ids)
+        self._grow(self._next_row)
+
+        self._text[rows] = text_embs
+        self._image[rows] = image_embs
+        self.flush()
+
+        for article_id, version, row in zip(article_ids, versions, rows):
+            self._index[str(article_id)] = (version, int(row))
+            self._log.write(f"{article_id}\t{version}\t{row}\n")
+        self._log.flush()
+
+    def text_vectors(self) -> np.ndarray:
+        """Zero-copy view over every allocated text row (row order, not article order)."""
+        return self._text[:self._next_row]
+
+    def image_vectors(self) -> np.ndarray:
+        """Zero-copy view over every allocated image row (row order, not article order)."""
+        return self._image[:self._next_row]
+
+    def article_rows(self) -> Dict[str, int]:
+        return {article_id: row for article_id, (_, row) in self._index.items()}
+
+    def flush(self):
+        if self.readonly:
+            return
+        for array in (self._text, self._image):
+            if array is not None:
+                array.flush()
+
+    def close(self):
+        self.flush()
+        if self._log is not None:
+            self._log.close()
+        self._text = self._image = None
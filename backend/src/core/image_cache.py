@@ -0,0 +1,279 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+_INITIAL_CAPACITY = 1024
+_CHANNELS = 3
+
+
+def fingerprint(image_path: str) -> Optional[str]:
+    """Cheap identity of a source JPEG (size and mtime), or None if it doesn't exist here."""
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def resize_and_crop(image: Image.Image, size: int) -> np.ndarray:
+    """CLIP's preprocessing up to normalization.
+
+    Resizes the shortest side to `size` with bicubic filtering, center-crops to
+    size x size and returns an HWC uint8 RGB array.
+    """
+    image = image.convert("RGB")
+    width, height = image.size
+    short, long = (width, height) if width <= height else (height, width)
+    new_short, new_long = size, int(size * long / short)
+    new_width, new_height = (new_short, new_long) if width <= height else (new_long, new_short)
+    if (new_width, new_height) != (width, height):
+        image = image.resize((new_width, new_height), Image.BICUBIC)
+    left, top = (new_width - size) // 2, (new_height - size) // 2
+    return np.asarray(image.crop((left, top, left + size, top + size)), dtype=np.uint8)
+
+
+def load_and_crop(image_path: str, size: int) -> Optional[np.ndarray]:
+    try:
+        with Image.open(image_path) as img:
+            return resize_and_crop(img, size)
+    except Exception:
+        return None
+
+
+def _tag(article_id, version: str) -> int:
+    """Non-zero 64-bit tag of the entry a row was committed for; 0 marks a row being rewritten."""
+    digest = hashlib.blake2b(f"{article_id}\t{version}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True) or 1
+
+
+class ImageCache:
+    """Resized, center-cropped uint8 RGB images packed into one memory-mapped file.
+
+    `pixels.bin` holds (capacity, size, size, 3) uint8 rows and grows by doubling.
+    `rows.log` is an append-only `article_id<TAB>version<TAB>row` log, with the same
+    crash-safety rule as EmbeddingStore: a row is logged only after its pixels are flushed.
+    `version` is the source JPEG's fingerprint, so a replaced image misses the cache.
+
+    Rows can be reserved up front and filled by other processes with `write_rows`. This
+    lets the preparation workers write straight into the file instead of shipping
+    pixels back to the parent.
+
+    Rows no log entry points to are reclaimed: rows of replaced images, and reservations
+    that were never logged, are reused by later `reserve` calls of a writer that opens the
+    cache afterwards. A reader that opened it earlier still maps articles to those rows, so
+    `owners.bin` holds a tag of the (article_id, version) each row was committed for. A
+    reused row's tag is cleared before it is rewritten and set again on commit, and `get`
+    checks the tag after copying the pixels: a row rewritten underneath a reader is a miss,
+    including for lookups without a version. `pixels.bin` never shrinks; to shrink it,
+    delete the cache directory and rebuild it.
+    """
+
+    def __init__(self, root: str, size: int = 224, readonly: bool = False):
+        self.path = root
+        self.size = size
+        self.readonly = readonly
+        if not readonly:
+            os.makedirs(self.path, exist_ok=True)
+
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["size"] != size:
+                raise ValueError(f"Image cache at {self.path} holds {meta['size']}px images, not {size}px.")
+        elif readonly:
+            raise FileNotFoundError(f"No image cache found at {self.path}")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"size": size, "channels": _CHANNELS, "dtype": "uint8"}, f)
+
+        self._index: Dict[str, Tuple[str, int]] = {}
+        self._next_row = 0
+        self._free: List[int] = []
+        self._load_index()
+        self._pixels = self._open()
+        self._owners = self._open_owners()
+        logger.info(f"Image cache at {self.path} opened with {len(self._index)} images ({size}x{size}).")
+
+    @property
+    def row_bytes(self) -> int:
+        return self.size * self.size * _CHANNELS
+
+    def _load_index(self):
+        log_path = os.path.join(self.path, "rows.log")
+        if os.path.exists(log_path):
+            with open(log_path) as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 3:
+                        continue  # torn write at the tail of the log
+                    article_id, version, row = parts
+                    self._index[article_id] = (version, int(row))
+                    self._next_row = max(self._next_row, int(row) + 1)
+        used = {row for _, row in self._index.values()}
+        self._free = [row for row in range(self._next_row) if row not in used]
+        self._log = None if self.readonly else open(log_path, "a")
+
+    def _open(self) -> Optional[np.memmap]:
+        path = os.path.join(self.path, "pixels.bin")
+        if not os.path.exists(path):
+            if self.readonly:
+                return None
+            with open(path, "wb") as f:
+                f.truncate(_INITIAL_CAPACITY * self.row_bytes)
+        capacity = os.path.getsize(path) // self.row_bytes
+        if capacity == 0:
+            return None
+        return np.memmap(path, dtype=np.uint8, mode="r" if self.readonly else "r+",
+                         shape=(capacity, self.size, self.size, _CHANNELS))
+
+    def _open_owners(self) -> Optional[np.memmap]:
+        path = os.path.join(self.path, "owners.bin")
+        if self._pixels is None:
+            return None
+        if not os.path.exists(path):
+            if self.readonly:
+                logger.warning(f"Image cache at {self.path} has no row tags; re-run prepare_hm_data --image-cache "
+                               f"once so rows rewritten while indexing are detected.")
+                return None
+            # Caches written before row tags existed: tag what the log says each row holds
+            owners = np.zeros(len(self._pixels), dtype=np.int64)
+            for article_id, (version, row) in self._index.items():
+                owners[row] = _tag(article_id, version)
+            owners.tofile(path)
+        elif not self.readonly and os.path.getsize(path) < len(self._pixels) * 8:
+            with open(path, "r+b") as f:
+                f.truncate(len(self._pixels) * 8)
+        capacity = os.path.getsize(path) // 8
+        return np.memmap(path, dtype=np.int64, mode="r" if self.readonly else "r+", shape=(capacity,))
+
+    def _grow(self, rows_needed: int):
+        capacity = len(self._pixels)
+        if rows_needed <= capacity:
+            return
+        while capacity < rows_needed:
+            capacity *= 2
+        self.flush()
+        self._pixels = self._owners = None
+        with open(os.path.join(self.path, "pixels.bin"), "r+b") as f:
+            f.truncate(capacity * self.row_bytes)
+        self._pixels = self._open()
+        self._owners = self._open_owners()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, article_id) -> bool:
+        return str(article_id) in self._index
+
+    def versions(self, article_ids: Sequence[str]) -> Dict[str, str]:
+        return {str(a): self._index[str(a)][0] for a in article_ids if str(a) in self._index}
+
+    def rows(self, article_ids: Sequence[str], versions: Optional[Sequence[Optional[str]]] = None) -> np.ndarray:
+        """Row per article_id, or -1 when missing or cached from a different source file.
+
+        A version of None (the source JPEG isn't present on this machine) accepts whatever is cached.
+        """
+        rows = np.full(len(article_ids), -1, dtype=np.int64)
+        for i, article_id in enumerate(article_ids):
+            entry = self._index.get(str(article_id))
+            if entry is not None and (versions is None or versions[i] is None or entry[0] == versions[i]):
+                rows[i] = entry[1]
+        return rows
+
+    def get(self, article_ids: Sequence[str], versions: Optional[Sequence[Optional[str]]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (n, size, size, 3) uint8 pixels aligned with `article_ids` plus a hit mask."""
+        rows = self.rows(article_ids, versions)
+        hits = rows >= 0
+        pixels = np.zeros((len(article_ids), self.size, self.size, _CHANNELS), dtype=np.uint8)
+        if hits.any():
+            pixels[hits] = self._pixels[rows[hits]]
+            if self._owners is not None:
+                # Checked after the copy: a writer clears the tag before it touches the pixels
+                hit_ids = np.flatnonzero(hits)
+                expected = np.array([_tag(article_ids[i], self._index[str(article_ids[i])][0]) for i in hit_ids])
+                tagged = rows[hit_ids] < len(self._owners)
+                current = np.zeros(len(hit_ids), dtype=np.int64)
+                current[tagged] = self._owners[rows[hit_ids][tagged]]
+                stale = hit_ids[current != expected]
+                hits[stale] = False
+                pixels[stale] = 0
+        return pixels, hits
+
+    @property
+    def free_rows(self) -> int:
+        return len(self._free)
+
+    def reserve(self, n: int) -> List[int]:
+        """Allocates `n` rows for `write_rows`, reusing free rows before growing the file."""
+        if self.readonly:
+            raise RuntimeError("Image cache was opened read-only.")
+        reused, self._free = self._free[:n], self._free[n:]
+        start = self._next_row
+        self._next_row += n - len(reused)
+        self._grow(self._next_row)
+        # Readers that still map an article to a reused row stop trusting it before it's overwritten
+        self._owners[reused] = 0
+        self.flush()
+        return reused + list(range(start, self._next_row))
+
+    def release(self, rows: Sequence[int]):
+        """Hands back reserved rows that were never filled and committed."""
+        self._free.extend(int(row) for row in rows)
+
+    def commit(self, article_ids: Sequence[str], rows: Sequence[int], versions: Sequence[str]):
+        """Logs rows that `write_rows` has already filled and flushed."""
+        for article_id, version, row in zip(article_ids, versions, rows):
+            self._owners[int(row)] = _tag(article_id, version)
+        self._owners.flush()
+        for article_id, version, row in zip(article_ids, versions, rows):
+            self._index[str(article_id)] = (version, int(row))
+            self._log.write(f"{article_id}\t{version}\t{row}\n")
+        self._log.flush()
+
+    def put(self, article_ids: Sequence[str], pixels: np.ndarray, versions: Sequence[str]):
+        if not len(article_ids):
+            return
+        rows = np.asarray(self.reserve(len(article_ids)), dtype=np.int64)
+        self._pixels[rows] = pixels
+        self.flush()
+        self.commit(article_ids, rows, versions)
+
+    def flush(self):
+        if not self.readonly and self._pixels is not None:
+            self._pixels.flush()
+            self._owners.flush()
+
+    def close(self):
+        self.flush()
+        if self._log is not None:
+            self._log.close()
+        self._pixels = self._owners = None
+
+
+def write_rows(cache_path: str, size: int, rows: Sequence[int], image_paths: Sequence[str]) -> np.ndarray:
+    """Decodes, resizes and crops each image into its reserved row of `pixels.bin`.
+
+    Meant to run in a worker process. Returns which images decoded; rows of images
+    that failed are left unused.
+    """
+    ok = np.zeros(len(image_paths), dtype=bool)
+    if not len(image_paths):
+        return ok
+    pixels_path = os.path.join(cache_path, "pixels.bin")
+    capacity = os.path.getsize(pixels_path) // (size * size * _CHANNELS)
+    pixels = np.memmap(pixels_path, dtype=np.uint8, mode="r+", shape=(capacity, size, size, _CHANNELS))
+    for i, (row, image_path) in enumerate(zip(rows, image_paths)):
+        array = load_and_crop(image_path, size)
+        if array is not None:
+            pixels[row] = array
+            ok[i] = True
+    pixels.flush()
+    del pixels
+    return ok
@@ -0,0 +1,162 @@
+import os
+import logging
+from typing import List, Optional
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "int8", "torchscript", "onnx")
+
+# CLIP's text tower was trained on 77-token contexts; padding to it keeps exported graphs static
+_TEXT_LENGTH = 77
+
+
+class _TextTower(torch.nn.Module):
+    def __init__(self, clip):
+        super().__init__()
+        self.text_model = clip.text_model
+        self.text_projection = clip.text_projection
+
+    def forward(self, input_ids, attention_mask):
+        pooled = self.text_model(input_ids=input_ids, attention_mask=attention_mask)[1]
+        return self.text_projection(pooled)
+
+
+class _ImageTower(torch.nn.Module):
+    def __init__(self, clip):
+        super().__init__()
+        self.vision_model = clip.vision_model
+        self.visual_projection = clip.visual_projection
+
+    def forward(self, pixel_values):
+        pooled = self.vision_model(pixel_values=pixel_values)[1]
+        return self.visual_projection(pooled)
+
+
+def image_processor(processor):
+    # CLIPProcessor wraps the image half as `image_processor` (older transformers: `feature_extractor`)
+    return getattr(processor, "image_processor", None) or processor.feature_extractor
+
+
+def crop_size(processor) -> int:
+    """Side of the square images the processor hands the vision tower."""
+    crop = image_processor(processor).crop_size
+    return crop["height"] if isinstance(crop, dict) else int(crop)
+
+
+def normalize_pixels(processor, pixels: np.ndarray) -> torch.Tensor:
+    """Turns (n, h, w, 3) uint8 images that are already resized and cropped into CLIP's pixel_values.
+
+    This is the tail of the processor's pipeline (rescale to [0, 1], per-channel mean/std,
+    NHWC -> NCHW), so cached pixels give the same inputs as decoding the JPEG again.
+    """
+    settings = image_processor(processor)
+    mean = np.asarray(settings.image_mean, dtype=np.float32)
+    std = np.asarray(settings.image_std, dtype=np.float32)
+    values = (pixels.astype(np.float32) * np.float32(settings.rescale_factor) - mean) / std
+    return torch.from_numpy(np.ascontiguousarray(values.transpose(0, 3, 1, 2)))
+
+
+def quantize_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """Dynamic int8 quantization of every nn.Linear; weights are quantized once, activations per call."""
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def configure_threads(num_threads: int):
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(max(1, num_threads // 2))
+    except RuntimeError:
+        # Only allowed before the first parallel op; keep whatever is already in effect
+        logger.warning("Inter-op thread count was already fixed for this process; leaving it unchanged.")
+
+
+class GraphEncoder:
+    """Runs CLIP's text and image towers as exported graphs (TorchScript or ONNX Runtime).
+
+    Preprocessing still goes through the SentenceTransformer CLIP module's processor, so
+    inputs are identical to the eager path; only the forward passes are replaced. Exports
+    are cached under `export_dir`, in a directory per runtime and input shape, and reused
+    on the next start.
+    """
+
+    def __init__(self, st_model, runtime: str, export_dir: str, num_threads: Optional[int] = None):
+        if runtime not in ("torchscript", "onnx"):
+            raise ValueError(f"Unsupported graph runtime '{runtime}'.")
+        self.runtime = runtime
+        self.clip_module = st_model[0]
+        self.processor = self.clip_module.processor
+        clip = self.clip_module.model.eval()
+        # Traced graphs are fixed to the shapes they were exported with, so those are part of the key
+        size = crop_size(self.processor)
+        export_dir = os.path.join(export_dir, f"{runtime}-{size}px-{_TEXT_LENGTH}tok")
+        os.makedirs(export_dir, exist_ok=True)
+
+        dummy_text = self.processor(text=["export"], return_tensors="pt", padding="max_length",
+                                    max_length=_TEXT_LENGTH, truncation=True)
+        text_inputs = (dummy_text["input_ids"], dummy_text["attention_mask"])
+        image_inputs = (torch.zeros(1, 3, size, size),)
+
+        if runtime == "torchscript":
+            self._text = self._load_torchscript(_TextTower(clip), text_inputs, os.path.join(export_dir, "text.pt"))
+            self._image = self._load_torchscript(_ImageTower(clip), image_inputs, os.path.join(export_dir, "image.pt"))
+        else:
+            try:
+                import onnxruntime as ort
+            except ImportError as e:
+                raise ImportError("The 'onnx' inference backend needs the onnxruntime package (pip install onnxruntime).") from e
+            options = ort.SessionOptions()
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+            self._text = self._load_onnx(ort, options, _TextTower(clip), text_inputs, ["input_ids", "attention_mask"],
+                                         os.path.join(export_dir, "text.onnx"))
+            self._image = self._load_onnx(ort, options, _ImageTower(clip), image_inputs, ["pixel_values"],
+                                          os.path.join(export_dir, "image.onnx"))
+
+    @staticmethod
+    def _load_torchscript(tower, example_inputs, path):
+        if not os.path.exists(path):
+            logger.info(f"Tracing {type(tower).__name__} to {path}")
+            with torch.no_grad():
+                torch.jit.save(torch.jit.trace(tower.eval(), example_inputs), path)
+        return torch.jit.optimize_for_inference(torch.jit.load(path).eval())
+
+    @staticmethod
+    def _load_onnx(ort, options, tower, example_inputs, input_names, path):
+        if not os.path.exists(path):
+            logger.info(f"Exporting {type(tower).__name__} to {path}")
+            with torch.no_grad():
+                torch.onnx.export(
+                    tower.eval(), example_inputs, path,
+                    input_names=input_names, output_names=["embedding"],
+                    dynamic_axes={name: {0: "batch"} for name in input_names + ["embedding"]},
+                    opset_version=17,
+                )
+        return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def _run(self, session, inputs) -> np.ndarray:
+        if self.runtime == "torchscript":
+            with torch.no_grad():
+                return session(*inputs.values()).numpy()
+        return session.run(None, {name: tensor.numpy() for name, tensor in inputs.items()})[0]
+
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        tokens = self.processor(text=texts, return_tensors="pt", padding="max_length",
+                                max_length=_TEXT_LENGTH, truncation=True)
+        return self._run(self._text, {"input_ids": tokens["input_ids"], "attention_mask": tokens["attention_mask"]})
+
+    def encode_images(self, images) -> np.ndarray:
+        pixels = self.processor(images=images, return_tensors="pt")["pixel_values"]
+        return self._run(self._image, {"pixel_values": pixels})
+
+    def encode_pixels(self, pixels: np.ndarray) -> np.ndarray:
+        return self._run(self._image, {"pixel_values": normalize_pixels(self.processor, pixels)})
+
+
+def cosine_parity(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """Row-wise cosine similarity between a backend's output and the fp32 reference."""
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    candidate = candidate / np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    cosine = np.sum(reference * candidate, axis=1)
+    return {"mean": float(cosine.mean()), "min": float(cosine.min()), "p5": float(np.percentile(cosine, 5))}
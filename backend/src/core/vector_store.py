@@ -0,0 +1,508 @@
+import os
+import sys
+import json
+import shutil
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from src.core.quantization import COMPRESSIONS, Codec, create_codec
+
+logger = logging.getLogger(__name__)
+
+PINECONE_INDEX_NAME = "multimodal-search"
+
+
+class VectorStore:
+    """Minimal interface shared by the API and the indexer.
+
+    Records follow Pinecone's shape: {"id": str, "values": array-like, "metadata": {str: str}},
+    with metadata optional. `query` filters take the form {field: [values]}: a record matches
+    when, for every field, its metadata value is one of the listed values. `durable_writes`
+    says whether an upsert is persisted as soon as it returns or only on `save()`.
+    """
+
+    durable_writes = True
+
+    def upsert(self, records: List[Dict]):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def query(self, vector, top_k: int = 20, filters: Optional[Dict[str, List[str]]] = None) -> List[str]:
+        raise NotImplementedError
+
+    def query_batch(self, vectors, top_k: int = 20, filters: Optional[Dict[str, List[str]]] = None) -> List[List[str]]:
+        """One result list per query vector. Backends that can score many queries at once override this."""
+        return [self.query(vector, top_k=top_k, filters=filters) for vector in vectors]
+
+    def save(self):
+        """Persists pending writes. Hosted backends have nothing to do."""
+
+    def ping(self):
+        """Raises if the backend is unreachable."""
+
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, api_key: Optional[str] = None, index_name: str = PINECONE_INDEX_NAME):
+        from pinecone import Pinecone
+
+        pc = Pinecone(api_key=api_key or os.getenv("PINECONE_API_KEY"))
+        self.index = pc.Index(index_name)
+
+    def upsert(self, records: List[Dict]):
+        self.index.upsert(vectors=[
+            {**record, "values": np.asarray(record["values"], dtype=np.float32).tolist()} for record in records
+        ])
+
+    def delete(self, ids: List[str]):
+        self.index.delete(ids=list(ids))
+
+    def query(self, vector, top_k: int = 20, filters: Optional[Dict[str, List[str]]] = None) -> List[str]:
+        vector = np.asarray(vector, dtype=np.float32).tolist()
+        metadata_filter = {field: {"$in": list(values)} for field, values in filters.items()} if filters else None
+        results = self.index.query(vector=vector, top_k=top_k, include_metadata=False, filter=metadata_filter)
+        return [match['id'] for match in results['matches']]
+
+    def ping(self):
+        self.index.describe_index_stats()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, sample_size: int = 100_000, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample; returns unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = np.bincount(assignments, minlength=n_clusters) == 0
+        # Re-seed empty clusters from random points instead of letting them collapse
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def _filter_mask(metadata: Dict[str, tuple], filters: Optional[Dict[str, List[str]]], n: int) -> Optional[np.ndarray]:
+    if not filters:
+        return None
+    mask = np.ones(n, dtype=bool)
+    for field, values in filters.items():
+        if field not in metadata:
+            return np.zeros(n, dtype=bool)  # nothing was indexed with this field
+        vocab, codes = metadata[field]
+        mask &= np.isin(vocab, list(values))[codes]
+    return mask
+
+
+class LocalVectorStore(VectorStore):
+    """In-process cosine search over unit-normalized float32 vectors.
+
+    Small catalogs are searched exactly with a single matmul. Once the store holds at least
+    `ivf_threshold` vectors, `save()` also trains an IVF index: vectors are clustered with
+    spherical k-means and written grouped by cluster, so a query only scans the closest
+    clusters: `n_probe` of them if set, otherwise `probe_fraction` of all lists (at least 8),
+    so recall holds as the catalog and the number of lists grow. Everything is saved as
+    .npy files and loaded with mmap_mode='r'.
+
+    With `compression` set ('int8' or 'pq'), `save()` also writes compressed codes that are
+    held in memory and scanned first. The best `top_k * rerank_factor` candidates (by default
+    the codec's own factor: 4 for int8, 16 for pq) are then re-scored exactly against the
+    float32 vectors, which stay on disk and are only paged in for those rows.
+
+    Record metadata is kept per field as a sorted vocabulary plus one int32 code per row, so
+    a filter is a vocabulary lookup and a gather. When a filter matches fewer rows than the
+    IVF probes would scan, those rows are searched exactly instead.
+    """
+
+    durable_writes = False
+
+    def __init__(self, path: str, ivf_threshold: int = 50_000, n_probe: Optional[int] = None,
+                 compression: Optional[str] = None, rerank_factor: Optional[int] = None, probe_fraction: float = 0.1,
+                 recall_target: float = 0.9):
+        if compression and compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}'. Expected one of {', '.join(COMPRESSIONS)}.")
+        self.path = path
+        self.ivf_threshold = ivf_threshold
+        self.n_probe = n_probe
+        self.probe_fraction = probe_fraction
+        self.recall_target = recall_target
+        self.compression = compression
+        self.rerank_factor = rerank_factor
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._centroids: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._codec: Optional[Codec] = None
+        self._codes: Optional[np.ndarray] = None
+        self._metadata: Dict[str, tuple] = {}
+        self._pending: Dict[str, np.ndarray] = {}
+        self._pending_metadata: Dict[str, Dict[str, str]] = {}
+        self._deleted = set()
+        if os.path.exists(os.path.join(path, "ids.json")):
+            self._load()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def probes(self, n_lists: int) -> int:
+        """IVF lists scanned per query when `n_probe` isn't fixed."""
+        return min(n_lists, self.n_probe or max(8, int(np.ceil(self.probe_fraction * n_lists))))
+
+    def _load(self):
+        with open(os.path.join(self.path, "ids.json")) as f:
+            self._ids = json.load(f)
+        self._rows = {article_id: row for row, article_id in enumerate(self._ids)}
+        self._vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r")
+        self._metadata = {}
+        metadata_path = os.path.join(self.path, "metadata.npz")
+        if os.path.exists(metadata_path):
+            with np.load(metadata_path) as state:
+                for field in state["fields"]:
+                    self._metadata[str(field)] = (state[f"vocab_{field}"], state[f"codes_{field}"])
+        ivf_path = os.path.join(self.path, "ivf.npz")
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as ivf:
+                self._centroids, self._offsets = ivf["centroids"], ivf["offsets"]
+        codec_path = os.path.join(self.path, "codec.npz")
+        if self.compression and os.path.exists(codec_path):
+            with np.load(codec_path) as state:
+                name = str(state["name"])
+                if name == self.compression:
+                    self._codec = create_codec(name).load_state(state)
+                    self._codes = np.load(os.path.join(self.path, "codes.npy"))
+                else:
+                    logger.warning(f"Stored codes are '{name}', not '{self.compression}'; re-encoding on the next save.")
+        logger.info(f"Loaded local vector store from {self.path} ({len(self._ids)} vectors, "
+                    f"{'IVF' if self._centroids is not None else 'exact'} search, "
+                    f"{self._codec.name if self._codec else 'uncompressed'}).")
+
+    def reload(self):
+        """Re-opens the files on disk, e.g. after the indexer saved a new version."""
+        with self._lock:
+            if os.path.exists(os.path.join(self.path, "ids.json")):
+                self._pending.clear()
+                self._pending_metadata.clear()
+                self._deleted.clear()
+                self._centroids = self._offsets = None
+                self._codec = self._codes = None
+                self._load()
+
+    def upsert(self, records: List[Dict]):
+        if not records:
+            return
+        vectors = _normalize(np.stack([np.asarray(r["values"], dtype=np.float32) for r in records]))
+        with self._lock:
+            for record, vector in zip(records, vectors):
+                self._pending[str(record["id"])] = vector
+                self._pending_metadata[str(record["id"])] = record.get("metadata") or {}
+                self._deleted.discard(str(record["id"]))
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            for article_id in ids:
+                self._pending.pop(str(article_id), None)
+                self._pending_metadata.pop(str(article_id), None)
+                self._deleted.add(str(article_id))
+
+    def _merge(self):
+        """Folds pending upserts and deletes into the base arrays. Drops any IVF index."""
+        if not self._pending and not self._deleted:
+            return
+        keep = [row for row, article_id in enumerate(self._ids)
+                if article_id not in self._pending and article_id not in self._deleted]
+        new_ids = list(self._pending)
+        parts = [np.asarray(self._vectors[keep], dtype=np.float32)] if keep else []
+        if new_ids:
+            parts.append(np.stack([self._pending[article_id] for article_id in new_ids]))
+        self._merge_metadata(keep, new_ids)
+        self._ids = [self._ids[row] for row in keep] + new_ids
+        self._vectors = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+        self._rows = {article_id: row for row, article_id in enumerate(self._ids)}
+        self._centroids = self._offsets = None
+        # Codes no longer line up with the rows; search full precision until save() re-encodes
+        self._codec = self._codes = None
+        self._pending.clear()
+        self._pending_metadata.clear()
+        self._deleted.clear()
+
+    def _merge_metadata(self, keep: List[int], new_ids: List[str]):
+        keep = np.asarray(keep, dtype=np.int64)
+        fields = set(self._metadata) | {field for metadata in self._pending_metadata.values() for field in metadata}
+        merged = {}
+        for field in sorted(fields):
+            if field in self._metadata:
+                vocab, codes = self._metadata[field]
+                kept = vocab[codes[keep]]
+            else:
+                kept = np.full(len(keep), "")
+            # "" stands for a record without this field
+            added = np.array([str(self._pending_metadata[article_id].get(field) or "") for article_id in new_ids], dtype=str)
+            vocab, codes = np.unique(np.concatenate([kept, added]), return_inverse=True)
+            merged[field] = (vocab, codes.reshape(-1).astype(np.int32))
+        self._metadata = merged
+
+    def _metadata_rows(self, start: int, stop: int) -> List[Dict[str, str]]:
+        columns = {field: vocab[codes[start:stop]] for field, (vocab, codes) in self._metadata.items()}
+        return [{field: str(values[i]) for field, values in columns.items() if values[i]}
+                for i in range(len(self._ids[start:stop]))]
+
+    def _build_ivf(self):
+        n_lists = max(1, int(4 * np.sqrt(len(self._ids))))
+        logger.info(f"Training IVF index with {n_lists} lists over {len(self._ids)} vectors...")
+        vectors = np.asarray(self._vectors, dtype=np.float32)
+        centroids = _kmeans(vectors, n_lists)
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), 65536):
+            assignments[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+        # Store vectors grouped by list so each probe reads one contiguous slice of the mmap
+        order = np.argsort(assignments, kind="stable")
+        self._vectors = vectors[order]
+        self._ids = [self._ids[row] for row in order]
+        self._rows = {article_id: row for row, article_id in enumerate(self._ids)}
+        self._metadata = {field: (vocab, codes[order]) for field, (vocab, codes) in self._metadata.items()}
+        self._centroids = centroids
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+
+    def save(self):
+        with self._lock:
+            self._merge()
+            if self._centroids is None and len(self._ids) >= self.ivf_threshold:
+                self._build_ivf()
+
+            os.makedirs(self.path, exist_ok=True)
+            # Write to temp names and rename so a reader never mmaps a half-written file
+            np.save(os.path.join(self.path, "vectors.tmp.npy"), np.asarray(self._vectors, dtype=np.float32))
+            with open(os.path.join(self.path, "ids.tmp.json"), "w") as f:
+                json.dump(self._ids, f)
+            ivf_path = os.path.join(self.path, "ivf.npz")
+            if self._centroids is not None:
+                np.savez(os.path.join(self.path, "ivf.tmp.npz"), centroids=self._centroids, offsets=self._offsets)
+                os.replace(os.path.join(self.path, "ivf.tmp.npz"), ivf_path)
+            elif os.path.exists(ivf_path):
+                os.remove(ivf_path)
+            metadata_path = os.path.join(self.path, "metadata.npz")
+            if self._metadata:
+                arrays = {}
+                for field, (vocab, codes) in self._metadata.items():
+                    arrays[f"vocab_{field}"], arrays[f"codes_{field}"] = vocab, codes
+                np.savez(os.path.join(self.path, "metadata.tmp.npz"), fields=np.array(list(self._metadata)), **arrays)
+                os.replace(os.path.join(self.path, "metadata.tmp.npz"), metadata_path)
+            elif os.path.exists(metadata_path):
+                os.remove(metadata_path)
+            codec_path, codes_path = os.path.join(self.path, "codec.npz"), os.path.join(self.path, "codes.npy")
+            if self.compression and self._ids:
+                vectors = np.asarray(self._vectors, dtype=np.float32)
+                self._codec = create_codec(self.compression).fit(vectors)
+                self._codes = self._codec.encode(vectors)
+                np.save(os.path.join(self.path, "codes.tmp.npy"), self._codes)
+                np.savez(os.path.join(self.path, "codec.tmp.npz"), name=self._codec.name, **self._codec.state())
+                os.replace(os.path.join(self.path, "codes.tmp.npy"), codes_path)
+                os.replace(os.path.join(self.path, "codec.tmp.npz"), codec_path)
+            else:
+                self._codec = self._codes = None
+                for stale in (codec_path, codes_path):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+            os.replace(os.path.join(self.path, "vectors.tmp.npy"), os.path.join(self.path, "vectors.npy"))
+            os.replace(os.path.join(self.path, "ids.tmp.json"), os.path.join(self.path, "ids.json"))
+            self._vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r")
+            logger.info(f"Saved local vector store to {self.path} ({len(self._ids)} vectors).")
+
+    def _snapshot(self):
+        # Take references under the lock, then search without it so concurrent queries don't serialize
+        with self._lock:
+            self._merge()
+            return self._ids, self._vectors, self._centroids, self._offsets, self._codec, self._codes, self._metadata
+
+    def query(self, vector, top_k: int = 20, exact: bool = False, n_probe: Optional[int] = None,
+              rerank_factor: Optional[int] = None, filters: Optional[Dict[str, List[str]]] = None) -> List[str]:
+        query = _normalize(vector)
+        ids, vectors, centroids, offsets, codec, codes, metadata = self._snapshot()
+        if not ids:
+            return []
+        mask = _filter_mask(metadata, filters, len(ids))
+        # Rows to score; None means all of them
+        rows = None if mask is None else np.flatnonzero(mask)
+        if centroids is not None and not exact:
+            probes = _top_k(centroids @ query, n_probe or self.probes(len(centroids)))
+            probed = np.concatenate([np.arange(offsets[p], offsets[p + 1]) for p in probes])
+            if rows is None:
+                rows = probed
+            elif len(rows) > len(probed):
+                # A broad filter is applied to the probed lists. A selective one keeps all its
+                # matches, which are fewer than a probe scan, and so does one that leaves
+                # fewer than top_k results in the probed lists.
+                matching = probed[mask[probed]]
+                rows = matching if len(matching) >= top_k else rows
+        if exact or codec is None:
+            if rows is None:
+                return [ids[row] for row in _top_k(vectors @ query, top_k)]
+            return [ids[rows[i]] for i in _top_k(vectors[rows] @ query, top_k)]
+
+        # Over-fetch on the codes, then re-rank the candidates with full-precision vectors
+        approx = codec.scores(codes if rows is None else codes[rows], query)
+        candidates = _top_k(approx, top_k * (rerank_factor or self.rerank_factor or codec.rerank_factor))
+        if rows is not None:
+            candidates = rows[candidates]
+        candidates = np.sort(candidates)
+        return [ids[candidates[i]] for i in _top_k(np.asarray(vectors[candidates]) @ query, top_k)]
+
+    def query_batch(self, vectors, top_k: int = 20, filters: Optional[Dict[str, List[str]]] = None) -> List[List[str]]:
+        """Scores every query against the (filtered) store in one matrix multiply.
+
+        Only exact search batches this way; with an IVF index or compressed codes each query
+        takes the usual `query` path, still within this one call.
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+        ids, stored, centroids, _, codec, _, metadata = self._snapshot()
+        if not ids or not len(queries):
+            return [[] for _ in queries]
+        if centroids is not None or codec is not None:
+            return [self.query(query, top_k=top_k, filters=filters) for query in queries]
+
+        mask = _filter_mask(metadata, filters, len(ids))
+        rows = None if mask is None else np.flatnonzero(mask)
+        candidates = stored if rows is None else stored[rows]
+        k = min(top_k, len(candidates))
+        if k == 0:
+            return [[] for _ in queries]
+        scores = np.asarray(candidates) @ queries.T
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=0), axis=0), axis=0)
+        if rows is not None:
+            top = rows[top]
+        return [[ids[row] for row in top[:, q]] for q in range(len(queries))]
+
+    def memory_per_vector(self) -> int:
+        """Bytes per vector scanned by the first pass (the float32 row when uncompressed)."""
+        dimension = self._vectors.shape[1] if self._vectors.ndim == 2 else 0
+        return self._codec.bytes_per_vector(dimension) if self._codec is not None else 4 * dimension
+
+    def evaluate(self, k: int = 10, n_queries: int = 200, seed: int = 0) -> Dict[str, float]:
+        """Reports latency/QPS for exact and approximate (IVF and/or compressed) search and recall@k of the latter.
+
+        Queries are stored vectors with a little noise, which is close to how real text/image
+        queries land near, but not exactly on, catalog items. Logs a warning when recall falls
+        below `recall_target`.
+        """
+        with self._lock:
+            self._merge()
+        if not self._ids:
+            return {}
+        rng = np.random.default_rng(seed)
+        picks = rng.choice(len(self._ids), min(n_queries, len(self._ids)), replace=False)
+        queries = _normalize(np.asarray(self._vectors[picks]) + rng.normal(0, 0.05, (len(picks), self._vectors.shape[1])))
+
+        def timed(**kwargs):
+            start = time.perf_counter()
+            results = [self.query(q, top_k=k, **kwargs) for q in queries]
+            return results, (time.perf_counter() - start) / len(queries) * 1000
+
+        def recall(results):
+            return float(np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(results, exact)]))
+
+        exact, exact_ms = timed(exact=True)
+        report = {"vectors": len(self._ids), "exact_ms": exact_ms, "exact_qps": 1000 / exact_ms,
+                  "bytes_per_vector": self.memory_per_vector()}
+        if self._centroids is not None or self._codec is not None:
+            approx, approx_ms = timed()
+            report.update({"approx_ms": approx_ms, "approx_qps": 1000 / approx_ms, f"recall@{k}": recall(approx)})
+            if self._centroids is not None:
+                report.update({"n_lists": len(self._centroids), "n_probe": self.probes(len(self._centroids))})
+            if self._codec is not None:
+                # Re-ranking only the top k shows how much the codes alone lose
+                first_pass, _ = timed(rerank_factor=1)
+                report.update({"compression": self._codec.name, "rerank_factor": self.rerank_factor or self._codec.rerank_factor,
+                               f"first_pass_recall@{k}": recall(first_pass)})
+            if report[f"recall@{k}"] < self.recall_target:
+                logger.warning(
+                    f"Approximate search recall@{k} is {report[f'recall@{k}']:.3f}, below the {self.recall_target} target. "
+                    f"Raise VECTOR_STORE_N_PROBE or VECTOR_STORE_PROBE_FRACTION"
+                    f"{' or VECTOR_STORE_RERANK_FACTOR' if self._codec is not None else ''}."
+                )
+        return report
+
+
+class LocalVectorDelta(LocalVectorStore):
+    """The upserts and deletes of one shard of a sharded indexing run.
+
+    Each shard process writes its own delta directory next to the real store, since they
+    can't all rewrite the same files; the coordinator then folds every delta into the
+    store with `merge_into` and saves it once. A delta always starts empty.
+    """
+
+    def __init__(self, path: str):
+        shutil.rmtree(path, ignore_errors=True)
+        # Never trains IVF or compresses: it is only read back once, sequentially
+        super().__init__(path, ivf_threshold=sys.maxsize)
+        self.deleted_ids = set()
+
+    @staticmethod
+    def shard_path(base: LocalVectorStore, index: int, count: int) -> str:
+        return os.path.join(base.path, "shards", f"shard-{index}-of-{count}")
+
+    @classmethod
+    def for_shard(cls, base: LocalVectorStore, index: int, count: int) -> "LocalVectorDelta":
+        return cls(cls.shard_path(base, index, count))
+
+    def delete(self, ids: List[str]):
+        super().delete(ids)
+        self.deleted_ids.update(str(article_id) for article_id in ids)
+
+    def save(self):
+        super().save()
+        with open(os.path.join(self.path, "deleted.json"), "w") as f:
+            json.dump(sorted(self.deleted_ids), f)
+
+    @staticmethod
+    def merge_into(path: str, target: LocalVectorStore, chunk_size: int = 10_000) -> int:
+        """Applies the delta saved at `path` to `target` (deletes first, then upserts); returns the upsert count."""
+        with open(os.path.join(path, "deleted.json")) as f:
+            target.delete(json.load(f))
+        delta = LocalVectorStore(path)
+        for start in range(0, len(delta), chunk_size):
+            ids = delta._ids[start:start + chunk_size]
+            vectors = np.asarray(delta._vectors[start:start + chunk_size])
+            metadata = delta._metadata_rows(start, start + chunk_size)
+            target.upsert([{"id": article_id, "values": vector, "metadata": meta}
+                           for article_id, vector, meta in zip(ids, vectors, metadata)])
+        return len(delta)
+
+
+def create_vector_store(backend: Optional[str] = None) -> VectorStore:
+    """Builds the backend named by VECTOR_STORE_BACKEND ('pinecone' or 'local')."""
+    backend = (backend or os.getenv("VECTOR_STORE_BACKEND", "pinecone")).lower()
+    if backend == "pinecone":
+        return PineconeVectorStore()
+    if backend == "local":
+        return LocalVectorStore(
+            os.getenv("VECTOR_STORE_PATH", "data/vector_store"),
+            ivf_threshold=int(os.getenv("VECTOR_STORE_IVF_THRESHOLD", "50000")),
+            n_probe=int(os.getenv("VECTOR_STORE_N_PROBE", "0")) or None,
+            probe_fraction=float(os.getenv("VECTOR_STORE_PROBE_FRACTION", "0.1")),
+            compression=os.getenv("VECTOR_STORE_COMPRESSION") or None,
+            rerank_factor=int(os.getenv("VECTOR_STORE_RERANK_FACTOR", "0")) or None,
+            recall_target=float(os.getenv("VECTOR_STORE_RECALL_TARGET", "0.9")),
+        )
+    raise ValueError(f"Unknown VECTOR_STORE_BACKEND '{backend}'. Expected 'pinecone' or 'local'.")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import `src.*` and `scripts.*` the way `python -m scripts.X` does, from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
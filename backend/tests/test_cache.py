@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from src.core.cache import IndexVersion, LRUCache, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("src.core.cache.time.monotonic", clock)
+    return clock
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 3, "misses": 1, "evictions": 1, "hit_rate": 0.75}
+
+
+def test_lru_with_zero_size_stores_nothing():
+    cache = LRUCache(0)
+    cache.put("a", 1)
+    assert len(cache) == 0 and cache.get("a", "missing") == "missing"
+
+
+def test_ttl_entries_expire(clock):
+    cache = TTLCache(4, ttl=10)
+    cache.put("a", 1)
+    clock.now += 9
+    assert cache.get("a") == 1
+    clock.now += 2
+    assert cache.get("a", "expired") == "expired"
+    assert len(cache) == 0
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+
+
+def test_ttl_put_refreshes_expiry(clock):
+    cache = TTLCache(4, ttl=10)
+    cache.put("a", 1)
+    clock.now += 8
+    cache.put("a", 2)
+    clock.now += 8
+    assert cache.get("a") == 2
+
+
+def test_ttl_concurrent_gets_and_puts_keep_counters_consistent(clock):
+    cache = TTLCache(8, ttl=1)
+
+    def worker(offset):
+        for i in range(2000):
+            key = (i + offset) % 16
+            if i % 3:
+                cache.get(key)
+            else:
+                cache.put(key, i)
+            if i % 500 == 0:
+                clock.now += 0.6
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    gets = sum(1 for i in range(2000) if i % 3) * 4
+    assert stats["hits"] + stats["misses"] == gets
+    assert len(cache) <= 8
+
+
+def test_index_version_rereads_after_interval(tmp_path, clock):
+    path = str(tmp_path / "index_version")
+    reader = IndexVersion(path, check_interval=5)
+    assert reader.current() is None
+    version = IndexVersion(path).publish()
+    assert reader.current() is None
+    clock.now += 5
+    assert reader.current() == version
@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.core.embedding_store import EmbeddingStore
+
+
+def vectors(n, dimension=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dimension)).astype(np.float32)
+
+
+def test_round_trip_across_reopen(tmp_path):
+    text, image = vectors(3), vectors(3, seed=1)
+    store = EmbeddingStore(str(tmp_path), "clip/ViT", 8)
+    store.put(["1", "2", "3"], text, image, ["a", "b", "c"])
+    store.close()
+
+    reader = EmbeddingStore(str(tmp_path), "clip/ViT", 8, readonly=True)
+    got_text, got_image, hits = reader.get(["3", "missing", "1"], ["c", "x", "a"])
+    assert hits.tolist() == [True, False, True]
+    np.testing.assert_array_equal(got_text[[0, 2]], text[[2, 0]])
+    np.testing.assert_array_equal(got_image[[0, 2]], image[[2, 0]])
+    assert not got_text[1].any()
+
+
+def test_other_version_misses_and_rewrite_wins(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "m", 8)
+    store.put(["1"], vectors(1), vectors(1), ["old"])
+    assert store.rows(["1"], ["new"]).tolist() == [-1]
+    fresh = vectors(1, seed=5)
+    store.put(["1"], fresh, fresh, ["new"])
+    text, _, hits = store.get(["1"], ["new"])
+    assert hits.all()
+    np.testing.assert_array_equal(text, fresh)
+    assert len(store) == 1
+
+
+def test_grows_past_initial_capacity(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "m", 4)
+    ids = [str(i) for i in range(3000)]
+    text = vectors(3000, 4)
+    store.put(ids, text, text, ["v"] * 3000)
+    store.close()
+    got, _, hits = EmbeddingStore(str(tmp_path), "m", 4).get(ids)
+    assert hits.all()
+    np.testing.assert_array_equal(got, text)
+
+
+def test_float16_store(tmp_path):
+    text = vectors(2)
+    store = EmbeddingStore(str(tmp_path), "m", 8, dtype="float16")
+    store.put(["1", "2"], text, text, ["v", "v"])
+    got, _, _ = store.get(["1", "2"])
+    assert got.dtype == np.float32
+    np.testing.assert_allclose(got, text, atol=1e-2)
+
+
+def test_torn_log_tail_is_ignored(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "m", 8)
+    store.put(["1"], vectors(1), vectors(1), ["v"])
+    store.close()
+    with open(os.path.join(store.path, "rows.log"), "a") as f:
+        f.write("2\tv")
+    reopened = EmbeddingStore(str(tmp_path), "m", 8)
+    assert "1" in reopened and "2" not in reopened
+
+
+def test_shape_mismatch_is_rejected(tmp_path):
+    EmbeddingStore(str(tmp_path), "m", 8).close()
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path), "m", 16)
+    with pytest.raises(FileNotFoundError):
+        EmbeddingStore(str(tmp_path), "other", 8, readonly=True)
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.core.image_cache import ImageCache, fingerprint, write_rows
+
+SIZE = 8
+
+
+def pixels(value, n=1):
+    return np.full((n, SIZE, SIZE, 3), value, dtype=np.uint8)
+
+
+def test_round_trip_and_version_check(tmp_path):
+    cache = ImageCache(str(tmp_path), size=SIZE)
+    cache.put(["1", "2"], np.concatenate([pixels(1), pixels(2)]), ["a", "b"])
+    cache.close()
+
+    reader = ImageCache(str(tmp_path), size=SIZE, readonly=True)
+    got, hits = reader.get(["2", "1", "3"], ["b", "other", "c"])
+    assert hits.tolist() == [True, False, False]
+    assert got[0].min() == got[0].max() == 2
+    # Without a source file to fingerprint, whatever is cached is used
+    got, hits = reader.get(["1"], [None])
+    assert hits.all() and got.max() == 1
+
+
+def test_replaced_rows_are_reused_after_reopen(tmp_path):
+    cache = ImageCache(str(tmp_path), size=SIZE)
+    cache.put(["1"], pixels(1), ["v1"])
+    cache.put(["1"], pixels(2), ["v2"])
+    assert cache.free_rows == 0
+    cache.close()
+
+    cache = ImageCache(str(tmp_path), size=SIZE)
+    assert cache.free_rows == 1
+    cache.put(["2"], pixels(3), ["v"])
+    assert cache.free_rows == 0
+    assert cache.rows(["1", "2"]).max() == 1
+    got, hits = cache.get(["1", "2"])
+    assert hits.all() and got[0].max() == 2 and got[1].max() == 3
+
+
+def test_stale_reader_never_sees_a_reused_row(tmp_path):
+    cache = ImageCache(str(tmp_path), size=SIZE)
+    cache.put(["1"], pixels(1), ["v1"])
+    cache.close()
+    reader = ImageCache(str(tmp_path), size=SIZE, readonly=True)
+
+    # Another process replaces the image, then a later run hands its old row to a new article
+    writer = ImageCache(str(tmp_path), size=SIZE)
+    writer.put(["1"], pixels(2), ["v2"])
+    writer.close()
+    writer = ImageCache(str(tmp_path), size=SIZE)
+    row = writer.reserve(1)
+    assert row == reader.rows(["1"]).tolist()
+    assert not reader.get(["1"], [None])[1].any()
+    writer._pixels[row] = pixels(9)
+    writer.flush()
+    writer.commit(["2"], row, ["v"])
+    got, hits = reader.get(["1"], [None])
+    assert not hits.any() and not got.any()
+
+
+def test_released_reservations_are_reused(tmp_path):
+    cache = ImageCache(str(tmp_path), size=SIZE)
+    rows = cache.reserve(3)
+    cache.release(rows[1:])
+    assert cache.free_rows == 2
+    assert cache.reserve(2) == rows[1:]
+
+
+def test_write_rows_fills_reserved_rows(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    path = str(images / "1.jpg")
+    Image.new("RGB", (20, 10), (200, 10, 10)).save(path)
+    cache = ImageCache(str(tmp_path / "cache"), size=SIZE)
+    rows = cache.reserve(2)
+    ok = write_rows(cache.path, SIZE, rows, [path, str(images / "missing.jpg")])
+    assert ok.tolist() == [True, False]
+    cache.commit(["1"], rows[:1], [fingerprint(path)])
+    cache.release(rows[1:])
+    got, hits = cache.get(["1"], [fingerprint(path)])
+    assert hits.all() and got.shape == (1, SIZE, SIZE, 3) and got[0, 0, 0, 0] > 150
+
+
+def test_caches_without_row_tags_are_tagged_by_a_writer(tmp_path):
+    cache = ImageCache(str(tmp_path), size=SIZE)
+    cache.put(["1"], pixels(1), ["v"])
+    cache.close()
+    os.remove(os.path.join(str(tmp_path), "owners.bin"))
+    assert ImageCache(str(tmp_path), size=SIZE, readonly=True).get(["1"])[1].all()
+    ImageCache(str(tmp_path), size=SIZE).close()
+    assert ImageCache(str(tmp_path), size=SIZE, readonly=True).get(["1"])[1].all()
+
+
+def test_size_mismatch_is_rejected(tmp_path):
+    ImageCache(str(tmp_path), size=SIZE).close()
+    with pytest.raises(ValueError):
+        ImageCache(str(tmp_path), size=SIZE * 2)
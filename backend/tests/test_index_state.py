@@ -0,0 +1,84 @@
+from scripts.batch_index import ProductRecord
+from scripts.index_state import IndexState, content_hash, embedding_hash
+
+
+def product(**overrides):
+    fields = dict(article_id="1", prod_name="Tee", cleaned_description="cotton tee", image_path=None,
+                  product_group_name="Garment Upper body", colour_group_name="Black", section_name="Men",
+                  created_at="2024-01-01")
+    fields.update(overrides)
+    return ProductRecord(**fields)
+
+
+def test_interrupted_run_resumes_from_checkpoint(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    state = IndexState(path)
+    state.begin_run()
+    state.commit_batch([("1", "h1"), ("2", "h2")], ("2024-01-02", "2"))
+    state.close()
+
+    state = IndexState(path)
+    assert state.run_in_progress()
+    assert state.checkpoint() == ("2024-01-02", "2")
+    assert state.get_hash("2") == "h2"
+    state.begin_run()
+    assert len(state) == 2
+    state.finish_run()
+    assert not state.run_in_progress() and state.checkpoint() is None
+
+
+def test_full_rebuild_resets_state(tmp_path):
+    state = IndexState(str(tmp_path / "state.sqlite"))
+    state.begin_run()
+    state.commit_batch([("1", "h1")], ("2024-01-01", "1"))
+    state.begin_run(reset=True)
+    assert len(state) == 0 and state.checkpoint() is None
+
+
+def test_find_and_remove_deleted_articles(tmp_path):
+    state = IndexState(str(tmp_path / "state.sqlite"))
+    state.commit_batch([("1", "h"), ("2", "h"), ("3", "h")], ("2024-01-01", "3"))
+    removed = state.find_removed(iter(["1", "3"]))
+    assert removed == ["2"]
+    state.remove(removed)
+    assert state.get_hash("2") is None and len(state) == 2
+
+
+def test_content_hash_tracks_indexed_fields_and_variant():
+    base = content_hash(product(), "clip")
+    assert content_hash(product(), "clip") == base
+    assert content_hash(product(colour_group_name="White"), "clip") != base
+    assert content_hash(product(), "clip-int8") != base
+
+
+def test_embedding_hash_ignores_metadata_only_edits():
+    base = embedding_hash(product(), "clip")
+    assert embedding_hash(product(prod_name="Renamed", section_name="Women"), "clip") == base
+    assert embedding_hash(product(cleaned_description="linen tee"), "clip") != base
+    assert embedding_hash(product(), "clip-int8") != base
+
+
+def test_shard_results_only_count_once_applied(tmp_path):
+    state = IndexState(str(tmp_path / "state.sqlite"))
+    state.begin_run()
+    state.commit_batch([("1", "old"), ("2", "old")], ("2024-01-01", "2"))
+    state.finish_run()
+
+    state.begin_run()
+    state.stage_pending([("1", "new"), ("3", "new")], ["2"])
+    assert state.run_in_progress()
+    assert (state.get_hash("1"), state.get_hash("2"), state.get_hash("3")) == ("old", "old", None)
+
+    state.apply_pending()
+    assert not state.run_in_progress()
+    assert (state.get_hash("1"), state.get_hash("2"), state.get_hash("3")) == ("new", None, "new")
+
+
+def test_failed_sharded_run_discards_what_it_staged(tmp_path):
+    state = IndexState(str(tmp_path / "state.sqlite"))
+    state.begin_run()
+    state.stage_pending([("1", "h")], [])
+    # The coordinator never applied it; the retry starts clean
+    state.begin_run()
+    state.apply_pending()
+    assert len(state) == 0
@@ -0,0 +1,130 @@
+import pytest
+from psycopg2 import sql
+
+from scripts.ingest_data import PostgresIngestor
+
+COLUMNS = ["article_id", "prod_name", "image_path"]
+
+
+def render(query) -> str:
+    """psycopg2 only renders composed SQL against a live connection, so spell it out here."""
+    if isinstance(query, sql.Composed):
+        return "".join(render(part) for part in query.seq)
+    if isinstance(query, sql.Identifier):
+        return ".".join(f'"{name}"' for name in query.strings)
+    if isinstance(query, sql.SQL):
+        return query.string
+    return str(query)
+
+
+class FakeCursor:
+    rowcount = 0
+
+    def __init__(self, fail_on=None):
+        self.statements = []
+        self.fail_on = fail_on
+        self.closed = False
+
+    def execute(self, query, params=None):
+        statement = render(query)
+        if self.fail_on and self.fail_on in statement:
+            raise RuntimeError(f"failed: {statement}")
+        self.statements.append(statement)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, fail_on=None):
+        self.cursor_ = FakeCursor(fail_on)
+        self.committed = self.rolled_back = False
+
+    def cursor(self):
+        return self.cursor_
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def ingestor(tmp_path, monkeypatch):
+    for name in ("DB_HOST", "DB_PORT", "DB_NAME", "DB_USER", "DB_PASSWORD"):
+        monkeypatch.setenv(name, "x")
+    path = tmp_path / "products.csv"
+    path.write_text(",".join(COLUMNS) + "\n1,Tee,images/1.jpg\n2,Top,images/2.jpg\n")
+    ingestor = PostgresIngestor(str(path), "products")
+    ingestor.copied = []
+
+    def copy(cursor, f, table, columns):
+        rows = f.read().splitlines()
+        ingestor.copied.append((table, list(columns), rows))
+        cursor.statements.append(f"COPY {table}")
+        return len(rows)
+
+    monkeypatch.setattr(ingestor, "_copy", copy)
+    return ingestor
+
+
+def run(ingestor, monkeypatch, connection=None, **kwargs):
+    connection = connection or FakeConnection()
+    monkeypatch.setattr(ingestor, "_create_connection", lambda: connection)
+    ingestor.ingest(**kwargs)
+    return connection
+
+
+def test_upsert_merges_through_a_staging_table(ingestor, monkeypatch):
+    connection = run(ingestor, monkeypatch, mode="upsert")
+    statements = connection.cursor_.statements
+    assert statements[:3] == [
+        'DROP TABLE IF EXISTS "products_staging"',
+        'CREATE UNLOGGED TABLE "products_staging" (LIKE "products" INCLUDING DEFAULTS)',
+        "COPY products_staging",
+    ]
+    assert ingestor.copied == [("products_staging", COLUMNS, ["1,Tee,images/1.jpg", "2,Top,images/2.jpg"])]
+    merge = statements[3]
+    assert merge.startswith('INSERT INTO "products" AS t ("article_id", "prod_name", "image_path") '
+                            'SELECT "article_id", "prod_name", "image_path" FROM "products_staging" ')
+    assert 'ON CONFLICT (article_id) DO UPDATE SET "prod_name" = EXCLUDED."prod_name", "image_path" = EXCLUDED."image_path"' in merge
+    # Unchanged rows aren't rewritten, and created_at (not in the CSV) keeps its original value
+    assert merge.endswith('WHERE (t."prod_name", t."image_path") IS DISTINCT FROM (EXCLUDED."prod_name", EXCLUDED."image_path")')
+    assert "created_at" not in merge
+    assert statements[4].startswith('DELETE FROM "products" t WHERE NOT EXISTS')
+    assert statements[5] == 'DROP TABLE "products_staging"'
+    assert not any("TRUNCATE" in statement for statement in statements)
+    assert connection.committed and connection.cursor_.closed
+
+
+def test_upsert_without_prune_keeps_missing_rows(ingestor, monkeypatch):
+    statements = run(ingestor, monkeypatch, mode="upsert", prune=False).cursor_.statements
+    assert not any(statement.startswith("DELETE") for statement in statements)
+    assert statements[-1] == 'DROP TABLE "products_staging"'
+
+
+def test_upsert_of_ids_only_inserts_new_rows(ingestor, monkeypatch, tmp_path):
+    (tmp_path / "products.csv").write_text("article_id\n1\n")
+    merge = run(ingestor, monkeypatch, mode="upsert").cursor_.statements[3]
+    assert merge.endswith("ON CONFLICT (article_id) DO NOTHING")
+
+
+def test_replace_truncates_then_copies(ingestor, monkeypatch):
+    statements = run(ingestor, monkeypatch, mode="replace").cursor_.statements
+    assert statements == ['TRUNCATE TABLE "products" RESTART IDENTITY CASCADE', "COPY products"]
+
+
+def test_failed_merge_rolls_back(ingestor, monkeypatch):
+    connection = FakeConnection(fail_on="INSERT INTO")
+    with pytest.raises(RuntimeError):
+        run(ingestor, monkeypatch, connection=connection, mode="upsert")
+    assert connection.rolled_back and not connection.committed
+
+
+def test_unknown_mode_is_rejected(ingestor):
+    with pytest.raises(ValueError):
+        ingestor.ingest(mode="merge")
@@ -0,0 +1,34 @@
+import random
+
+import pytest
+
+from src.api.main import batch_reciprocal_rank_fusion, reciprocal_rank_fusion
+
+
+def random_batch(rng: random.Random):
+    batch = []
+    for _ in range(rng.randint(1, 6)):
+        # Small id pools so the text and vector lists overlap and scores tie
+        batch.append([list(dict.fromkeys(str(rng.randint(0, 20)) for _ in range(rng.randint(0, 12))))
+                      for _ in range(2)])
+    return batch
+
+
+@pytest.mark.parametrize("top_k", [None, 3, 10])
+def test_batch_matches_single_query_fusion(top_k):
+    rng = random.Random(top_k or 0)
+    for _ in range(300):
+        batch = random_batch(rng)
+        assert batch_reciprocal_rank_fusion(batch, top_k=top_k) == [reciprocal_rank_fusion(lists)[:top_k] for lists in batch]
+
+
+def test_ties_keep_first_appearance_order():
+    # "b" and "c" score the same; the single-query version keeps the one it saw first
+    batch = [[["a", "b"], ["a", "c"]], [["c", "b"], []]]
+    assert batch_reciprocal_rank_fusion(batch) == [["a", "b", "c"], ["c", "b"]]
+    assert batch_reciprocal_rank_fusion(batch) == [reciprocal_rank_fusion(lists) for lists in batch]
+
+
+def test_empty_queries():
+    assert batch_reciprocal_rank_fusion([[[], []], [["a"], []]]) == [[], ["a"]]
+    assert batch_reciprocal_rank_fusion([]) == []
@@ -0,0 +1,131 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from scripts.benchmark import Backends, benchmark_indexer, catalog_rows
+from scripts.benchmark_fakes import TinyEmbedder
+from scripts.synthetic_catalog import generate_catalog, load_catalog
+from src.api import main
+
+
+@pytest.fixture(scope="module")
+def catalog(tmp_path_factory):
+    """A small synthetic catalog indexed into the benchmark's in-process backends."""
+    workdir = str(tmp_path_factory.mktemp("search_api"))
+    df = load_catalog(generate_catalog(os.path.join(workdir, "catalog"), 150, image_size=32, seed=0))
+    args = SimpleNamespace(pg_latency_ms=0, es_latency_ms=0, vector_latency_ms=0, jitter_ms=0, compression=None,
+                           batch_size=32, pipeline=False, decode_workers=1, image_cache=None)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("INDEX_VERSION_PATH", os.path.join(workdir, "index_version"))
+        backends = Backends(catalog_rows(df), workdir, args)
+        embedder = TinyEmbedder()
+        benchmark_indexer(backends, embedder, workdir, args)
+        yield df, backends, embedder
+
+
+@pytest.fixture(scope="module")
+def client(catalog):
+    _, backends, embedder = catalog
+
+    def connect_fakes():
+        main.vector_store, main.es_client, main.pg_pool = backends.vectors, backends.es, backends.pg
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(main, "load_embedder", lambda: embedder)
+        patch.setattr(main, "connect_backends", connect_fakes)
+        with TestClient(main.app) as client:
+            yield client
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    for cache in (main.embedding_cache, main.result_cache, main.product_cache):
+        cache.clear()
+
+
+def search(client, **data):
+    response = client.post("/search/", data=data)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def batch(client, queries, images=None, top_k=5):
+    files = [("images", (f"{i}.jpg", data, "image/jpeg")) for i, data in enumerate(images or [])]
+    return client.post("/search/batch", data={"queries": json.dumps(queries), "top_k": str(top_k)}, files=files or None)
+
+
+def ids(products):
+    return [product["article_id"] for product in products]
+
+
+def test_filters_apply_to_every_result(client, catalog):
+    df, _, _ = catalog
+    group, colour = df.product_group_name.iloc[0], df.colour_group_name.iloc[1]
+    body = search(client, text_query="cotton", top_k="20", product_group_name=group, colour_group_name=[colour, "Nope"])
+    assert body["results"]
+    matches = df.set_index("article_id").loc[ids(body["results"])]
+    assert set(matches.product_group_name) == {group} and set(matches.colour_group_name) == {colour}
+    assert "facets" not in body
+
+
+def test_facets_count_the_filtered_matches(client, catalog):
+    df, _, _ = catalog
+    section = df.section_name.iloc[0]
+    body = search(client, text_query="dress", top_k="5", section_name=section, facets="true")
+    assert set(body["facets"]) == set(main.FACET_FIELDS)
+    assert [bucket["value"] for bucket in body["facets"]["section_name"]] == [section]
+    counts = body["facets"]["colour_group_name"]
+    assert counts == sorted(counts, key=lambda bucket: -bucket["count"])
+    # A repeat comes from the result cache and must look the same
+    assert search(client, text_query="dress", top_k="5", section_name=section, facets="true") == body
+
+
+def test_image_only_search_can_still_facet(client, catalog):
+    df, _, _ = catalog
+    with open(df.image_path.iloc[3], "rb") as f:
+        image = f.read()
+    response = client.post("/search/", data={"top_k": "5", "facets": "1"},
+                           files={"image_query": ("q.jpg", image, "image/jpeg")})
+    body = response.json()
+    assert response.status_code == 200 and len(body["results"]) == 5
+    assert sum(bucket["count"] for bucket in body["facets"]["section_name"]) == len(df)
+
+
+def test_search_needs_a_query(client):
+    assert client.post("/search/", data={"top_k": "5"}).status_code == 400
+
+
+def test_batch_streams_one_line_per_query_matching_single_search(client, catalog):
+    df, _, _ = catalog
+    with open(df.image_path.iloc[0], "rb") as f:
+        image = f.read()
+    texts = ["red dress", "blue jeans", "black shoes"]
+    queries = [{"text": text} for text in texts * 20] + [{"image": 0}, {"text": "linen", "image": 0}]
+    response = batch(client, queries, images=[image])
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == list(range(len(queries)))
+    by_index = {line["index"]: line for line in lines}
+
+    main.result_cache.clear()
+    for index, text in enumerate(texts):
+        assert ids(by_index[index]["results"]) == ids(search(client, text_query=text, top_k="5")["results"])
+    image_only = client.post("/search/", data={"top_k": "5"}, files={"image_query": ("q.jpg", image, "image/jpeg")})
+    assert ids(by_index[len(queries) - 2]["results"]) == ids(image_only.json()["results"])
+
+
+def test_batch_reports_a_corrupt_image_on_its_line(client):
+    lines = [json.loads(line) for line in batch(client, [{"text": "dress"}, {"image": 0}], images=[b"not a jpeg"]).text.splitlines()]
+    by_index = {line["index"]: line for line in lines}
+    assert len(by_index[0]["results"]) == 5
+    assert "error" in by_index[1]
+
+
+@pytest.mark.parametrize("queries", [[], [{"image": 1}], [{}], "not json", [{"text": 3}]])
+def test_batch_rejects_invalid_queries(client, queries):
+    data = {"queries": queries if isinstance(queries, str) else json.dumps(queries)}
+    assert client.post("/search/batch", data=data).status_code == 400
@@ -0,0 +1,131 @@
+import logging
+
+import numpy as np
+import pytest
+
+from src.core.vector_store import LocalVectorDelta, LocalVectorStore
+
+COLOURS = ["Black", "White", "Red"]
+
+
+def catalog(n=2000, dimension=64, clusters=20, seed=0):
+    """Unit vectors scattered around a few centres, like embeddings of similar products."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension))
+    vectors = centres[rng.integers(clusters, size=n)] + 0.3 * rng.standard_normal((n, dimension))
+    return [{"id": str(i), "values": vector.astype(np.float32),
+             "metadata": {"colour_group_name": COLOURS[i % 3], "section_name": "Men" if i % 2 else ""}}
+            for i, vector in enumerate(vectors)]
+
+
+def build(path, records, **kwargs):
+    store = LocalVectorStore(str(path), **kwargs)
+    store.upsert(records)
+    store.save()
+    return store
+
+
+def test_exact_search_survives_save_and_load(tmp_path):
+    records = catalog(200)
+    build(tmp_path, records)
+    store = LocalVectorStore(str(tmp_path))
+    assert len(store) == 200
+    for record in records[:20]:
+        assert store.query(record["values"], top_k=5)[0] == record["id"]
+
+
+def test_upserts_and_deletes_after_load(tmp_path):
+    records = catalog(100)
+    build(tmp_path, records)
+    store = LocalVectorStore(str(tmp_path))
+    store.delete(["0"])
+    store.upsert([{"id": "1", "values": records[2]["values"]}])
+    assert "0" not in store.query(records[0]["values"], top_k=100)
+    assert set(store.query(records[2]["values"], top_k=2)) == {"1", "2"}
+    store.save()
+    reopened = LocalVectorStore(str(tmp_path))
+    assert len(reopened) == 99 and "0" not in reopened.query(records[0]["values"], top_k=100)
+
+
+def test_filters_survive_save_and_load(tmp_path):
+    records = catalog(300)
+    build(tmp_path, records)
+    store = LocalVectorStore(str(tmp_path))
+    by_id = {record["id"]: record["metadata"] for record in records}
+    results = store.query(records[0]["values"], top_k=50, filters={"colour_group_name": ["Red", "White"], "section_name": ["Men"]})
+    assert len(results) == 50
+    assert all(by_id[i]["colour_group_name"] in ("Red", "White") and by_id[i]["section_name"] == "Men" for i in results)
+    assert store.query(records[0]["values"], filters={"colour_group_name": ["Blue"]}) == []
+    assert store.query(records[0]["values"], filters={"unknown_field": ["x"]}) == []
+
+
+def test_query_batch_matches_query(tmp_path):
+    records = catalog(300)
+    store = build(tmp_path, records)
+    queries = np.stack([record["values"] for record in records[:10]])
+    for filters in (None, {"colour_group_name": ["Black"]}):
+        assert store.query_batch(queries, top_k=10, filters=filters) == [
+            store.query(query, top_k=10, filters=filters) for query in queries
+        ]
+
+
+def test_ivf_index_is_saved_and_keeps_recall(tmp_path):
+    records = catalog()
+    build(tmp_path, records, ivf_threshold=1000)
+    store = LocalVectorStore(str(tmp_path), ivf_threshold=1000)
+    assert store._centroids is not None
+    n_lists = len(store._centroids)
+    assert store.probes(n_lists) == max(8, int(np.ceil(0.1 * n_lists)))
+    assert LocalVectorStore(str(tmp_path), n_probe=3).probes(n_lists) == 3
+    report = store.evaluate(k=10, n_queries=100)
+    assert report["recall@10"] >= 0.95 and report["n_lists"] == n_lists
+
+
+def test_selective_filter_on_ivf_keeps_every_match(tmp_path):
+    records = catalog()
+    records[5]["metadata"]["colour_group_name"] = "Rare"
+    store = build(tmp_path, records, ivf_threshold=1000, n_probe=1)
+    assert store.query(records[1500]["values"], filters={"colour_group_name": ["Rare"]}) == ["5"]
+
+
+@pytest.mark.parametrize("compression", ["int8", "pq"])
+def test_compressed_codes_are_saved_and_reranked(tmp_path, compression):
+    records = catalog()
+    build(tmp_path, records, compression=compression)
+    store = LocalVectorStore(str(tmp_path), compression=compression)
+    assert store._codec is not None and store._codec.name == compression
+    assert store.memory_per_vector() < 4 * 64
+    report = store.evaluate(k=10, n_queries=100)
+    assert report["recall@10"] >= 0.9
+    assert report["rerank_factor"] == store._codec.rerank_factor
+
+
+def test_codes_of_another_codec_are_not_used(tmp_path):
+    build(tmp_path, catalog(300), compression="int8")
+    assert LocalVectorStore(str(tmp_path), compression="pq")._codec is None
+
+
+def test_unknown_compression_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LocalVectorStore(str(tmp_path), compression="float16")
+
+
+def test_evaluate_warns_below_recall_target(tmp_path, caplog):
+    store = build(tmp_path, catalog(), ivf_threshold=1000, n_probe=1, recall_target=1.01)
+    with caplog.at_level(logging.WARNING, logger="src.core.vector_store"):
+        store.evaluate(k=10, n_queries=20)
+    assert "below the 1.01 target" in caplog.text
+
+
+def test_shard_deltas_merge_into_the_store(tmp_path):
+    records = catalog(100)
+    base = build(tmp_path / "store", records[:50])
+    delta = LocalVectorDelta.for_shard(base, 0, 2)
+    delta.upsert(records[50:])
+    delta.delete(["0"])
+    delta.save()
+    assert LocalVectorDelta.merge_into(LocalVectorDelta.shard_path(base, 0, 2), base) == 50
+    base.save()
+    reopened = LocalVectorStore(str(tmp_path / "store"))
+    assert len(reopened) == 99
+    assert reopened.query(records[75]["values"], top_k=1) == ["75"]